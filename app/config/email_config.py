@@ -1,5 +1,9 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+HOSTEL_INFO_PATH = Path(__file__).with_name('hostel_info.yaml')
 
 class EmailSettings(BaseSettings):
     EMAIL_HOST: str
@@ -7,10 +11,26 @@ class EmailSettings(BaseSettings):
     EMAIL_PASSWORD: str
     IMAP_PORT: int = 993
     SMTP_PORT: int = 587
+    # Only ever false against a local replay server (see services/traffic_replay.py)
+    MAIL_TLS: bool = True
 
     class Config:
         env_file = ".env"
 
+@lru_cache()
+def load_environment() -> None:
+    """Load .env into os.environ once, on first use rather than at import time."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
 @lru_cache()
 def get_email_settings() -> EmailSettings:
-    return EmailSettings() 
\ No newline at end of file
+    load_environment()
+    return EmailSettings()
+
+@lru_cache()
+def get_hostel_info() -> Dict:
+    """Parse hostel_info.yaml once, independent of the working directory."""
+    import yaml
+    with open(HOSTEL_INFO_PATH, 'r') as file:
+        return yaml.safe_load(file)
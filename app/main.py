@@ -0,0 +1,7 @@
+from fastapi import FastAPI
+from app.routers.admin_routes import router as admin_router
+from app.routers.email_routes import email_client_lifespan, router as email_router
+
+app = FastAPI(title="Mail Agent", lifespan=email_client_lifespan)
+app.include_router(email_router)
+app.include_router(admin_router)
@@ -0,0 +1,34 @@
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Dict, Optional
+from app.schemas.admin_schemas import ProfilingSettings
+from app.services.imap_transport import get_transport_stats
+from app.services.profiling import get_profiler
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Admin routes are off unless ADMIN_TOKEN is set, and then require it."""
+    token = os.getenv('ADMIN_TOKEN')
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token != token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.get("/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling(limit: int = 20) -> Dict:
+    """Profiler settings and the most recent capture summaries (this process only)."""
+    profiler = get_profiler()
+    return {**profiler.status(), "recent": list(profiler.recent)[-limit:]}
+
+@router.post("/profiling", dependencies=[Depends(require_admin)])
+async def configure_profiling(settings: ProfilingSettings) -> Dict:
+    """Turn sampled cProfile/tracemalloc capture on or off and adjust thresholds."""
+    if settings.sample_rate is not None and not 0 <= settings.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    return get_profiler().configure(**settings.model_dump())
+
+@router.get("/imap", dependencies=[Depends(require_admin)])
+async def get_imap_stats() -> Dict:
+    """IMAP bytes on the wire vs. payload, compression ratios and LITERAL+ use (this process only)."""
+    return get_transport_stats().summary()
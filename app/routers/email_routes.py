@@ -1,14 +1,142 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict
-from app.services.email_client import fetch_latest_emails, EmailClientError
+from contextlib import asynccontextmanager
+import json
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Dict, Literal, Optional
+from app.services.email_client import EmailClient, EmailClientError, InvalidCursorError, StaleCursorError
+from app.schemas.email_schemas import (
+    EmailCategory, FolderInfo, MessagePage, ReviewAction, ReviewActionResult, ReviewPage, SearchResult
+)
 
 router = APIRouter(prefix="/email", tags=["email"])
 
+@asynccontextmanager
+async def email_client_lifespan(app: FastAPI):
+    """Share one EmailClient (and its read connection) for the app's lifetime."""
+    app.state.email_client = EmailClient()
+    try:
+        yield
+    finally:
+        await app.state.email_client.close()
+
+def get_email_client(request: Request) -> EmailClient:
+    return request.app.state.email_client
+
+def _to_http_error(error: EmailClientError) -> HTTPException:
+    if isinstance(error, StaleCursorError):
+        return HTTPException(status_code=409, detail=str(error))
+    if isinstance(error, InvalidCursorError):
+        return HTTPException(status_code=400, detail=str(error))
+    return HTTPException(status_code=502, detail=str(error))
+
+async def _stream_messages(messages: AsyncIterator[Dict], fmt: str) -> AsyncIterator[str]:
+    try:
+        async for message in messages:
+            line = json.dumps(message)
+            yield f"data: {line}\n\n" if fmt == "sse" else f"{line}\n"
+    except EmailClientError as e:
+        error = json.dumps({"error": str(e)})
+        yield f"event: error\ndata: {error}\n\n" if fmt == "sse" else f"{error}\n"
+
+def _streaming_response(messages: AsyncIterator[Dict], fmt: str) -> StreamingResponse:
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_messages(messages, fmt), media_type=media_type)
+
 @router.get("/test", response_model=List[Dict])
-async def test_email_connection():
+async def test_email_connection(client: EmailClient = Depends(get_email_client)):
     """Test endpoint to verify email connection and fetch latest emails."""
     try:
-        emails = await fetch_latest_emails(limit=3)
-        return emails
+        page = await client.list_messages("INBOX", limit=3)
+        return page['messages']
+    except EmailClientError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/folders", response_model=List[FolderInfo])
+async def list_folders(client: EmailClient = Depends(get_email_client)):
+    """List mailbox folders."""
+    try:
+        return await client.list_folders()
+    except EmailClientError as e:
+        raise _to_http_error(e)
+
+@router.get("/messages", response_model=MessagePage)
+async def list_messages(folder: str = "INBOX",
+                        cursor: Optional[str] = None,
+                        limit: int = Query(50, ge=1, le=500),
+                        client: EmailClient = Depends(get_email_client)):
+    """Page through a folder newest first using UID cursors (headers only)."""
+    try:
+        return await client.list_messages(folder, cursor=cursor, limit=limit)
+    except EmailClientError as e:
+        raise _to_http_error(e)
+
+@router.get("/messages/stream")
+async def stream_messages(folder: str = "INBOX",
+                          cursor: Optional[str] = None,
+                          limit: Optional[int] = Query(None, ge=1),
+                          format: Literal["ndjson", "sse"] = "ndjson",
+                          client: EmailClient = Depends(get_email_client)):
+    """Stream header summaries of a folder as NDJSON or server-sent events."""
+    try:
+        # A bad cursor is a 400 before the 200 streaming response starts
+        client.parse_cursor(cursor)
     except EmailClientError as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise _to_http_error(e)
+    return _streaming_response(client.iter_messages(folder, cursor=cursor, limit=limit), format)
+
+@router.get("/requires-human", response_model=ReviewPage)
+async def list_requires_human(cursor: Optional[str] = None,
+                              limit: int = Query(50, ge=1, le=500),
+                              client: EmailClient = Depends(get_email_client)):
+    """Page through the Requires_Human review queue with flags, reasons and assignees."""
+    try:
+        return await client.list_review_queue(cursor=cursor, limit=limit)
+    except EmailClientError as e:
+        raise _to_http_error(e)
+
+@router.post("/requires-human/complete", response_model=ReviewActionResult)
+async def complete_requires_human(action: ReviewAction, client: EmailClient = Depends(get_email_client)):
+    """Mark review items handled and move them to Completed in one batch."""
+    try:
+        return await client.complete_reviews(action.uids)
+    except EmailClientError as e:
+        raise _to_http_error(e)
+
+@router.post("/requires-human/reassign", response_model=ReviewActionResult)
+async def reassign_requires_human(action: ReviewAction, client: EmailClient = Depends(get_email_client)):
+    """Assign review items to a staff member."""
+    try:
+        return await client.reassign_reviews(action.uids, action.staff or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EmailClientError as e:
+        raise _to_http_error(e)
+
+@router.post("/requires-human/release", response_model=ReviewActionResult)
+async def release_requires_human(action: ReviewAction, client: EmailClient = Depends(get_email_client)):
+    """Unassign review items so anyone can pick them up."""
+    try:
+        return await client.release_reviews(action.uids)
+    except EmailClientError as e:
+        raise _to_http_error(e)
+
+@router.get("/requires-human/stream")
+async def stream_requires_human(cursor: Optional[str] = None,
+                                limit: Optional[int] = Query(None, ge=1),
+                                format: Literal["ndjson", "sse"] = "ndjson",
+                                client: EmailClient = Depends(get_email_client)):
+    """Stream the Requires_Human review queue as NDJSON or server-sent events."""
+    try:
+        client.parse_cursor(cursor)
+        folder = await client.ai_folder("Requires_Human")
+    except EmailClientError as e:
+        raise _to_http_error(e)
+    return _streaming_response(client.iter_messages(folder, cursor=cursor, limit=limit), format)
+
+@router.get("/search", response_model=List[SearchResult])
+def search_mail(q: str = Query(..., min_length=1),
+                category: Optional[EmailCategory] = None,
+                limit: int = Query(20, ge=1, le=200),
+                client: EmailClient = Depends(get_email_client)):
+    """Search filed mail by guest, booking number or keyword (local index, no IMAP)."""
+    return client.search_mail(q, category=category.value if category else None, limit=limit)
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class ProfilingSettings(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None
+    slow_ms: Optional[float] = None
+    trace_memory: Optional[bool] = None
+    top_n: Optional[int] = None
@@ -1,14 +1,66 @@
 from enum import Enum
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class EmailCategory(str, Enum):
     LEGITIMATE = "legitimate"
     SPAM = "spam"
     NEWSLETTER = "newsletter"
     REQUIRES_HUMAN = "requires_human"
+    AUTOMATED = "automated"
 
 class EmailClassification(BaseModel):
     category: EmailCategory
     confidence: float
-    reason: Optional[str] = None 
\ No newline at end of file
+    reason: Optional[str] = None 
+
+class FolderInfo(BaseModel):
+    name: str
+    delimiter: Optional[str] = None
+    flags: List[str] = []
+
+class MessageSummary(BaseModel):
+    uid: int
+    folder: str
+    subject: str = ""
+    sender: str = ""
+    to: str = ""
+    date: str = ""
+    message_id: str = ""
+    in_reply_to: str = ""
+    flags: List[str] = []
+    size: Optional[int] = None
+
+class MessagePage(BaseModel):
+    folder: str
+    uidvalidity: Optional[int] = None
+    messages: List[MessageSummary]
+    next_cursor: Optional[str] = None
+
+class ReviewItem(MessageSummary):
+    reason: str = ""
+    assignee: Optional[str] = None
+    handled: bool = False
+
+class ReviewPage(MessagePage):
+    messages: List[ReviewItem]
+
+class ReviewAction(BaseModel):
+    uids: List[int]
+    staff: Optional[str] = None
+
+class ReviewActionResult(BaseModel):
+    action: str
+    uids: List[int]
+    not_found: List[int] = []
+
+class SearchResult(BaseModel):
+    subject: str = ""
+    sender: str = ""
+    category: str
+    message_id: str = ""
+    folder: str
+    date: str = ""
+    filed_at: float
+    snippet: str = ""
+    score: float
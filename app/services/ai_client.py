@@ -1,29 +1,145 @@
-from typing import Dict, Optional
-from openai import OpenAI
-from pydantic import BaseModel
-import yaml
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, ValidationError
 import os
-from dotenv import load_dotenv
+import re
+import json
+import time
+import asyncio
 
-load_dotenv()
+from app.schemas.email_schemas import EmailCategory, EmailClassification
+from app.services.model_router import (
+    FAST_TIER, LARGE_TIER, ModelTier, RoutingDecision, RoutingStats,
+    choose_initial_tier, estimate_cost, get_model_tiers, should_escalate
+)
+from app.services.traffic_recorder import get_traffic_recorder
+
+STRUCTURED_REPLY_INSTRUCTIONS = """Return only a JSON object of the form
+            {"reply": "<the email reply>", "confidence": <0.0-1.0>}
+            where confidence is how sure you are that the reply is accurate and
+            complete using only the hostel information provided."""
+
+CLASSIFY_TIER = "classify"
+
+class AIGenerationTimeout(Exception):
+    """Raised when a completion misses its first-token or total deadline."""
+
+def get_request_deadline() -> float:
+    return float(os.getenv('LLM_REQUEST_DEADLINE', 60))
+
+def get_first_token_deadline() -> float:
+    return float(os.getenv('LLM_FIRST_TOKEN_DEADLINE', 15))
+
+def is_speculation_enabled() -> bool:
+    """Start reply generation while the final classification runs (opt-in)."""
+    return os.getenv('SPECULATIVE_REPLIES', 'false').lower() in ('1', 'true', 'yes')
 
 class AIResponse(BaseModel):
     content: str
     confidence: float
     requires_review: bool
+    model: Optional[str] = None
+    routing: Optional[RoutingDecision] = None
+
+def parse_structured_reply(raw_content: str) -> Tuple[str, Optional[float]]:
+    """Extract the reply and self-assessed confidence from a structured completion."""
+    text = (raw_content or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[4:].strip() if text.startswith("json") else text.strip()
+    try:
+        data = json.loads(text)
+        confidence = data.get('confidence')
+        confidence = min(max(float(confidence), 0.0), 1.0) if confidence is not None else None
+        return str(data['reply']), confidence
+    except (ValueError, KeyError, TypeError, AttributeError):
+        # Model ignored the format; treat the raw text as the reply
+        return raw_content or "", None
+
+def parse_classification_batch(raw_content: str, count: int) -> List[Optional[EmailClassification]]:
+    """Validate a batched classification completion, one entry per input item.
+
+    Expects {"items": [{"id": n, "category": ..., "confidence": ..., "reason": ...}]};
+    missing, duplicate or invalid items come back as None.
+    """
+    results: List[Optional[EmailClassification]] = [None] * count
+    try:
+        items = json.loads(raw_content or "")['items']
+    except (ValueError, KeyError, TypeError):
+        return results
+    for item in items if isinstance(items, list) else []:
+        try:
+            index = int(item['id'])
+            classification = EmailClassification(
+                category=item['category'], confidence=float(item['confidence']),
+                reason=f"LLM: {item.get('reason') or item['category']}"
+            )
+        except (KeyError, TypeError, ValueError, ValidationError):
+            continue
+        if 0 <= index < count and results[index] is None and 0.0 <= classification.confidence <= 1.0:
+            results[index] = classification
+    return results
+
+def build_ai_response(content: str, self_confidence: Optional[float], model: Optional[str],
+                      routing: Optional[RoutingDecision] = None) -> AIResponse:
+    """Turn a parsed reply into an AIResponse, preferring the model's self-assessment."""
+    confidence = 0.9 if self_confidence is None else self_confidence
+    requires_review = confidence < 0.7
+    
+    # Fall back to phrase checks for hedged replies
+    lowered = content.lower()
+    if "i'm not sure" in lowered or "i would need to confirm" in lowered:
+        requires_review = True
+        confidence = min(confidence, 0.6)
+    
+    return AIResponse(
+        content=content,
+        confidence=confidence,
+        requires_review=requires_review,
+        model=model,
+        routing=routing
+    )
 
 class AIClient:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        from app.config.email_config import load_environment
+        load_environment()
         self.model = os.getenv('OPENAI_MODEL', 'gpt-4')
+        self.tiers = get_model_tiers()
+        self.routing_stats = RoutingStats()
         self.temperature = float(os.getenv('OPENAI_TEMPERATURE', 0.7))
-        
-        # Load hostel information
-        with open('app/config/hostel_info.yaml', 'r') as file:
-            self.hostel_info = yaml.safe_load(file)
+        self._client = None
+        self._system_prompt: Optional[str] = None
+        # Optional shared LLM request budget (see rate_limiter.SharedRateLimiter)
+        self.rate_limiter = None
+    
+    @property
+    def client(self):
+        """OpenAI client, created (and openai imported) on first use.
+
+        With LLM_REPLAY_PATH set, completions are played back from a
+        traffic recording instead (see traffic_replay.ReplayLLMClient).
+        """
+        if self._client is None and os.getenv('LLM_REPLAY_PATH'):
+            from app.services.traffic_replay import ReplayLLMClient
+            self._client = ReplayLLMClient.from_recording(os.environ['LLM_REPLAY_PATH'])
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._client
+    
+    @property
+    def hostel_info(self) -> Dict:
+        from app.config.email_config import get_hostel_info
+        return get_hostel_info()
     
     def _create_system_prompt(self) -> str:
-        """Create the system prompt with hostel information."""
+        """Create the system prompt with hostel information (built once per client)."""
+        if self._system_prompt is None:
+            self._system_prompt = self._render_system_prompt()
+        return self._system_prompt
+    
+    def _render_system_prompt(self) -> str:
+        import yaml
         return f"""You are an AI assistant for {self.hostel_info['hostel']['name']}. 
         Use the following information to respond to guest inquiries:
         
@@ -37,15 +153,9 @@ class AIClient:
         5. Format responses in a clear, easy-to-read manner
         """
     
-    async def generate_response(self, 
-                              email_content: str, 
-                              email_metadata: Dict,
-                              max_retries: int = 3) -> AIResponse:
-        """Generate a response using GPT-4."""
-        try:
-            system_prompt = self._create_system_prompt()
-            
-            user_prompt = f"""
+    def build_reply_messages(self, email_content: str, email_metadata: Dict) -> List[Dict]:
+        """Build the chat messages asking for a structured reply to an email."""
+        user_prompt = f"""
             Respond to this email inquiry:
             
             From: {email_metadata.get('from')}
@@ -53,44 +163,275 @@ class AIClient:
             Content: {email_content}
             
             Generate a professional response following the hostel's guidelines.
-            """
             
-            print("\n=== SENDING TO GPT-4 ===")
-            print("System Prompt:", system_prompt)
-            print("\nUser Prompt:", user_prompt)
-            print("=" * 50)
+            {STRUCTURED_REPLY_INSTRUCTIONS}
+            """
+        return [
+            {"role": "system", "content": self._create_system_prompt()},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    async def generate_response(self, 
+                              email_content: str, 
+                              email_metadata: Dict,
+                              max_retries: int = 3,
+                              classification: Optional[EmailClassification] = None,
+                              thread_depth: int = 0,
+                              deadline: Optional[float] = None) -> AIResponse:
+        """Generate a response, starting on the fast tier and escalating hard cases.
+        
+        The whole call, including any escalation, must finish within ``deadline``
+        seconds (LLM_REQUEST_DEADLINE by default) or AIGenerationTimeout is raised.
+        """
+        try:
+            await self._wait_for_rate_budget()
+            deadline_at = time.perf_counter() + (get_request_deadline() if deadline is None else deadline)
+            messages = self.build_reply_messages(email_content, email_metadata)
             
-            # Remove await since the new client is synchronous
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=self.temperature
+            tier_name, reason = choose_initial_tier(
+                classification=classification,
+                email_length=len(email_content),
+                thread_depth=thread_depth
             )
+            print(f"\n=== ROUTING TO {tier_name.upper()} TIER ({self.tiers[tier_name].model}): {reason} ===")
+            
+            completion = await self._complete(self.tiers[tier_name], messages, deadline_at)
+            latency, cost = completion['latency'], completion['cost']
+            escalated = False
             
-            # Analyze confidence based on response
-            requires_review = False
-            confidence = 0.9  # Default high confidence
+            if tier_name == FAST_TIER and should_escalate(completion['self_confidence']):
+                reason = f"fast tier self-confidence {completion['self_confidence']} too low"
+                print(f"=== ESCALATING TO LARGE TIER: {reason} ===")
+                tier_name, escalated = LARGE_TIER, True
+                await self._wait_for_rate_budget()
+                completion = await self._complete(self.tiers[tier_name], messages, deadline_at)
+                latency += completion['latency']
+                cost += completion['cost']
             
-            response_content = response.choices[0].message.content
+            response_content = completion['content']
             
-            print("\n=== GPT-4 RESPONSE ===")
+            print(f"\n=== {self.tiers[tier_name].model} RESPONSE ===")
             print(response_content)
             print("=" * 50)
             
-            if "I'm not sure" in response_content.lower() or \
-               "I would need to confirm" in response_content.lower():
-                requires_review = True
-                confidence = 0.6
+            decision = RoutingDecision(
+                tier=tier_name,
+                model=self.tiers[tier_name].model,
+                reason=reason,
+                escalated=escalated,
+                latency=latency,
+                cost=cost,
+                ttft=completion['ttft'],
+                self_confidence=completion['self_confidence']
+            )
+            self.routing_stats.record_decision(decision)
             
-            return AIResponse(
+            return build_ai_response(
                 content=response_content,
-                confidence=confidence,
-                requires_review=requires_review
+                self_confidence=completion['self_confidence'],
+                model=decision.model,
+                routing=decision
             )
             
+        except AIGenerationTimeout as e:
+            print(f"AI response timed out: {str(e)}")
+            raise
         except Exception as e:
             print(f"Error generating AI response: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    async def _wait_for_rate_budget(self) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+    async def _complete(self, tier: ModelTier, messages: List[Dict], deadline_at: float) -> Dict:
+        """Stream one chat completion on a tier, cancelling it if a deadline is missed."""
+        start = time.perf_counter()
+        timing = {"start": start, "ttft": None}
+        remaining = deadline_at - start
+        if remaining <= 0:
+            self.routing_stats.record_timeout(tier.name)
+            raise AIGenerationTimeout(f"No time left for {tier.model}")
+        
+        try:
+            raw_content, usage = await asyncio.wait_for(
+                self._stream_completion(tier, messages, timing),
+                timeout=remaining
+            )
+        except asyncio.TimeoutError:
+            # wait_for cancelled the stream, which closes the HTTP response
+            self.routing_stats.record_timeout(tier.name)
+            if timing['ttft'] is None:
+                raise AIGenerationTimeout(f"{tier.model} sent no tokens before the deadline")
+            raise AIGenerationTimeout(f"{tier.model} did not finish within {remaining:.1f}s")
+        latency = time.perf_counter() - start
+        
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        cost = estimate_cost(tier, prompt_tokens, completion_tokens)
+        self.routing_stats.record_call(
+            tier.name, latency, cost, prompt_tokens, completion_tokens, ttft=timing['ttft']
+        )
+        
+        content, self_confidence = parse_structured_reply(raw_content)
+        recorder = get_traffic_recorder()
+        if recorder:
+            recorder.record_llm(
+                "reply", tier=tier.name, model=tier.model, latency=latency, ttft=timing['ttft'],
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                prompt_chars=sum(len(message['content']) for message in messages),
+                response_chars=len(raw_content), confidence=self_confidence
+            )
+        return {
+            "content": content,
+            "self_confidence": self_confidence,
+            "latency": latency,
+            "ttft": timing['ttft'],
+            "cost": cost
+        }
+
+    async def _stream_completion(self, tier: ModelTier, messages: List[Dict], timing: Dict) -> Tuple[str, Optional[object]]:
+        """Collect streamed deltas, recording time-to-first-token in ``timing``.
+
+        One first-token deadline covers opening the stream and receiving the
+        first chunk; later chunks share the request deadline.
+        """
+        first_token_at = time.perf_counter() + get_first_token_deadline()
+        stream = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=tier.model,
+                messages=messages,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            ),
+            timeout=get_first_token_deadline()
+        )
+        
+        parts = []
+        usage = None
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                first_token_timeout = None
+                if timing['ttft'] is None:
+                    first_token_timeout = max(0.0, first_token_at - time.perf_counter())
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=first_token_timeout)
+                except StopAsyncIteration:
+                    break
+                
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if timing['ttft'] is None:
+                        timing['ttft'] = time.perf_counter() - timing['start']
+                    parts.append(delta)
+        finally:
+            await stream.close()
+        
+        return "".join(parts), usage
+
+    async def classify_emails(self, emails: List[Dict]) -> List[Optional[EmailClassification]]:
+        """Classify several emails (subject plus a short snippet) in one fast-tier call."""
+        subject_chars = int(os.getenv('LLM_CLASSIFY_SUBJECT_CHARS', 120))
+        snippet_chars = int(os.getenv('LLM_CLASSIFY_SNIPPET_CHARS', 300))
+        items = [
+            {
+                "id": index,
+                "from": email_data.get('from', ''),
+                "subject": (email_data.get('subject') or '')[:subject_chars],
+                "snippet": re.sub(r'\s+', ' ', email_data.get('body') or '').strip()[:snippet_chars]
+            }
+            for index, email_data in enumerate(emails)
+        ]
+        categories = ", ".join(category.value for category in EmailCategory)
+        prompt = f"""
+            Classify each email sent to the inbox of {self.hostel_info['hostel']['name']}, a hostel.
+            Categories: {categories}.
+            legitimate: a guest or partner question the hostel can answer by email.
+            requires_human: complaints, refunds, legal, payment problems or anything needing staff judgement.
+            automated: auto-replies, notifications and bounces that need no answer.
+            
+            Emails (JSON):
+            {json.dumps(items, ensure_ascii=False)}
+            
+            Return only a JSON object of the form
+            {{"items": [{{"id": <id>, "category": "<category>", "confidence": <0.0-1.0>, "reason": "<few words>"}}]}}
+            with one entry per email.
+            """
+        
+        tier = self.tiers[FAST_TIER]
+        await self._wait_for_rate_budget()
+        start = time.perf_counter()
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=tier.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                response_format={"type": "json_object"}
+            ),
+            timeout=get_request_deadline()
+        )
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        # Tracked separately from reply generation so the saving is visible
+        latency = time.perf_counter() - start
+        self.routing_stats.record_call(
+            CLASSIFY_TIER, latency, estimate_cost(tier, prompt_tokens, completion_tokens),
+            prompt_tokens, completion_tokens
+        )
+        results = parse_classification_batch(response.choices[0].message.content, len(emails))
+        recorder = get_traffic_recorder()
+        if recorder:
+            recorder.record_llm(
+                "classify", tier=CLASSIFY_TIER, model=tier.model, latency=latency,
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, prompt_chars=len(prompt),
+                response_chars=len(response.choices[0].message.content or ""),
+                items=[result.model_dump(include={'category', 'confidence'}, mode='json') if result else None
+                       for result in results]
+            )
+        return results
+
+    async def summarize_thread(self, previous_summary: str, turns: List[str]) -> str:
+        """Fold older conversation turns into the rolling thread summary."""
+        turns_text = "\n\n---\n\n".join(turns)
+        prompt = f"""
+            Update the summary of an email conversation between the hostel and a guest.
+            
+            Current summary:
+            {previous_summary or "(none)"}
+            
+            Older messages to fold into the summary:
+            {turns_text}
+            
+            Write a concise summary (max 120 words) keeping guest names, dates,
+            booking details, open questions and anything the hostel promised.
+            """
+        
+        await self._wait_for_rate_budget()
+        start = time.perf_counter()
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=self.tiers[FAST_TIER].model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2
+            ),
+            timeout=get_request_deadline()
+        )
+        summary = response.choices[0].message.content.strip()
+        recorder = get_traffic_recorder()
+        if recorder:
+            usage = getattr(response, 'usage', None)
+            recorder.record_llm(
+                "summary", tier=FAST_TIER, model=self.tiers[FAST_TIER].model,
+                latency=time.perf_counter() - start,
+                prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+                completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+                prompt_chars=len(prompt), response_chars=len(summary)
+            )
+        return summary
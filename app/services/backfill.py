@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from app.schemas.email_schemas import EmailCategory, EmailClassification
+from app.services.email_classifier import classify_batch, refine_ambiguous
+from app.services.imap_utils import (
+    get_folder_delimiter, move_uids, parse_fetch_sections, quote_folder
+)
+from app.services.message_parser import parse_message
+from app.services.search_index import SearchIndex, folder_for_category
+
+BACKFILL_HEADER_FIELDS = (
+    "FROM TO SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES "
+    "CONTENT-TYPE CONTENT-TRANSFER-ENCODING MIME-VERSION"
+)
+STATUS_RE = re.compile(rb'(UIDNEXT|UIDVALIDITY) (\d+)')
+EXAMPLES_PER_MOVE = 5
+
+def get_backfill_workers() -> int:
+    return int(os.getenv('BACKFILL_WORKERS', os.cpu_count() or 1))
+
+def get_backfill_batch_size() -> int:
+    return int(os.getenv('BACKFILL_BATCH_SIZE', 500))
+
+def get_backfill_body_bytes() -> int:
+    return int(os.getenv('BACKFILL_BODY_BYTES', 16 * 1024))
+
+def get_checkpoint_dir() -> str:
+    return os.getenv('BACKFILL_CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'email_agent_backfill'))
+
+class BackfillJob(BaseModel):
+    folder: str
+    job_id: Optional[str] = None
+    dry_run: bool = True
+    workers: int = 1
+    partitions: Optional[int] = None
+    batch_size: int = 500
+    body_bytes: int = 16 * 1024
+    checkpoint_dir: str = ""
+    update_index: bool = True
+
+def partition_uid_range(low: int, high: int, n: int) -> List[Tuple[int, int]]:
+    """Split [low, high] into at most n contiguous, non-empty UID ranges."""
+    if high < low:
+        return []
+    n = max(1, min(n, high - low + 1))
+    size, extra = divmod(high - low + 1, n)
+    ranges, start = [], low
+    for index in range(n):
+        end = start + size - 1 + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+def checkpoint_path(job: BackfillJob, uid_range: Tuple[int, int]) -> str:
+    mode = "dry" if job.dry_run else "apply"
+    return os.path.join(job.checkpoint_dir, f"{job.job_id}-{mode}-{uid_range[0]}-{uid_range[1]}.json")
+
+def load_checkpoint(path: str, uidvalidity: Optional[int]) -> Optional[Dict]:
+    """Saved progress for a partition, ignored if the folder's UIDVALIDITY changed."""
+    try:
+        with open(path, 'r') as file:
+            checkpoint = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    return checkpoint if checkpoint.get('uidvalidity') == uidvalidity else None
+
+def save_checkpoint(path: str, checkpoint: Dict) -> None:
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+def new_partition_stats(uid_range: Tuple[int, int]) -> Dict:
+    return {"range": list(uid_range), "last_uid": uid_range[0] - 1, "scanned": 0,
+            "by_category": {}, "moves": {}, "examples": {}, "done": False}
+
+def fetch_batch(mail, low: int, high: int, body_bytes: int) -> List[Dict]:
+    """Fetch headers and the first body_bytes of text for a UID range in one command."""
+    _, msg_data = mail.uid(
+        'FETCH', f'{low}:{high}',
+        f'(UID FLAGS BODY.PEEK[HEADER.FIELDS ({BACKFILL_HEADER_FIELDS})] BODY.PEEK[TEXT]<0.{body_bytes}>)'
+    )
+    emails = []
+    for item in parse_fetch_sections(msg_data):
+        # Ignore stray responses outside the range (e.g. unsolicited FETCH for flag changes)
+        if not low <= item['uid'] <= high:
+            continue
+        header = next((v for k, v in item['sections'].items() if k.startswith('BODY[HEADER')), b"")
+        text = next((v for k, v in item['sections'].items() if k.startswith('BODY[TEXT]')), b"")
+        emails.append({"uid": item['uid'], "flags": item['flags'], **parse_message(header + text)})
+    return emails
+
+def refine_batch(emails: List[Dict]) -> List[EmailClassification]:
+    """Keyword rules, then the model for the emails they only call legitimate by default.
+
+    The live workers' second pass (refine_ambiguous), one fast-tier call per
+    LLM_CLASSIFY_BATCH_SIZE ambiguous emails; use it as the classifier
+    (``--refine``) to re-run an archive after the model or prompt changed.
+    """
+    from app.services.ai_client import AIClient
+
+    async def refine():
+        # A new client per batch: its connection pool belongs to this event loop
+        return await refine_ambiguous(emails, classify_batch(emails), AIClient().classify_emails)
+
+    return asyncio.run(refine())
+
+def plan_moves(emails: List[Dict], classifications: List, source: str, delimiter: str) -> Dict[str, List[Dict]]:
+    """Group emails by target folder, leaving out those already in the right one.
+
+    Mail re-classified as requires_human is left out too: staff find it by
+    the review reason flag_for_human_attention adds, which a bulk move
+    can't. It is still counted in the report's by_category.
+    """
+    moves: Dict[str, List[Dict]] = {}
+    for email_data, classification in zip(emails, classifications):
+        if classification.category == EmailCategory.REQUIRES_HUMAN:
+            continue
+        logical = folder_for_category(classification.category.value)
+        if logical != source.replace(delimiter, '/'):
+            target = logical.replace('/', delimiter)
+            moves.setdefault(target, []).append({**email_data, "category": classification.category.value})
+    return moves
+
+def run_partition(settings, job: BackfillJob, uid_range: Tuple[int, int], uidvalidity: Optional[int],
+                  classifier: Callable = classify_batch, mail=None) -> Dict:
+    """Backfill one UID range batch by batch, checkpointing after each batch.
+
+    Runs in a worker process with its own IMAP connection (pass ``mail`` to reuse one).
+    """
+    path = checkpoint_path(job, uid_range)
+    stats = load_checkpoint(path, uidvalidity) or new_partition_stats(uid_range)
+    stats['uidvalidity'] = uidvalidity
+    if stats['done']:
+        return stats
+
+    from app.services.email_client import EmailClient
+    client = EmailClient(settings=settings)
+    own_connection = mail is None
+    if own_connection:
+        mail = client._open_imap()
+    index = SearchIndex(account=client.email) if job.update_index and not job.dry_run else None
+    try:
+        typ, _ = mail.select(quote_folder(job.folder), readonly=job.dry_run)
+        if typ != 'OK':
+            raise ValueError(f"Could not select folder {job.folder}")
+        delimiter = get_folder_delimiter(mail)
+        created = set()
+
+        low = stats['last_uid'] + 1
+        while low <= uid_range[1]:
+            high = min(low + job.batch_size - 1, uid_range[1])
+            emails = fetch_batch(mail, low, high, job.body_bytes)
+            classifications = classifier(emails)
+
+            for classification in classifications:
+                category = classification.category.value
+                stats['by_category'][category] = stats['by_category'].get(category, 0) + 1
+            for target, moved in plan_moves(emails, classifications, job.folder, delimiter).items():
+                stats['moves'][target] = stats['moves'].get(target, 0) + len(moved)
+                examples = stats['examples'].setdefault(target, [])
+                examples.extend(
+                    f"{e['uid']}: {e['subject']}" for e in moved[:EXAMPLES_PER_MOVE - len(examples)]
+                )
+                if job.dry_run:
+                    continue
+                if target not in created:
+                    mail.create(quote_folder(target))
+                    created.add(target)
+                move_uids(mail, [e['uid'] for e in moved], target)
+                if index is not None:
+                    for email_data in moved:
+                        index.add(email_data, email_data['category'], folder_for_category(email_data['category']))
+
+            stats['scanned'] += len(emails)
+            stats['last_uid'] = high
+            save_checkpoint(path, stats)
+            low = high + 1
+
+        stats['done'] = True
+        save_checkpoint(path, stats)
+        return stats
+    finally:
+        if own_connection:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+def get_folder_status(mail, folder: str) -> Tuple[int, Optional[int]]:
+    """UIDNEXT and UIDVALIDITY of a folder without selecting it."""
+    _, data = mail.status(quote_folder(folder), '(UIDNEXT UIDVALIDITY)')
+    values = {key.decode(): int(value) for key, value in STATUS_RE.findall(data[0] if data and data[0] else b"")}
+    return values.get('UIDNEXT', 1), values.get('UIDVALIDITY')
+
+def merge_reports(job: BackfillJob, partitions: List[Dict], elapsed: float) -> Dict:
+    report = {
+        "job_id": job.job_id, "folder": job.folder, "dry_run": job.dry_run,
+        "scanned": 0, "by_category": {}, "moves": {}, "examples": {},
+        "partitions": len(partitions), "complete": all(p['done'] for p in partitions),
+        "elapsed_seconds": round(elapsed, 2)
+    }
+    for stats in partitions:
+        report['scanned'] += stats['scanned']
+        for key in ('by_category', 'moves'):
+            for name, count in stats[key].items():
+                report[key][name] = report[key].get(name, 0) + count
+        for target, examples in stats['examples'].items():
+            merged = report['examples'].setdefault(target, [])
+            merged.extend(examples[:EXAMPLES_PER_MOVE - len(merged)])
+    return report
+
+def run_backfill(settings, job: BackfillJob, classifier: Callable = classify_batch) -> Dict:
+    """Re-classify a whole folder in parallel and return a report of what (would) move.
+
+    The folder's UID range is split into partitions handled by a spawn
+    process pool, each with its own connection. Progress is checkpointed per
+    partition, so re-running the same job resumes where it stopped. A dry run
+    only reports; it never moves messages.
+    """
+    if job.folder.upper() == 'INBOX' and not job.dry_run:
+        raise ValueError("INBOX belongs to the live workers; backfill archive folders only")
+    job = job.model_copy(update={
+        "checkpoint_dir": job.checkpoint_dir or get_checkpoint_dir(),
+        "partitions": job.partitions or job.workers * 4
+    })
+    os.makedirs(job.checkpoint_dir, exist_ok=True)
+
+    from app.services.email_client import EmailClient
+    mail = EmailClient(settings=settings)._open_imap()
+    try:
+        uidnext, uidvalidity = get_folder_status(mail, job.folder)
+    finally:
+        mail.logout()
+    if not job.job_id:
+        job = job.model_copy(update={"job_id": re.sub(r'[^A-Za-z0-9_.-]', '_', f"{job.folder}-{uidvalidity}")})
+
+    started = time.time()
+    ranges = partition_uid_range(1, uidnext - 1, job.partitions)
+    print(f"Backfilling {job.folder}: UIDs 1-{uidnext - 1} in {len(ranges)} partitions, "
+          f"{job.workers} workers{' (dry run)' if job.dry_run else ''}")
+    with ProcessPoolExecutor(max_workers=job.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(run_partition, settings, job, uid_range, uidvalidity, classifier) for uid_range in ranges]
+        partitions = [future.result() for future in futures]
+
+    report = merge_reports(job, partitions, time.time() - started)
+    with open(os.path.join(job.checkpoint_dir, f"{job.job_id}-{'dry' if job.dry_run else 'apply'}-report.json"), 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-classify an archive folder in parallel")
+    parser.add_argument("folder", help="Folder to re-classify, e.g. AI_Processed/Legitimate")
+    parser.add_argument("--apply", action="store_true", help="Move messages (default is a dry-run report)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--job-id", default=None, help="Reuse to resume from checkpoints")
+    parser.add_argument("--refine", action="store_true",
+                        help="Send emails the rules can't decide to the LLM classifier in batches")
+    args = parser.parse_args()
+
+    from app.config.email_config import get_email_settings
+    result = run_backfill(get_email_settings(), BackfillJob(
+        folder=args.folder,
+        job_id=args.job_id,
+        dry_run=not args.apply,
+        workers=args.workers or get_backfill_workers(),
+        batch_size=args.batch_size or get_backfill_batch_size(),
+        body_bytes=get_backfill_body_bytes()
+    ), classifier=refine_batch if args.refine else classify_batch)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+class BatchError(Exception):
+    """Raised when a batch job fails, expires or is not finished in time."""
+
+def get_batch_poll_interval() -> float:
+    return float(os.getenv('BATCH_POLL_INTERVAL', 60))
+
+def get_batch_timeout() -> float:
+    return float(os.getenv('BATCH_TIMEOUT', 24 * 3600))
+
+def build_batch_line(custom_id: str, model: str, messages: List[Dict], temperature: float) -> Dict:
+    """Build one request line of a chat-completions batch job."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature
+        }
+    }
+
+def write_batch_file(lines: List[Dict], path: Optional[str] = None) -> str:
+    """Serialize batch request lines to a JSONL job file and return its path."""
+    if path is None:
+        batch_dir = os.getenv('BATCH_WORK_DIR', tempfile.gettempdir())
+        os.makedirs(batch_dir, exist_ok=True)
+        # A unique (and 0600) file, so runs sharing BATCH_WORK_DIR never overwrite each other's job
+        fd, path = tempfile.mkstemp(prefix='email_batch_', suffix='.jsonl', dir=batch_dir)
+        os.close(fd)
+
+    with open(path, 'w', encoding='utf-8') as file:
+        for line in lines:
+            file.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+async def submit_batch(client, path: str) -> str:
+    """Upload a job file to a Batch-compatible endpoint and start the batch."""
+    with open(path, 'rb') as file:
+        uploaded = await client.files.create(file=file, purpose="batch")
+
+    batch = await client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} from {path}")
+    return batch.id
+
+async def wait_for_batch(client, batch_id: str,
+                         poll_interval: Optional[float] = None,
+                         timeout: Optional[float] = None):
+    """Poll a batch until it reaches a terminal status."""
+    poll_interval = get_batch_poll_interval() if poll_interval is None else poll_interval
+    timeout = get_batch_timeout() if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            break
+        if time.monotonic() >= deadline:
+            raise BatchError(f"Batch {batch_id} still {batch.status} after {timeout:.0f}s")
+        print(f"Batch {batch_id} is {batch.status}, polling again in {poll_interval:.0f}s")
+        await asyncio.sleep(poll_interval)
+
+    if batch.status != "completed":
+        raise BatchError(f"Batch {batch_id} ended with status {batch.status}")
+    return batch
+
+async def fetch_batch_results(client, batch) -> Dict[str, Optional[str]]:
+    """Map each custom_id to its completion content, or None if that request failed."""
+    results: Dict[str, Optional[str]] = {}
+    for file_id in (batch.output_file_id, getattr(batch, 'error_file_id', None)):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for raw_line in content.text.splitlines():
+            if not raw_line.strip():
+                continue
+            line = json.loads(raw_line)
+            response = line.get('response') or {}
+            if line.get('error') or response.get('status_code') != 200:
+                results.setdefault(line['custom_id'], None)
+                continue
+            results[line['custom_id']] = response['body']['choices'][0]['message']['content']
+    return results
+
+class LocalBatchEndpoint:
+    """In-process stand-in for the files and batches endpoints of a Batch API.
+
+    ``complete`` receives each request body and returns the completion content,
+    or raises to mark that request as failed. Batches complete on first retrieve.
+    """
+
+    def __init__(self, complete: Callable[[Dict], str]):
+        self.complete = complete
+        self.stored_files: Dict[str, str] = {}
+        self.stored_batches: Dict[str, SimpleNamespace] = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    async def _create_file(self, file, purpose: str):
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.stored_files[file_id] = file.read().decode('utf-8')
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    async def _file_content(self, file_id: str):
+        return SimpleNamespace(text=self.stored_files[file_id])
+
+    async def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str):
+        batch = SimpleNamespace(
+            id=f"batch-{uuid.uuid4().hex}",
+            status="validating",
+            input_file_id=input_file_id,
+            output_file_id=None,
+            error_file_id=None
+        )
+        self.stored_batches[batch.id] = batch
+        return batch
+
+    async def _retrieve_batch(self, batch_id: str):
+        batch = self.stored_batches[batch_id]
+        if batch.status == "validating":
+            self._run_batch(batch)
+        return batch
+
+    def _run_batch(self, batch: SimpleNamespace) -> None:
+        output_lines = []
+        for raw_line in self.stored_files[batch.input_file_id].splitlines():
+            request = json.loads(raw_line)
+            try:
+                content = self.complete(request['body'])
+                response = {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                }
+                output_lines.append({"custom_id": request['custom_id'], "response": response, "error": None})
+            except Exception as e:
+                output_lines.append({
+                    "custom_id": request['custom_id'],
+                    "response": None,
+                    "error": {"message": str(e)}
+                })
+
+        output_id = f"file-{uuid.uuid4().hex}"
+        self.stored_files[output_id] = "\n".join(json.dumps(line) for line in output_lines)
+        batch.output_file_id = output_id
+        batch.status = "completed"
@@ -1,5 +1,6 @@
+import os
 import re
-from typing import Dict, List, Set
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 from app.schemas.email_schemas import EmailClassification, EmailCategory
 
 SPAM_KEYWORDS = {
@@ -17,10 +18,49 @@ URGENT_KEYWORDS = {
     'important', 'priority', 'confidential'
 }
 
-async def classify_email(email_data: Dict) -> EmailClassification:
-    """Classify email based on content and metadata."""
-    text = f"{email_data['subject']} {email_data['body']}".lower()
-    
+# Reason of the rules' default verdict: nothing matched, so its confidence says little
+FALLBACK_REASON = "No spam or newsletter indicators found"
+
+def classify_batch(emails: List[Dict]) -> List[EmailClassification]:
+    """Classify many emails in one synchronous call (no per-message await), for bulk jobs."""
+    return [classify_text(f"{e.get('subject', '')} {e.get('body', '')}".lower()) for e in emails]
+
+def is_llm_classification_enabled() -> bool:
+    return os.getenv('LLM_CLASSIFY_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+def get_llm_classify_batch_size() -> int:
+    return int(os.getenv('LLM_CLASSIFY_BATCH_SIZE', 20))
+
+def is_ambiguous(classification: EmailClassification) -> bool:
+    """The rules' fallback verdict: legitimate only because nothing else matched."""
+    threshold = float(os.getenv('LLM_CLASSIFY_BELOW', 0.65))
+    return classification.category == EmailCategory.LEGITIMATE and classification.confidence < threshold
+
+async def refine_ambiguous(emails: List[Dict], classifications: List[EmailClassification],
+                           classify_llm: Callable[[List[Dict]], Awaitable[List[Optional[EmailClassification]]]]
+                           ) -> List[EmailClassification]:
+    """Second pass: re-classify the ambiguous emails with one LLM call per batch.
+
+    Items the model skipped or answered invalidly, and whole batches that
+    fail, keep their rule-based classification.
+    """
+    refined = list(classifications)
+    pending = [i for i, classification in enumerate(classifications) if is_ambiguous(classification)]
+    size = get_llm_classify_batch_size()
+    for start in range(0, len(pending), size):
+        indexes = pending[start:start + size]
+        try:
+            results = await classify_llm([emails[i] for i in indexes])
+        except Exception as e:
+            print(f"LLM classification failed, keeping rule-based results: {str(e)}")
+            continue
+        for i, result in zip(indexes, results):
+            if result is not None:
+                refined[i] = result
+    return refined
+
+def classify_text(text: str) -> EmailClassification:
+    """Rule-based classification of lower-cased subject and body text."""
     # Check for spam indicators
     spam_count = sum(1 for keyword in SPAM_KEYWORDS if keyword in text)
     if spam_count >= 2:
@@ -52,5 +92,5 @@ async def classify_email(email_data: Dict) -> EmailClassification:
     return EmailClassification(
         category=EmailCategory.LEGITIMATE,
         confidence=0.6,
-        reason="No spam or newsletter indicators found"
+        reason=FALLBACK_REASON
     ) 
\ No newline at end of file
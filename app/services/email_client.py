@@ -3,69 +3,341 @@ import smtplib
 import email
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.header import decode_header
+from email.utils import make_msgid
 import os
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
+from datetime import date, datetime, timedelta
 import ssl
-from dotenv import load_dotenv
 import re
+import asyncio
+import time
 
-from .ai_client import AIClient, AIResponse
-from app.services.email_classifier import classify_email
+from .ai_client import (
+    AIClient, AIResponse, AIGenerationTimeout, build_ai_response, is_speculation_enabled, parse_structured_reply
+)
+from app.services.batch_processor import (
+    BatchError, build_batch_line, fetch_batch_results, get_batch_timeout, submit_batch,
+    wait_for_batch, write_batch_file
+)
+from app.services.lease_store import (
+    IMAP_CLAIM_KEYWORD, LeaseStore, claim_expiry_keyword, get_mailbox_lease_ttl, get_uid_lease_ttl,
+    has_active_claim, hold_lease, is_imap_mirror_enabled, mailbox_key, make_lease_owner,
+    stale_claim_keywords, uid_key
+)
+from app.services.model_router import LARGE_TIER
+from app.services.email_classifier import classify_batch, is_llm_classification_enabled, refine_ambiguous
+from app.services.thread_context import build_thread_context, compact_thread, get_thread_depth
+from app.services.message_parser import ParseStage, parse_message
+from app.services.scheduler import get_scan_limit, is_scheduler_enabled, order_emails, run_prioritized
+from app.services.header_prefilter import AGENT_MESSAGE_ID_MARKER, PREFILTER_HEADER_FIELDS, prefilter_headers
+from app.services.profiling import get_profiler
+from app.services.imap_transport import IMAPConnection, PlainIMAPConnection, is_compression_enabled
+from app.services.traffic_recorder import RecordingSMTP, get_traffic_recorder
+from app.services.message_store import SpooledMessage, append_message, build_flagged_message, fetch_spooled
+from app.services.message_cache import MessageCache, is_message_cache_enabled
+from app.services.search_index import SearchIndex, folder_for_category
+from app.services.imap_utils import (
+    ASSIGNEE_KEYWORD_PREFIX, HEADER_FIELDS, HUMAN_HANDLED_KEYWORD, REVIEW_HEADER_FIELDS,
+    REVIEW_REASON_HEADER, assignee_keyword, build_search_criteria, delete_uids, format_uid_set,
+    get_folder_delimiter, get_uidvalidity, move_uids, parse_fetch_flags, parse_fetch_items, parse_fetch_sections,
+    parse_header_summary, parse_list_response, parse_review_summary, quote_folder, search_latest, search_uids_before
+)
 from app.schemas.email_schemas import EmailCategory, EmailClassification
 
-load_dotenv()
+class EmailClientError(Exception):
+    """Raised when a mailbox read cannot be completed."""
+
+class InvalidCursorError(EmailClientError):
+    """Raised for a malformed page cursor."""
+
+class StaleCursorError(EmailClientError):
+    """Raised when a cursor's UIDVALIDITY no longer matches the folder."""
 
 class EmailClient:
-    def __init__(self):
-        self.host = os.getenv('EMAIL_HOST')
-        self.imap_port = int(os.getenv('IMAP_PORT', 993))
-        self.smtp_port = int(os.getenv('SMTP_PORT', 587))
-        self.email = os.getenv('EMAIL_ADDRESS')
-        self.password = os.getenv('EMAIL_PASSWORD')
-        self.ai_client = AIClient()
+    def __init__(self, settings=None):
+        # Settings and the AI client are resolved on first use so mail-only
+        # operations and short-lived scripts don't pay for them. Pass settings
+        # to serve a mailbox other than the one configured in the environment.
+        self._settings = settings
+        self._ai_client: Optional[AIClient] = None
+        self._lease_store: Optional[LeaseStore] = None
+        self._search_index: Optional[SearchIndex] = None
+        self._message_cache: Optional[MessageCache] = None
+        self.speculation_stats = {"used": 0, "cancelled": 0, "reissued": 0}
+        self.parse_stage = ParseStage()
+        self.lease_owner = make_lease_owner()
+        
+        # Long-lived connection for read-only API queries, see _run_read
+        self._read_mail: Optional[imaplib.IMAP4_SSL] = None
+        self._read_lock: Optional[asyncio.Lock] = None
+        self._delimiter: Optional[str] = None
+        self._known_folders: set = set()
+
+    @property
+    def settings(self):
+        if self._settings is not None:
+            return self._settings
+        # Imported here: pydantic-settings is only needed once we talk to a server
+        from app.config.email_config import get_email_settings
+        return get_email_settings()
+
+    @property
+    def host(self) -> str:
+        return self.settings.EMAIL_HOST
+
+    @property
+    def imap_port(self) -> int:
+        return self.settings.IMAP_PORT
+
+    @property
+    def smtp_port(self) -> int:
+        return self.settings.SMTP_PORT
+
+    @property
+    def email(self) -> str:
+        return self.settings.EMAIL_ADDRESS
+
+    @property
+    def password(self) -> str:
+        return self.settings.EMAIL_PASSWORD
+
+    @property
+    def ai_client(self) -> AIClient:
+        if self._ai_client is None:
+            self._ai_client = AIClient()
+        return self._ai_client
+
+    @property
+    def lease_store(self) -> LeaseStore:
+        if self._lease_store is None:
+            self._lease_store = LeaseStore()
+        return self._lease_store
+
+    @property
+    def search_index(self) -> SearchIndex:
+        if self._search_index is None:
+            self._search_index = SearchIndex(account=self.email)
+        return self._search_index
+
+    @property
+    def message_cache(self) -> Optional[MessageCache]:
+        """Parsed messages by (folder, UIDVALIDITY, UID); None when MESSAGE_CACHE_ENABLED is off."""
+        if self._message_cache is None and is_message_cache_enabled():
+            self._message_cache = MessageCache(account=self.email)
+        return self._message_cache
+
+    def _cached_message(self, folder: str, uidvalidity: Optional[int], uid: Optional[int],
+                        raw: bool = False) -> Optional[Union[Dict, bytes]]:
+        """A cached parsed record (or with raw=True, the original bytes), or None."""
+        try:
+            cache = self.message_cache
+            if cache is None:
+                return None
+            return cache.get_raw(folder, uidvalidity, uid) if raw else cache.get(folder, uidvalidity, uid)
+        except Exception as e:
+            # The cache only saves round trips; fall back to the server
+            print(f"Error reading message cache: {str(e)}")
+            return None
+
+    def _cache_message(self, folder: str, uidvalidity: Optional[int], uid: Optional[int], record: Dict,
+                       raw: Optional[bytes] = None) -> None:
+        try:
+            cache = self.message_cache
+            if cache is not None:
+                cache.put(folder, uidvalidity, uid, record, raw=raw)
+        except Exception as e:
+            print(f"Error writing message cache: {str(e)}")
+
+    def index_filed_email(self, success: bool, email_data: Dict, category: str,
+                          body: Optional[str] = None, replace_thread: bool = False) -> bool:
+        """Add a message to the local search index once it has been filed; returns success."""
+        if not success:
+            return success
+        try:
+            self.search_index.add(
+                email_data, category, folder_for_category(category),
+                body=body, replace_thread=replace_thread
+            )
+        except Exception as e:
+            # The index is a cache of the mailbox; never fail filing over it
+            print(f"Error indexing filed email: {str(e)}")
+        return success
+
+    def search_mail(self, query: str, category: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Full-text search over this mailbox's filed mail, answered from the local index."""
+        return self.search_index.search(query, category=category, limit=limit)
+
+    def mailbox_lease(self, ttl: Optional[float] = None):
+        """Async context manager holding this mailbox's INBOX lease."""
+        return hold_lease(
+            self.lease_store, mailbox_key(self.email), self.lease_owner,
+            get_mailbox_lease_ttl() if ttl is None else ttl
+        )
+
+    def renew_mailbox_lease(self) -> bool:
+        return self.lease_store.acquire(mailbox_key(self.email), self.lease_owner, get_mailbox_lease_ttl())
+
+    def _claim_key(self, email_data: Dict) -> str:
+        return uid_key(self.email, "INBOX", email_data.get('uidvalidity'), email_data['uid'])
+
+    async def claim_emails(self, emails: List[Dict], ttl: Optional[float] = None) -> List[Dict]:
+        """Claim fetched emails by UID and return only those this worker now owns.
+        
+        Claims last ``ttl`` seconds, LEASE_UID_TTL by default.
+        """
+        candidates = [e for e in emails if e.get('uid') is not None]
+        if is_imap_mirror_enabled():
+            candidates = [e for e in candidates if not has_active_claim(e.get('flags', []))]
+        
+        ttl = get_uid_lease_ttl() if ttl is None else ttl
+        acquired = set(await asyncio.get_running_loop().run_in_executor(
+            None, self.lease_store.acquire_many, [self._claim_key(e) for e in candidates], self.lease_owner, ttl
+        ))
+        claimed = [e for e in candidates if self._claim_key(e) in acquired]
+        if len(claimed) < len(emails):
+            print(f"Skipping {len(emails) - len(claimed)} emails claimed by another worker")
+        
+        if claimed and is_imap_mirror_enabled():
+            # The expiry keyword lets other hosts ignore the claim once the lease would have lapsed
+            keyword = claim_expiry_keyword(time.time() + ttl)
+            stale = sorted({flag for e in claimed for flag in stale_claim_keywords(e.get('flags', []))})
+            if stale:
+                await self._mirror_claims([e['uid'] for e in claimed], stale, add=False)
+            await self._mirror_claims([e['uid'] for e in claimed], [IMAP_CLAIM_KEYWORD, keyword], add=True)
+            for email_data in claimed:
+                email_data['claim_keyword'] = keyword
+        return claimed
+
+    async def release_claims(self, emails: List[Dict]) -> None:
+        """Release UID claims, e.g. for emails left in the INBOX after a failure."""
+        if not emails:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.lease_store.release_many, [self._claim_key(e) for e in emails], self.lease_owner
+        )
+        if is_imap_mirror_enabled():
+            by_keyword: Dict[Optional[str], List[int]] = {}
+            for email_data in emails:
+                by_keyword.setdefault(email_data.get('claim_keyword'), []).append(email_data['uid'])
+            for keyword, uids in by_keyword.items():
+                await self._mirror_claims(uids, [IMAP_CLAIM_KEYWORD] + ([keyword] if keyword else []), add=False)
+
+    async def _mirror_claims(self, uids: List[int], keywords: List[str], add: bool) -> None:
+        """Mirror claims as IMAP keywords so workers on other hosts see them too."""
+        try:
+            mail = await self.connect_imap()
+            mail.select('"INBOX"')
+            mail.uid('STORE', format_uid_set(uids), '+FLAGS' if add else '-FLAGS', f'({" ".join(keywords)})')
+            mail.logout()
+        except Exception as e:
+            print(f"Error mirroring claims to IMAP: {str(e)}")
 
     async def connect_imap(self) -> imaplib.IMAP4_SSL:
         """Establish a secure IMAP connection."""
+        return self._open_imap()
+
+    def _open_imap(self) -> imaplib.IMAP4_SSL:
         context = ssl.create_default_context()
         context.check_hostname = False
         context.verify_mode = ssl.CERT_NONE
         
-        mail = imaplib.IMAP4_SSL(
-            host=self.host,
-            port=self.imap_port,
-            ssl_context=context
-        )
+        if self.settings.MAIL_TLS:
+            mail = IMAPConnection(
+                host=self.host,
+                port=self.imap_port,
+                ssl_context=context
+            )
+        else:
+            mail = PlainIMAPConnection(host=self.host, port=self.imap_port)
         mail.login(self.email, self.password)
+        mail.refresh_capabilities()
+        if is_compression_enabled():
+            mail.enable_compression()
         return mail
 
-    async def fetch_latest_emails(self, limit: int = 5) -> List[Dict]:
-        """Fetch the latest emails from the inbox."""
+    def _open_smtp(self) -> smtplib.SMTP:
+        """Connected and logged-in SMTP session, recorded when TRAFFIC_RECORD_PATH is set."""
+        recorder = get_traffic_recorder()
+        if recorder:
+            server = RecordingSMTP(self.host, self.smtp_port, recorder=recorder)
+        else:
+            server = smtplib.SMTP(self.host, self.smtp_port)
+        try:
+            if self.settings.MAIL_TLS:
+                server.starttls()
+            server.login(self.email, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    async def fetch_latest_emails(self, limit: int = 5, unseen: Optional[bool] = None,
+                                  since_days: Optional[int] = None) -> List[Dict]:
+        """Fetch the latest emails from the inbox.
+        
+        Only the newest IDs are requested from the server (see search_latest),
+        so a poll costs the same on a 50k-message INBOX as on an empty one.
+        With the scheduler enabled, the newest SCHEDULER_SCAN_LIMIT are scored
+        from their headers and the ``limit`` most pressing ones fetched;
+        otherwise simply the newest ``limit``. ``unseen`` and ``since_days``
+        narrow the search further and default to POLL_UNSEEN_ONLY and
+        POLL_SINCE_DAYS.
+        """
         try:
             mail = await self.connect_imap()
             
             print("Selecting INBOX...")
-            mail.select("INBOX")
+            _, select_data = mail.select("INBOX")
+            exists = int(select_data[0]) if select_data and select_data[0] else 0
+            uidvalidity = get_uidvalidity(mail)
+            
+            if unseen is None:
+                unseen = os.getenv('POLL_UNSEEN_ONLY', 'false').lower() in ('1', 'true', 'yes')
+            if since_days is None and os.getenv('POLL_SINCE_DAYS'):
+                since_days = int(os.getenv('POLL_SINCE_DAYS'))
+            since = date.today() - timedelta(days=since_days) if since_days else None
             
             print("Searching for emails...")
-            # Search for all emails that are not deleted
-            _, messages = mail.search(None, 'NOT', 'DELETED')
-            email_ids = messages[0].split()
+            # Search for the newest emails that are not deleted
+            scheduling = is_scheduler_enabled()
+            scan = max(limit, get_scan_limit()) if scheduling else limit
+            with get_profiler().phase("imap"):
+                email_ids, total = search_latest(mail, scan, build_search_criteria(unseen, since), exists)
             
             if not email_ids:
                 print("No emails found in INBOX")
                 mail.logout()
                 return []
             
-            print(f"Found {len(email_ids)} emails in INBOX")
+            print(f"Found {total if total is not None else len(email_ids)} emails in INBOX")
+            
+            # One batched header FETCH decides auto-replies, bulk mail and loops without a body download
+            with get_profiler().phase("imap"):
+                prefiltered, headers = self._prefilter_ids(mail, email_ids)
+            if scheduling and headers:
+                # Urgent, overdue and in-thread mail first; newsletters and the like wait
+                candidates = [{**prefiltered.get(email_id, headers.get(email_id, {})), "id": email_id}
+                              for email_id in email_ids]
+                email_ids = [candidate['id'] for candidate in order_emails(candidates)[:limit]]
+            else:
+                email_ids = email_ids[:limit]
             
             latest_emails = []
-            for i in range(min(limit, len(email_ids))):
-                email_id = email_ids[-(i+1)]
-                print(f"Fetching email ID: {email_id.decode()}")
-                email_data = await self.fetch_email_by_id(mail, email_id)
+            for email_id in email_ids:
+                email_data = prefiltered.get(email_id)
+                # Messages seen in an earlier run are not downloaded or parsed again
+                seen = headers.get(email_id, {})
+                cached = None if email_data else self._cached_message("INBOX", uidvalidity, seen.get('uid'))
+                if email_data:
+                    print(f"Prefiltered email ID {email_id.decode()}: {email_data['classification']['reason']}")
+                elif cached is not None:
+                    print(f"Using cached email ID: {email_id.decode()}")
+                    email_data = {"id": email_id.decode(), **cached, "flags": seen['flags']}
+                else:
+                    print(f"Fetching email ID: {email_id.decode()}")
+                    email_data = await self.fetch_email_by_id(mail, email_id, uidvalidity)
                 if email_data:
+                    email_data['uidvalidity'] = uidvalidity
                     print(f"Successfully fetched email: {email_data['subject']}")
                     latest_emails.append(email_data)
                 else:
@@ -79,64 +351,62 @@ class EmailClient:
             print(f"Error fetching emails: {str(e)}")
             raise
 
-    async def fetch_email_by_id(self, mail: imaplib.IMAP4_SSL, email_id: bytes) -> Optional[Dict]:
-        """Fetch and parse a single email by its ID."""
+    def _prefilter_ids(self, mail: imaplib.IMAP4_SSL,
+                       email_ids: List[bytes]) -> Tuple[Dict[bytes, Dict], Dict[bytes, Dict]]:
+        """Classify emails from their headers alone; the rest need a body fetch.
+        
+        Returns the prefiltered emails and the UID, flags and header fields of
+        every email, both keyed by ID.
+        """
+        if os.getenv('PREFILTER_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+            return {}, {}
         try:
-            _, msg_data = mail.fetch(email_id, "(RFC822 FLAGS)")
-            email_body = msg_data[0][1]
-            message = email.message_from_bytes(email_body)
-            
-            # Get message ID for threading
-            message_id = message.get('Message-ID', '')
-            references = message.get('References', '').split()
-            in_reply_to = message.get('In-Reply-To', '')
-            
-            # Extract email content with better encoding handling
-            body = ""
-            if message.is_multipart():
-                for part in message.walk():
-                    if part.get_content_type() == "text/plain":
-                        payload = part.get_payload(decode=True)
-                        charset = part.get_content_charset() or 'utf-8'
-                        try:
-                            body = payload.decode(charset, errors='replace')
-                        except (UnicodeDecodeError, LookupError):
-                            body = payload.decode('utf-8', errors='replace')
-                        break
-            else:
-                payload = message.get_payload(decode=True)
-                charset = message.get_content_charset() or 'utf-8'
-                try:
-                    body = payload.decode(charset, errors='replace')
-                except (UnicodeDecodeError, LookupError):
-                    body = payload.decode('utf-8', errors='replace')
-            
-            # Decode headers with better error handling
-            def decode_header_safe(header):
-                decoded = decode_header(header or "")
-                parts = []
-                for part, charset in decoded:
-                    if isinstance(part, bytes):
-                        try:
-                            parts.append(part.decode(charset or 'utf-8', errors='replace'))
-                        except (UnicodeDecodeError, LookupError):
-                            parts.append(part.decode('utf-8', errors='replace'))
-                    else:
-                        parts.append(part)
-                return " ".join(parts)
-            
-            subject = decode_header_safe(message["subject"])
-            from_ = decode_header_safe(message.get("from", ""))
+            _, msg_data = mail.fetch(
+                b",".join(email_ids).decode(), f'(UID FLAGS BODY.PEEK[HEADER.FIELDS ({PREFILTER_HEADER_FIELDS})])'
+            )
+        except imaplib.IMAP4.error as e:
+            print(f"Header prefilter skipped: {str(e)}")
+            return {}, {}
+        
+        prefiltered, headers = {}, {}
+        for item in parse_fetch_sections(msg_data):
+            if item['seq'] is None:
+                continue
+            header = next(iter(item['sections'].values()), b"")
+            headers[str(item['seq']).encode()] = {"uid": item['uid'], "flags": item['flags'], **parse_message(header)}
+            classification = prefilter_headers(email.message_from_bytes(header), self.email)
+            if classification is None:
+                continue
+            prefiltered[str(item['seq']).encode()] = {
+                "id": str(item['seq']),
+                **headers[str(item['seq']).encode()],
+                "classification": classification.model_dump(),
+                "prefiltered": True
+            }
+        return prefiltered, headers
+
+    async def fetch_email_by_id(self, mail: imaplib.IMAP4_SSL, email_id: bytes,
+                                uidvalidity: Optional[int] = None) -> Optional[Dict]:
+        """Fetch and parse a single email by its INBOX ID, caching the result by UID."""
+        try:
+            # Large messages are spooled to disk in chunks rather than held in memory
+            with get_profiler().phase("imap"):
+                spooled = fetch_spooled(mail, email_id)
+            with spooled, get_profiler().phase("parse"):
+                # MIME decoding and HTML-to-text may run in the parse process pool
+                if spooled.is_spooled:
+                    parsed = await self.parse_stage.parse_file(spooled.path)
+                else:
+                    parsed = await self.parse_stage.parse(bytes(spooled.view()))
+                # Small originals are kept too, so flagging doesn't download them again
+                raw = None if spooled.is_spooled else bytes(spooled.view())
+                self._cache_message("INBOX", uidvalidity, spooled.uid, {"uid": spooled.uid, **parsed}, raw=raw)
             
             return {
                 "id": email_id.decode(),
-                "message_id": message_id,
-                "references": references,
-                "in_reply_to": in_reply_to,
-                "subject": subject,
-                "from": from_,
-                "date": message.get("date", ""),
-                "body": body
+                "uid": spooled.uid,
+                "flags": spooled.flags,
+                **parsed
             }
             
         except Exception as e:
@@ -181,9 +451,7 @@ class EmailClient:
             msg.attach(MIMEText(response_with_metadata, 'plain'))
             
             # Connect to SMTP server and send
-            with smtplib.SMTP(self.host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email, self.password)
+            with self._open_smtp() as server:
                 server.send_message(msg)
             
             print("\n=== EMAIL SENT SUCCESSFULLY ===")
@@ -223,18 +491,19 @@ class EmailClient:
     async def fetch_and_classify_emails(self, limit: int = 5) -> List[Dict]:
         """Fetch emails and classify them."""
         emails = await self.fetch_latest_emails(limit)
+        await self.classify_emails(emails)
         classified_emails = []
         
         for email_data in emails:
-            classification = await classify_email(email_data)
-            email_data['classification'] = classification.dict()
+            classification = EmailClassification(**email_data['classification'])
             classified_emails.append(email_data)
             
             # Move email to appropriate folder based on classification
             if classification.category != EmailCategory.LEGITIMATE:
                 await self.move_email_to_folder(
                     email_id=email_data['id'],
-                    folder=classification.category.value
+                    folder=classification.category.value,
+                    uid=email_data.get('uid')
                 )
         
         return classified_emails
@@ -244,27 +513,13 @@ class EmailClient:
         try:
             mail = await self.connect_imap()
             
-            # First, list existing folders to get the hierarchy delimiter
-            _, list_response = mail.list()
-            if not list_response:
-                raise Exception("Could not get folder list")
-            
-            # Get the delimiter from the first folder entry
-            delimiter = '/'  # Default to forward slash
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    print(f"Folder info: {folder_str}")
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
-            
+            # Get the hierarchy delimiter for the folder paths
+            delimiter = get_folder_delimiter(mail)
             print(f"Using delimiter: {delimiter}")
             
             # Define standard folders using the correct delimiter
             base_folder = "AI_Processed"
-            subfolders = ["Legitimate", "Spam", "Newsletter", "Requires_Human"]
+            subfolders = ["Legitimate", "Spam", "Newsletter", "Requires_Human", "Automated"]
             
             # First create base folder if it doesn't exist
             try:
@@ -305,10 +560,18 @@ class EmailClient:
                     pass
             raise
 
-    async def move_email_to_folder(self, email_id: str, folder: str) -> bool:
+    @staticmethod
+    def _require_uid(email_id: str, uid: Optional[int]) -> int:
+        """Filing acts by UID only: sequence numbers shift whenever another message is expunged."""
+        if uid is None:
+            raise EmailClientError(f"Message {email_id} has no UID, not filing it by sequence number")
+        return uid
+
+    async def move_email_to_folder(self, email_id: str, folder: str, uid: Optional[int] = None) -> bool:
         """Move email to appropriate AI folder and mark it."""
         try:
             print(f"\nMoving email {email_id} to folder {folder}")
+            uid = self._require_uid(email_id, uid)
             mail = await self.connect_imap()
             
             print("Selecting INBOX...")
@@ -316,15 +579,7 @@ class EmailClient:
             
             # Get the delimiter
             print("Getting folder delimiter...")
-            _, list_response = mail.list()
-            delimiter = '/'
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
+            delimiter = get_folder_delimiter(mail)
             
             # Capitalize folder name to match existing structure
             folder = folder.capitalize()
@@ -356,62 +611,99 @@ class EmailClient:
                 mail.logout()
                 return False
             
-            # Copy email to appropriate folder
-            print("Copying email to target folder...")
-            result = mail.copy(email_id, full_folder)
-            print(f"Copy result: {result}")
-            
-            if result[0] == 'OK':
-                # Mark original email as processed and delete from inbox
-                print("Marking original email as processed and deleted...")
-                mail.store(email_id, '+FLAGS', '(\\Seen \\Deleted)')
-                mail.expunge()
-                
-                print(f"Successfully moved email {email_id} to {full_folder}")
-                mail.logout()
-                return True
+            # Move by UID: sequence numbers shift, and a plain EXPUNGE would also remove other workers' deletions
+            print("Moving email to target folder...")
+            mail.uid('STORE', str(uid), '+FLAGS.SILENT', '(\\Seen)')
+            move_uids(mail, [uid], full_folder)
             
+            print(f"Successfully moved email {email_id} to {full_folder}")
             mail.logout()
-            print(f"Failed to copy email {email_id} to {full_folder}")
-            return False
+            return True
             
         except Exception as e:
             print(f"Error moving email to folder: {str(e)}")
             return False
 
-    async def process_and_store_response(self, email_data: Dict, classification: EmailClassification, is_reply: bool = False) -> bool:
-        """Generate AI response, send it, and store the thread in the appropriate folder."""
+    async def process_and_store_response(self, email_data: Dict, classification: EmailClassification, is_reply: bool = False,
+                                         speculative: Optional[asyncio.Future] = None) -> bool:
+        """Generate AI response, send it, and store the thread in the appropriate folder.
+        
+        ``speculative`` is a reply generation already started for this email
+        and classification (see _prepare_speculatively); it is used instead of
+        starting a new one.
+        """
         try:
             if classification.category == EmailCategory.REQUIRES_HUMAN:
-                return await self.flag_for_human_attention(
+                success = await self.flag_for_human_attention(
                     email_id=email_data['id'],
-                    reason=classification.reason
+                    reason=classification.reason,
+                    body_text=self._notice_body(email_data),
+                    uid=email_data.get('uid'),
+                    uidvalidity=email_data.get('uidvalidity')
                 )
+                return self.index_filed_email(success, email_data, EmailCategory.REQUIRES_HUMAN.value)
             
             if classification.category != EmailCategory.LEGITIMATE:
-                return await self.move_email_to_folder(
+                success = await self.move_email_to_folder(
                     email_id=email_data['id'],
-                    folder=classification.category.value
+                    folder=classification.category.value,
+                    uid=email_data.get('uid')
                 )
+                return self.index_filed_email(success, email_data, classification.category.value)
 
             # Generate and send AI response for legitimate emails
             print(f"\n=== Generating response for: {email_data['subject']} ===")
             
-            # Extract latest content for AI context
-            if is_reply and 'thread_history' in email_data:
-                print("Using thread history for context...")
-                thread_content = (
-                    f"Previous conversation:\n{email_data['thread_history']}\n\n"
-                    f"New message:\n{email_data['body']}"
+            # Generate AI response (routed to the fast or large model tier)
+            try:
+                with get_profiler().phase("llm"):
+                    if speculative is not None:
+                        ai_response = await speculative
+                    else:
+                        ai_response = await self._generate_reply(email_data, classification, is_reply)
+            except AIGenerationTimeout as e:
+                # A slow provider must not stall the queue; hand the mail to staff instead
+                print(f"AI response timed out, flagging for human attention: {str(e)}")
+                success = await self.flag_for_human_attention(
+                    email_id=email_data['id'],
+                    reason=f"AI response timed out: {str(e)}",
+                    body_text=self._notice_body(email_data),
+                    uid=email_data.get('uid'),
+                    uidvalidity=email_data.get('uidvalidity')
                 )
-            else:
-                thread_content = email_data['body']
+                return self.index_filed_email(success, email_data, EmailCategory.REQUIRES_HUMAN.value)
             
-            # Generate AI response
-            ai_response = await self.ai_client.generate_response(
-                email_content=thread_content,
-                email_metadata=email_data
+            return await self.send_and_store_reply(email_data, ai_response, is_reply)
+            
+        except Exception as e:
+            print(f"Error processing and storing response: {str(e)}")
+            return False
+
+    async def _generate_reply(self, email_data: Dict, classification: EmailClassification, is_reply: bool) -> AIResponse:
+        thread_content, thread_depth = self._build_reply_context(email_data, is_reply)
+        return await self.ai_client.generate_response(
+            email_content=thread_content,
+            email_metadata=email_data,
+            classification=classification,
+            thread_depth=thread_depth
+        )
+
+    def _build_reply_context(self, email_data: Dict, is_reply: bool) -> Tuple[str, int]:
+        """Return the AI prompt content for an email and the depth of its thread."""
+        # Extract latest content for AI context (bounded by the thread token budget)
+        if is_reply and 'thread_history' in email_data:
+            print("Using thread history for context...")
+            thread_content = build_thread_context(
+                thread_history=email_data['thread_history'],
+                new_message=email_data['body']
             )
+            return thread_content, get_thread_depth(email_data['thread_history'])
+        return email_data['body'], 0
+
+    async def send_and_store_reply(self, email_data: Dict, ai_response: AIResponse, is_reply: bool) -> bool:
+        """Send a generated reply and store the updated thread in the Legitimate folder."""
+        try:
+            email_data['ai_model'] = ai_response.model
             
             # Create email message for sending
             msg = MIMEMultipart()
@@ -419,7 +711,9 @@ class EmailClient:
             msg['To'] = "stephane.kolijn@gmail.com"  # Override recipient for testing
             msg['Subject'] = f"Re: {email_data['subject']}"
             msg['In-Reply-To'] = email_data.get('message_id', '')
-            msg['References'] = email_data.get('message_id', '')
+            # Keep the whole chain so the header prefilter can spot loops with other auto-responders
+            msg['References'] = " ".join(email_data.get('references', []) + [email_data.get('message_id', '')]).strip()
+            msg['Message-ID'] = make_msgid(idstring=AGENT_MESSAGE_ID_MARKER, domain=self.email.split('@')[-1])
             
             # Combine content for email sending (without thread history)
             email_content = (
@@ -437,50 +731,50 @@ class EmailClient:
             # Send the response
             print("\n=== Sending response email ===")
             try:
-                with smtplib.SMTP(self.host, self.smtp_port) as server:
-                    server.starttls()
-                    server.login(self.email, self.password)
+                with get_profiler().phase("smtp"), self._open_smtp() as server:
                     server.send_message(msg)
                 print("Email sent successfully to stephane.kolijn@gmail.com")
             except Exception as e:
                 print(f"Failed to send email: {str(e)}")
                 return False
             
-            # Create combined content for storage (including thread history)
+            # Create combined content for storage: recent turns verbatim, older ones summarized
             storage_content = email_content
             if is_reply and 'thread_history' in email_data:
-                storage_content += f"\n\n{'-' * 60}\nPrevious Thread:\n{email_data['thread_history']}"
+                storage_content = await compact_thread(
+                    new_turn=email_content,
+                    thread_history=email_data['thread_history'],
+                    summarize=self.ai_client.summarize_thread
+                )
             
             # Store in Legitimate folder
             print("\n=== Storing in Legitimate folder ===")
-            success = await self.store_in_legitimate_folder(
-                email_id=email_data['id'],
-                combined_content=storage_content,
-                original_email=email_data
-            )
+            with get_profiler().phase("store"):
+                success = await self.store_in_legitimate_folder(
+                    email_id=email_data['id'],
+                    combined_content=storage_content,
+                    original_email=email_data
+                )
             print(f"Storage result: {'Success' if success else 'Failed'}")
             
-            return success
+            # The Legitimate folder keeps one message per thread; so does the index
+            return self.index_filed_email(
+                success, email_data, EmailCategory.LEGITIMATE.value,
+                body=storage_content, replace_thread=True
+            )
             
         except Exception as e:
-            print(f"Error processing and storing response: {str(e)}")
+            print(f"Error sending and storing reply: {str(e)}")
             return False
 
     async def store_in_legitimate_folder(self, email_id: str, combined_content: str, original_email: Dict) -> bool:
         """Store or update the complete thread in the Legitimate folder."""
         try:
+            uid = self._require_uid(email_id, original_email.get('uid'))
             mail = await self.connect_imap()
             
             # Get the delimiter and construct folder path
-            _, list_response = mail.list()
-            delimiter = '/'
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
+            delimiter = get_folder_delimiter(mail)
             
             legitimate_folder = f'"AI_Processed{delimiter}Legitimate"'
             print(f"Target folder: {legitimate_folder}")
@@ -501,13 +795,11 @@ class EmailClient:
                 
                 # Find and remove all old thread messages
                 print(f"Searching for old thread messages with subject: {search_subject}")
-                _, messages = mail.search(None, f'SUBJECT "{search_subject}"')
+                _, messages = mail.uid('SEARCH', None, f'SUBJECT "{search_subject}"')
                 if messages[0]:
-                    old_msg_ids = messages[0].split()
-                    for old_id in old_msg_ids:
-                        print(f"Marking old thread message {old_id} for deletion")
-                        mail.store(old_id, '+FLAGS', '\\Deleted')
-                    mail.expunge()
+                    old_uids = [int(old_uid) for old_uid in messages[0].split()]
+                    print(f"Deleting old thread messages {old_uids}")
+                    delete_uids(mail, old_uids)
                     print("Removed old thread messages")
                 
                 # Create new message with complete thread
@@ -523,13 +815,12 @@ class EmailClient:
                 
                 # Store the new message
                 print("Storing updated thread message...")
-                append_result = mail.append(legitimate_folder, '(\\Seen)', None, msg.as_bytes())
+                append_result = append_message(mail, legitimate_folder, '(\\Seen)', SpooledMessage(data=msg.as_bytes()))
                 
                 if append_result[0] == 'OK':
                     # Remove original from inbox
                     mail.select('"INBOX"')
-                    mail.store(email_id, '+FLAGS', '(\\Seen \\Deleted)')
-                    mail.expunge()
+                    delete_uids(mail, [uid])
                     
                     mail.logout()
                     print("Thread updated successfully")
@@ -547,9 +838,10 @@ class EmailClient:
             print(f"Error storing in legitimate folder: {str(e)}")
             return False
 
-    async def update_email_with_response(self, email_id: str, combined_content: str) -> bool:
+    async def update_email_with_response(self, email_id: str, combined_content: str, uid: Optional[int] = None) -> bool:
         """Update the original email with the AI response in the Legitimate folder."""
         try:
+            uid = self._require_uid(email_id, uid)
             print("\nUpdating email with response...")
             mail = await self.connect_imap()
             
@@ -558,22 +850,14 @@ class EmailClient:
             
             # Get the delimiter
             print("Getting folder delimiter...")
-            _, list_response = mail.list()
-            delimiter = '/'
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
+            delimiter = get_folder_delimiter(mail)
             
             # Construct folder path
             folder = f'"AI_Processed{delimiter}Legitimate"'
             print(f"Target folder: {folder}")
             
-            # Get original message data
-            _, msg_data = mail.fetch(email_id, '(RFC822)')
+            # Only the headers are reused, so don't download the body
+            _, msg_data = mail.uid('FETCH', str(uid), '(BODY.PEEK[HEADER])')
             if not msg_data or not msg_data[0] or not isinstance(msg_data[0], tuple):
                 raise Exception("Failed to fetch original message")
                 
@@ -605,15 +889,14 @@ class EmailClient:
                 mail.create(folder)
             
             # Store message with basic flags
-            append_result = mail.append(folder, '(\\Seen)', None, msg.as_bytes())
+            append_result = append_message(mail, folder, '(\\Seen)', SpooledMessage(data=msg.as_bytes()))
             print(f"Append result: {append_result}")
             
             if append_result[0] == 'OK':
                 # Remove the original email from inbox
                 mail.select('"INBOX"')  # Switch back to INBOX
                 print("Removing original email from inbox...")
-                mail.store(email_id, '+FLAGS', '(\\Seen \\Deleted)')
-                mail.expunge()
+                delete_uids(mail, [uid])
                 
                 mail.logout()
                 print("Email update completed successfully")
@@ -628,76 +911,315 @@ class EmailClient:
             return False
 
     async def process_latest_emails(self, limit: int = 4) -> List[Dict]:
-        """Process the latest emails with complete workflow."""
+        """Process the latest emails with complete workflow.
+        
+        Only one worker per mailbox runs at a time (mailbox lease), and each
+        message is claimed by UID before processing, so concurrent workers or
+        cron runs never reply twice or expunge each other's messages.
+        """
+        async with self.mailbox_lease() as acquired:
+            if not acquired:
+                print("Another worker holds the mailbox lease, skipping this run")
+                return []
+            # Per-message captures inside take the CPU profile; this one records totals and phases
+            with get_profiler().capture("process_latest_emails", key=self.email, cpu=False, dump_if_slow=False):
+                return await self._process_latest_emails(limit)
+
+    async def _process_latest_emails(self, limit: int) -> List[Dict]:
         try:
             # Ensure folders exist
             await self.setup_folders()
             
             # Fetch and classify emails
             print("\nFetching latest emails...")
-            emails = await self.fetch_latest_emails(limit)
+            emails = await self.claim_emails(await self.fetch_latest_emails(limit))
             
             if not emails:
                 print("No emails found to process")
                 return []
                 
-            processed_emails = []
+            try:
+                # Classify up front so ambiguous mail shares one LLM classification call
+                await self.classify_emails(emails)
+                
+                if is_scheduler_enabled():
+                    # By priority and deadline, several at once within per-priority limits
+                    results = await run_prioritized(order_emails(emails), self._process_with_capture)
+                    processed_emails = [email_data for email_data, success in results if success]
+                else:
+                    processed_emails = []
+                    for email_data in emails:
+                        if await self._process_with_capture(email_data):
+                            processed_emails.append(email_data)
+            finally:
+                # Failed messages stay in the INBOX; let the next run retry them
+                await self.release_claims(emails)
+            return processed_emails
+            
+        except Exception as e:
+            print(f"Error processing emails: {str(e)}")
+            raise
+
+    async def _process_with_capture(self, email_data: Dict) -> bool:
+        await asyncio.get_running_loop().run_in_executor(None, self.renew_mailbox_lease)
+        with get_profiler().capture("message", key=f"{email_data.get('uid')} {email_data['subject']}"):
+            return await self.process_single_email(email_data)
+
+    async def classify_emails(self, emails: List[Dict]) -> None:
+        """Store a classification on each email that the header prefilter did not decide.
+        
+        Keyword rules run first; when LLM_CLASSIFY_ENABLED is set, emails they
+        can only call legitimate by default go to the model in batches, so one
+        cheap call replaces reply generation for mail that should be filed.
+        """
+        pending = [e for e in emails if not e.get('prefiltered')]
+        if not pending:
+            return
+        with get_profiler().phase("classify"):
+            classifications = classify_batch(pending)
+            if is_llm_classification_enabled():
+                classifications = await refine_ambiguous(pending, classifications, self.ai_client.classify_emails)
+        for email_data, classification in zip(pending, classifications):
+            email_data['classification'] = classification.model_dump()
+
+    async def process_single_email(self, email_data: Dict) -> bool:
+        """Thread lookup, classification and reply/filing for one fetched email."""
+        print(f"\nProcessing email: {email_data['subject']}")
+        
+        # Check if it's a reply and get thread history
+        is_reply = email_data['subject'].lower().startswith('re:')
+        if email_data.get('prefiltered'):
+            # Already classified from headers; no body was fetched
+            classification = EmailClassification(**email_data['classification'])
+            return await self.process_and_store_response(email_data, classification)
+        
+        speculative = None
+        if is_speculation_enabled():
+            speculative = await self._prepare_speculatively(email_data, is_reply)
+        else:
+            if is_reply:
+                print("Email is a reply - checking thread history...")
+                with get_profiler().phase("thread"):
+                    thread_history = await self.get_thread_history(email_data)
+                if thread_history:
+                    email_data['thread_history'] = thread_history
+                    print("Found existing thread history")
+                else:
+                    print("No thread history found")
             
+            # Classify email (unless classify_emails already did for the whole run)
+            if 'classification' not in email_data:
+                print("Classifying email...")
+                await self.classify_emails([email_data])
+        classification = EmailClassification(**email_data['classification'])
+        print(f"Classification result: {classification.category}")
+        
+        # Process email based on classification
+        print("Processing based on classification...")
+        success = await self.process_and_store_response(
+            email_data=email_data,
+            classification=classification,
+            is_reply=is_reply,
+            speculative=speculative
+        )
+        
+        if success:
+            print(f"Successfully processed email: {email_data['subject']} -> {classification.category.value}")
+        else:
+            print(f"Failed to process email: {email_data['subject']}")
+        return success
+
+    async def _prepare_speculatively(self, email_data: Dict, is_reply: bool) -> Optional[asyncio.Future]:
+        """Thread lookup and classification with the reply generation already running.
+        
+        The thread history is looked up first (from the local index, else by
+        IMAP), since a reply generated without it would have to be thrown
+        away. Then, for mail the rules call legitimate, generation starts
+        while the final classification runs. It is cancelled if the email
+        turns out not to be legitimate or classifying fails, and re-issued
+        (by returning None) if the final classification differs from the
+        rules' guess. Returns the still-valid generation, if any.
+        """
+        if is_reply:
+            thread_history = self._indexed_thread_history(email_data)
+            if thread_history is None:
+                with get_profiler().phase("thread"):
+                    thread_history = await self._imap_thread_history(email_data)
+            if thread_history:
+                email_data['thread_history'] = thread_history
+        if 'classification' in email_data:
+            # Nothing left to overlap (e.g. classify_emails ran for the whole run)
+            return None
+        
+        guess = classify_batch([email_data])[0]
+        speculative = None
+        if guess.category == EmailCategory.LEGITIMATE:
+            speculative = asyncio.ensure_future(self._generate_reply(email_data, guess, is_reply))
+        try:
+            await self.classify_emails([email_data])
+        except (Exception, asyncio.CancelledError):
+            # Don't leave a paid generation running for an email that failed here
+            if speculative is not None:
+                self._discard_speculative(speculative)
+            raise
+        if speculative is None:
+            return None
+        
+        final = EmailClassification(**email_data['classification'])
+        if final.category != EmailCategory.LEGITIMATE:
+            outcome = "cancelled"
+        elif final != guess:
+            # Routing and the prompt depend on confidence and reason too, not just the category
+            outcome = "reissued"
+        else:
+            self.speculation_stats['used'] += 1
+            return speculative
+        print(f"Speculative reply {outcome} for: {email_data['subject']}")
+        self.speculation_stats[outcome] += 1
+        self._discard_speculative(speculative)
+        return None
+
+    @staticmethod
+    def _discard_speculative(speculative: asyncio.Future) -> None:
+        speculative.cancel()
+        # Collect a failure that raced the cancel, so it isn't reported as never retrieved
+        speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def process_backlog(self, limit: int = 500, batch_client=None,
+                              poll_interval: Optional[float] = None,
+                              timeout: Optional[float] = None) -> List[Dict]:
+        """Drain a large backlog, generating replies for legitimate emails in one batch job.
+        
+        Replies are generated through a Batch-compatible endpoint (the OpenAI
+        client by default) instead of one synchronous call per email. The
+        mailbox lease is held only while the backlog is fetched and claimed;
+        the UID claims last as long as the batch may take, so regular polls
+        carry on meanwhile and skip the backlog emails. Emails are filed by
+        UID once the batch completes.
+        """
+        claim_ttl = get_uid_lease_ttl() + (timeout or get_batch_timeout())
+        async with self.mailbox_lease() as acquired:
+            if not acquired:
+                print("Another worker holds the mailbox lease, skipping backlog run")
+                return []
+            await self.setup_folders()
+            print("\nFetching backlog emails...")
+            emails = await self.claim_emails(await self.fetch_latest_emails(limit), ttl=claim_ttl)
+        
+        if not emails:
+            print("No emails found to process")
+            return []
+        try:
+            return await self._process_backlog(emails, batch_client, poll_interval, timeout)
+        finally:
+            await self.release_claims(emails)
+
+    async def _process_backlog(self, emails: List[Dict], batch_client, poll_interval: Optional[float],
+                               timeout: Optional[float]) -> List[Dict]:
+        try:
+            batch_client = batch_client or self.ai_client.client
+            
+            # Classify everything and collect reply prompts for legitimate emails
+            tier = self.ai_client.tiers[os.getenv('BATCH_MODEL_TIER', LARGE_TIER)]
+            await self.classify_emails(emails)
+            batch_lines = []
             for email_data in emails:
-                print(f"\nProcessing email: {email_data['subject']}")
-                
-                # Check if it's a reply and get thread history
                 is_reply = email_data['subject'].lower().startswith('re:')
+                email_data['is_reply'] = is_reply
+                if email_data['classification']['category'] != EmailCategory.LEGITIMATE.value:
+                    continue
                 if is_reply:
-                    print("Email is a reply - checking thread history...")
                     thread_history = await self.get_thread_history(email_data)
                     if thread_history:
                         email_data['thread_history'] = thread_history
-                        print("Found existing thread history")
-                    else:
-                        print("No thread history found")
-                
-                # Classify email
-                print("Classifying email...")
-                classification = await classify_email(email_data)
-                email_data['classification'] = classification.dict()
-                print(f"Classification result: {classification.category}")
                 
-                # Process email based on classification
-                print("Processing based on classification...")
-                success = await self.process_and_store_response(
-                    email_data=email_data,
-                    classification=classification,
-                    is_reply=is_reply
-                )
+                thread_content, _ = self._build_reply_context(email_data, is_reply)
+                batch_lines.append(build_batch_line(
+                    custom_id=f"email-{email_data['uid']}",
+                    model=tier.model,
+                    messages=self.ai_client.build_reply_messages(thread_content, email_data),
+                    temperature=self.ai_client.temperature
+                ))
+            
+            results: Dict[str, Optional[str]] = {}
+            if batch_lines:
+                print(f"Submitting {len(batch_lines)} replies as a batch job...")
+                job_path = write_batch_file(batch_lines)
+                try:
+                    batch_id = await submit_batch(batch_client, job_path)
+                finally:
+                    # The endpoint has its own copy now; the prompts hold guest mail
+                    os.remove(job_path)
+                try:
+                    batch = await wait_for_batch(batch_client, batch_id, poll_interval, timeout)
+                    results = await fetch_batch_results(batch_client, batch)
+                except BatchError as e:
+                    # Leave the whole backlog for staff rather than dropping it
+                    print(f"Batch failed, flagging legitimate emails for human attention: {str(e)}")
+            
+            processed_emails = []
+            for email_data in emails:
+                classification = EmailClassification(**email_data['classification'])
+                if classification.category != EmailCategory.LEGITIMATE:
+                    success = await self.process_and_store_response(email_data, classification)
+                else:
+                    raw_content = results.get(f"email-{email_data['uid']}")
+                    if raw_content is None:
+                        success = await self.flag_for_human_attention(
+                            email_id=email_data['id'],
+                            reason="No AI response from batch job",
+                            body_text=self._notice_body(email_data),
+                            uid=email_data.get('uid'),
+                            uidvalidity=email_data.get('uidvalidity')
+                        )
+                        success = self.index_filed_email(success, email_data, EmailCategory.REQUIRES_HUMAN.value)
+                    else:
+                        content, self_confidence = parse_structured_reply(raw_content)
+                        ai_response = build_ai_response(content, self_confidence, model=tier.model)
+                        success = await self.send_and_store_reply(email_data, ai_response, email_data['is_reply'])
                 
                 if success:
                     processed_emails.append(email_data)
-                    print(f"Successfully processed email: {email_data['subject']} -> {classification.category.value}")
                 else:
                     print(f"Failed to process email: {email_data['subject']}")
             
+            print(f"Backlog run processed {len(processed_emails)} of {len(emails)} emails")
             return processed_emails
             
         except Exception as e:
-            print(f"Error processing emails: {str(e)}")
+            print(f"Error processing backlog: {str(e)}")
             raise
 
     async def get_thread_history(self, email_data: Dict) -> Optional[str]:
         """Retrieve the thread history from the Legitimate folder."""
+        indexed = self._indexed_thread_history(email_data)
+        if indexed is not None:
+            return indexed
+        return await self._imap_thread_history(email_data)
+
+    def _indexed_thread_history(self, email_data: Dict) -> Optional[str]:
+        # Threads the agent filed itself are in the local index; no server SEARCH needed
         try:
-            mail = await self.connect_imap()
+            indexed = self.search_index.latest_in_thread(
+                email_data, folder_for_category(EmailCategory.LEGITIMATE.value)
+            )
+            if indexed is not None:
+                print("Found thread history in local search index")
+            return indexed
+        except Exception as e:
+            print(f"Error reading search index, falling back to IMAP: {str(e)}")
+            return None
+
+    async def _imap_thread_history(self, email_data: Dict) -> Optional[str]:
+        # imaplib blocks; in a thread, other work (e.g. a speculative reply) keeps running
+        return await asyncio.get_running_loop().run_in_executor(None, self._search_thread_history, email_data)
+
+    def _search_thread_history(self, email_data: Dict) -> Optional[str]:
+        try:
+            mail = self._open_imap()
             
             # Construct Legitimate folder path
-            _, list_response = mail.list()
-            delimiter = '/'
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
+            delimiter = get_folder_delimiter(mail)
             
             legitimate_folder = f'"AI_Processed{delimiter}Legitimate"'
             print(f"Searching for thread history in {legitimate_folder}")
@@ -724,27 +1246,21 @@ class EmailClient:
             
             # Try to find the thread using subject
             try:
-                _, messages = mail.search(None, f'SUBJECT "{search_subject}"')
+                _, messages = mail.uid('SEARCH', None, f'SUBJECT "{search_subject}"')
                 if messages[0]:
-                    msg_ids = messages[0].split()
-                    if msg_ids:
-                        # Get the latest message in the thread
-                        latest_id = msg_ids[-1]
-                        _, msg_data = mail.fetch(latest_id, '(RFC822)')
-                        thread_message = email.message_from_bytes(msg_data[0][1])
+                    msg_uids = messages[0].split()
+                    if msg_uids:
+                        # Get the latest message in the thread, parsed once per UID
+                        latest_uid = int(msg_uids[-1])
+                        folder = folder_for_category(EmailCategory.LEGITIMATE.value)
+                        uidvalidity = get_uidvalidity(mail)
+                        thread_message = self._cached_message(folder, uidvalidity, latest_uid)
+                        if thread_message is None:
+                            _, msg_data = mail.uid('FETCH', str(latest_uid), '(BODY.PEEK[])')
+                            thread_message = parse_message(msg_data[0][1])
+                            self._cache_message(folder, uidvalidity, latest_uid, thread_message)
                         print(f"Found thread with subject: {thread_message['subject']}")
-                        
-                        # Extract the content
-                        if thread_message.is_multipart():
-                            for part in thread_message.walk():
-                                if part.get_content_type() == "text/plain":
-                                    content = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                                    print("Found thread content in multipart message")
-                                    return content
-                        else:
-                            content = thread_message.get_payload(decode=True).decode('utf-8', errors='replace')
-                            print("Found thread content in single part message")
-                            return content
+                        return thread_message['body']
             
             except Exception as e:
                 print(f"Error searching by subject: {str(e)}")
@@ -777,62 +1293,61 @@ class EmailClient:
             print(f"Error getting email flags: {str(e)}")
             return []
 
-    async def flag_for_human_attention(self, email_id: str, reason: str) -> bool:
-        """Flag an email for human attention with specific flags and status."""
+    @staticmethod
+    def _notice_body(email_data: Dict) -> Optional[str]:
+        """The body to quote in a Requires_Human notice; None when only headers were fetched."""
+        return None if email_data.get('prefiltered') else email_data.get('body')
+
+    async def flag_for_human_attention(self, email_id: str, reason: str, body_text: Optional[str] = None,
+                                       uid: Optional[int] = None, uidvalidity: Optional[int] = None) -> bool:
+        """Flag an email for human attention with specific flags and status.
+        
+        The original message (with its attachments) is attached unchanged;
+        large messages stay spooled on disk from fetch to APPEND. Given its
+        INBOX UID, a small original is taken from the message cache instead.
+        """
         try:
+            uid = self._require_uid(email_id, uid)
             mail = await self.connect_imap()
             mail.select('"INBOX"')
             
             # Get the delimiter
-            _, list_response = mail.list()
-            delimiter = '/'
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
+            delimiter = get_folder_delimiter(mail)
             
             # Construct folder path
             folder = f'"AI_Processed{delimiter}Requires_Human"'
             
-            # Get original message to preserve headers
-            _, msg_data = mail.fetch(email_id, '(RFC822)')
-            original_email = email.message_from_bytes(msg_data[0][1])
-            
-            # Create message with human attention flags
-            msg = MIMEMultipart()
-            msg['From'] = original_email['From']
-            msg['To'] = original_email['To']
-            msg['Subject'] = original_email['Subject']
-            msg['Date'] = original_email['Date']
-            msg['Message-ID'] = original_email['Message-ID']
-            
             # Add reason for human attention at the top
-            original_content = original_email.get_payload()
             combined_content = (
                 f"[REQUIRES HUMAN ATTENTION]\n"
                 f"Reason: {reason}\n"
                 f"{'-' * 60}\n\n"
-                f"{original_content}"
+                f"{body_text if body_text is not None else 'See the attached original message.'}"
             )
             
-            msg.attach(MIMEText(combined_content, 'plain'))
-            
-            # Move to Requires Human folder with specific flags
-            append_result = mail.append(
-                folder,
-                '(\\Flagged \\Seen $Requires_Human)',
-                None,
-                msg.as_bytes()
+            raw = self._cached_message("INBOX", uidvalidity, uid, raw=True)
+            original = (
+                SpooledMessage(data=raw, uid=uid) if raw is not None
+                else fetch_spooled(mail, str(uid), use_uid=True)
             )
+            with original:
+                subject = original.headers().get('Subject', '')
+                # The reason also goes in a header so the review queue can list it with one FETCH
+                with build_flagged_message(
+                    original, combined_content, extra_headers={REVIEW_REASON_HEADER: reason}
+                ) as msg:
+                    # Move to Requires Human folder with specific flags
+                    append_result = append_message(
+                        mail,
+                        folder,
+                        '(\\Flagged \\Seen $Requires_Human)',
+                        msg
+                    )
             
             if append_result[0] == 'OK':
                 # Remove from inbox
-                mail.store(email_id, '+FLAGS', '(\\Deleted)')
-                mail.expunge()
-                print(f"Email flagged for human attention: {msg['Subject']}")
+                delete_uids(mail, [uid])
+                print(f"Email flagged for human attention: {subject}")
                 return True
                 
             return False
@@ -842,39 +1357,21 @@ class EmailClient:
             return False
 
     async def mark_human_response_complete(self, email_id: str) -> bool:
-        """Mark an email as handled by human staff."""
+        """Mark an email (sequence number in Requires_Human) as handled by human staff."""
         try:
-            mail = await self.connect_imap()
-            mail.select('"AI_Processed/Requires_Human"')
+            folder = await self.ai_folder("Requires_Human")
             
-            # Mark as completed and move to Completed folder
-            mail.store(email_id, '+FLAGS', '(\\Answered $Human_Handled)')
+            def find_uid(mail):
+                mail.select(quote_folder(folder))
+                _, msg_data = mail.fetch(email_id, '(UID)')
+                match = re.search(rb'UID (\d+)', msg_data[0] if msg_data and msg_data[0] else b'')
+                return int(match.group(1)) if match else None
             
-            # Optional: Move to a "Completed" subfolder
-            _, list_response = mail.list()
-            delimiter = '/'
-            for folder_info in list_response:
-                if folder_info:
-                    folder_str = folder_info.decode()
-                    delimiter_match = re.search(r'"(.)"', folder_str)
-                    if delimiter_match:
-                        delimiter = delimiter_match.group(1)
-                        break
-            
-            completed_folder = f'"AI_Processed{delimiter}Completed"'
-            
-            # Create Completed folder if it doesn't exist
-            try:
-                mail.create(completed_folder)
-            except imaplib.IMAP4.error:
-                pass
-            
-            # Move to Completed folder
-            mail.copy(email_id, completed_folder)
-            mail.store(email_id, '+FLAGS', '(\\Deleted)')
-            mail.expunge()
-            
-            return True
+            uid = await self._run_read(find_uid)
+            if uid is None:
+                return False
+            result = await self.complete_reviews([uid])
+            return bool(result['uids'])
             
         except Exception as e:
             print(f"Error marking as complete: {str(e)}")
@@ -902,9 +1399,231 @@ class EmailClient:
                 return False
             
             # Store the message
-            append_result = mail.append(sent_folder, '(\\Seen)', None, msg.as_bytes())
+            append_result = append_message(mail, sent_folder, '(\\Seen)', SpooledMessage(data=msg.as_bytes()))
             return append_result[0] == 'OK'
             
         except Exception as e:
             print(f"Error storing sent email: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    async def close(self) -> None:
+        """Log out of the shared read connection and stop the parse pool."""
+        self.parse_stage.shutdown()
+        if self._read_mail is None:
+            return
+        try:
+            self._read_mail.logout()
+        except Exception:
+            pass
+        self._read_mail = None
+
+    async def _run_read(self, func, *args):
+        """Run a blocking read on the shared IMAP connection off the event loop.
+        
+        Calls are serialized on one connection; a dropped connection is
+        reopened once. Changes go through _run_write instead.
+        """
+        if self._read_lock is None:
+            self._read_lock = asyncio.Lock()
+        async with self._read_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._call_on_read_connection, func, args)
+
+    def _call_on_read_connection(self, func, args):
+        for attempt in range(2):
+            try:
+                if self._read_mail is None:
+                    self._read_mail = self._open_imap()
+                    self._delimiter = get_folder_delimiter(self._read_mail)
+                return func(self._read_mail, *args)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                print(f"Read connection lost, reconnecting: {str(e)}")
+                self._read_mail = None
+                if attempt:
+                    raise EmailClientError(f"IMAP connection failed: {str(e)}")
+            except imaplib.IMAP4.error as e:
+                raise EmailClientError(str(e))
+
+    async def _run_write(self, func, *args):
+        """Run a blocking mailbox change off the event loop on its own connection.
+        
+        Like the processing paths, each change opens and logs out a write
+        connection, so bulk updates neither queue behind API reads nor share
+        the read connection's selected folder.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self._call_on_write_connection, func, args)
+
+    def _call_on_write_connection(self, func, args):
+        try:
+            mail = self._open_imap()
+        except (imaplib.IMAP4.error, OSError) as e:
+            raise EmailClientError(f"IMAP connection failed: {str(e)}")
+        try:
+            return func(mail, *args)
+        except imaplib.IMAP4.error as e:
+            raise EmailClientError(str(e))
+        finally:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+    async def ai_folder(self, name: str) -> str:
+        """Full path of an AI_Processed subfolder using the server delimiter."""
+        if self._delimiter is None:
+            await self._run_read(lambda mail: None)
+        return f"AI_Processed{self._delimiter}{name}"
+
+    async def list_folders(self) -> List[Dict]:
+        """List all folders with their delimiter and flags."""
+        def list_all(mail):
+            _, list_response = mail.list()
+            return parse_list_response(list_response or [])
+        return await self._run_read(list_all)
+
+    @staticmethod
+    def parse_cursor(cursor: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+        """Split a ``<uidvalidity>:<uid>`` page cursor; (None, None) for the first page."""
+        if not cursor:
+            return None, None
+        try:
+            cursor_validity, before_uid = (int(part) for part in cursor.split(':', 1))
+        except ValueError:
+            raise InvalidCursorError(f"Invalid cursor: {cursor}")
+        return cursor_validity, before_uid
+
+    async def list_messages(self, folder: str, cursor: Optional[str] = None, limit: int = 50) -> Dict:
+        """Return one page of header-only summaries, newest first.
+        
+        ``cursor`` is the ``next_cursor`` of the previous page, formatted as
+        ``<uidvalidity>:<uid>``; the page holds messages with a lower UID.
+        """
+        cursor_validity, before_uid = self.parse_cursor(cursor)
+        return await self._run_read(self._fetch_message_page, folder, before_uid, cursor_validity, limit)
+
+    async def list_review_queue(self, cursor: Optional[str] = None, limit: int = 50) -> Dict:
+        """Page through Requires_Human with flags, reason and assignee from a single FETCH."""
+        cursor_validity, before_uid = self.parse_cursor(cursor)
+        folder = await self.ai_folder("Requires_Human")
+        return await self._run_read(
+            self._fetch_message_page, folder, before_uid, cursor_validity, limit,
+            REVIEW_HEADER_FIELDS, parse_review_summary
+        )
+
+    def _fetch_message_page(self, mail: imaplib.IMAP4_SSL, folder: str, before_uid: Optional[int],
+                            cursor_validity: Optional[int], limit: int,
+                            header_fields: str = HEADER_FIELDS, summarize=parse_header_summary) -> Dict:
+        typ, _ = mail.select(quote_folder(folder), readonly=True)
+        if typ != 'OK':
+            raise EmailClientError(f"Could not select folder {folder}")
+        uidvalidity = get_uidvalidity(mail)
+        page = {"folder": folder, "uidvalidity": uidvalidity, "messages": [], "next_cursor": None}
+        
+        if cursor_validity is not None and cursor_validity != uidvalidity:
+            raise StaleCursorError(f"Stale cursor: UIDVALIDITY of {folder} changed")
+        
+        # Only this page's UIDs come back from the server, not the folder's whole UID list
+        page_uids, more = search_uids_before(mail, before_uid, limit, build_search_criteria())
+        if not page_uids:
+            return page
+        
+        _, msg_data = mail.uid(
+            'FETCH', format_uid_set(page_uids),
+            f'(UID FLAGS RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({header_fields})])'
+        )
+        messages = [summarize(item, folder) for item in parse_fetch_items(msg_data)]
+        messages.sort(key=lambda message: message['uid'], reverse=True)
+        
+        page['messages'] = messages
+        if more and messages:
+            page['next_cursor'] = f"{uidvalidity}:{messages[-1]['uid']}"
+        return page
+
+    async def iter_messages(self, folder: str, cursor: Optional[str] = None,
+                            limit: Optional[int] = None, page_size: int = 100) -> AsyncIterator[Dict]:
+        """Yield header-only summaries page by page so callers can stream them."""
+        remaining = limit
+        while True:
+            size = page_size if remaining is None else min(page_size, remaining)
+            if size <= 0:
+                return
+            page = await self.list_messages(folder, cursor=cursor, limit=size)
+            for message in page['messages']:
+                yield message
+            if remaining is not None:
+                remaining -= len(page['messages'])
+            cursor = page['next_cursor']
+            if not cursor:
+                return
+
+    async def complete_reviews(self, uids: List[int]) -> Dict:
+        """Mark review items handled and move them to AI_Processed/Completed in one batch."""
+        folder = await self.ai_folder("Requires_Human")
+        completed = await self.ai_folder("Completed")
+        
+        def complete(mail, found, flags):
+            mail.uid('STORE', format_uid_set(found), '+FLAGS.SILENT', f'(\\Answered {HUMAN_HANDLED_KEYWORD})')
+            self._ensure_folder(mail, completed)
+            move_uids(mail, found, completed)
+        
+        return await self._run_write(self._apply_to_review_items, folder, uids, complete, "complete")
+
+    async def reassign_reviews(self, uids: List[int], staff: str) -> Dict:
+        """Assign review items to a staff member, replacing any previous assignee."""
+        keyword = assignee_keyword(staff)
+        folder = await self.ai_folder("Requires_Human")
+        
+        def reassign(mail, found, flags):
+            self._clear_assignees(mail, found, flags, keep=keyword)
+            mail.uid('STORE', format_uid_set(found), '+FLAGS.SILENT', f'({keyword})')
+        
+        return await self._run_write(self._apply_to_review_items, folder, uids, reassign, "reassign")
+
+    async def release_reviews(self, uids: List[int]) -> Dict:
+        """Drop the assignee from review items so anyone can pick them up."""
+        folder = await self.ai_folder("Requires_Human")
+        
+        def release(mail, found, flags):
+            self._clear_assignees(mail, found, flags)
+        
+        return await self._run_write(self._apply_to_review_items, folder, uids, release, "release")
+
+    def _apply_to_review_items(self, mail: imaplib.IMAP4_SSL, folder: str, uids: List[int],
+                               action, name: str) -> Dict:
+        """Look up which UIDs still exist (one FETCH) and apply a batched action to them."""
+        typ, _ = mail.select(quote_folder(folder))
+        if typ != 'OK':
+            raise EmailClientError(f"Could not select folder {folder}")
+        result = {"action": name, "uids": [], "not_found": sorted(set(uids))}
+        if not uids:
+            return result
+        
+        _, msg_data = mail.uid('FETCH', format_uid_set(uids), '(UID FLAGS)')
+        flags = parse_fetch_flags(msg_data)
+        found = sorted(uid for uid in set(uids) if uid in flags)
+        if found:
+            action(mail, found, flags)
+        result["uids"] = found
+        result["not_found"] = sorted(set(uids) - set(found))
+        return result
+
+    def _clear_assignees(self, mail: imaplib.IMAP4_SSL, uids: List[int], flags: Dict[int, List[str]],
+                         keep: Optional[str] = None) -> None:
+        # One STORE per distinct keyword rather than per message
+        by_keyword: Dict[str, List[int]] = {}
+        for uid in uids:
+            for flag in flags.get(uid, []):
+                if flag.startswith(ASSIGNEE_KEYWORD_PREFIX) and flag != keep:
+                    by_keyword.setdefault(flag, []).append(uid)
+        for keyword, keyword_uids in by_keyword.items():
+            mail.uid('STORE', format_uid_set(keyword_uids), '-FLAGS.SILENT', f'({keyword})')
+
+    def _ensure_folder(self, mail: imaplib.IMAP4_SSL, folder: str) -> None:
+        """CREATE a folder once per client instead of on every call."""
+        if folder in self._known_folders:
+            return
+        try:
+            mail.create(quote_folder(folder))
+        except imaplib.IMAP4.error:
+            pass
+        self._known_folders.add(folder)
@@ -0,0 +1,90 @@
+import os
+import re
+from email.message import Message
+from email.utils import parseaddr
+from typing import List, Optional
+
+from app.schemas.email_schemas import EmailCategory, EmailClassification
+
+PREFILTER_HEADER_FIELDS = (
+    "FROM TO SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES AUTO-SUBMITTED PRECEDENCE "
+    "LIST-ID LIST-UNSUBSCRIBE RETURN-PATH X-AUTOREPLY X-AUTORESPOND X-AUTO-RESPONSE-SUPPRESS"
+)
+
+# Message-ID marker on replies the agent sends, so replies to them can be recognized
+AGENT_MESSAGE_ID_MARKER = "mail-agent"
+
+BOUNCE_LOCAL_PARTS = {'mailer-daemon', 'postmaster'}
+AUTO_REPLY_SUBJECT_RE = re.compile(
+    r'^\s*(automatic reply|auto(matic)?[- ]?(reply|response)|out of (the )?office|auto:|autosvar|'
+    r'abwesenheitsnotiz|afwezigheidsbericht|r[ée]ponse automatique|undeliverable|'
+    r'delivery status notification|mail delivery failed)',
+    re.IGNORECASE
+)
+
+def get_platform_senders() -> List[str]:
+    """Sender addresses, domains (@example.com) or local parts (noreply@) of automated platforms."""
+    default = "noreply@,no-reply@,donotreply@,do-not-reply@,notifications@"
+    return [s.strip().lower() for s in os.getenv('PREFILTER_PLATFORM_SENDERS', default).split(',') if s.strip()]
+
+def get_max_agent_replies() -> int:
+    return int(os.getenv('PREFILTER_MAX_AGENT_REPLIES', 3))
+
+def _matches_sender(address: str, patterns: List[str]) -> bool:
+    local = address.partition('@')[0]
+    for pattern in patterns:
+        if pattern.startswith('@') and address.endswith(pattern):
+            return True
+        if pattern.endswith('@') and f"{local}@" == pattern:
+            return True
+        if pattern == address:
+            return True
+    return False
+
+def count_agent_replies(headers: Message) -> int:
+    """How many of the agent's own replies this message's thread already contains."""
+    chain = f"{headers.get('References', '')} {headers.get('In-Reply-To', '')}"
+    return len(set(re.findall(rf'<[^>]*{AGENT_MESSAGE_ID_MARKER}[^>]*>', chain)))
+
+def _automated(reason: str) -> EmailClassification:
+    return EmailClassification(category=EmailCategory.AUTOMATED, confidence=0.95, reason=reason)
+
+def prefilter_headers(headers: Message, own_address: Optional[str] = None) -> Optional[EmailClassification]:
+    """Classify from headers alone, or None when the body classifier must decide.
+
+    Catches mail that must never get a generated reply (auto-replies,
+    bounces, platform notifications, our own messages) and bulk/list mail,
+    before the body is downloaded.
+    """
+    sender = parseaddr(headers.get('From', ''))[1].lower()
+    return_path = headers.get('Return-Path')
+
+    if own_address and sender == own_address.lower():
+        return _automated("Sent from this mailbox")
+    if (return_path is not None and return_path.strip() == '<>') or sender.split('@')[0] in BOUNCE_LOCAL_PARTS:
+        return _automated("Bounce or delivery status notification")
+
+    auto_submitted = headers.get('Auto-Submitted', '').strip().lower()
+    precedence = headers.get('Precedence', '').strip().lower()
+    if (auto_submitted and auto_submitted != 'no') or precedence == 'auto_reply' \
+            or headers.get('X-Autoreply') or headers.get('X-Autorespond'):
+        return _automated(f"Auto-submitted message ({auto_submitted or precedence or 'X-Autoreply'})")
+
+    if precedence in ('bulk', 'list', 'junk') or headers.get('List-Id') or headers.get('List-Unsubscribe'):
+        return EmailClassification(
+            category=EmailCategory.NEWSLETTER, confidence=0.9,
+            reason=f"Mailing list or bulk mail ({'List-Id' if headers.get('List-Id') else precedence or 'List-Unsubscribe'})"
+        )
+
+    if AUTO_REPLY_SUBJECT_RE.match(headers.get('Subject', '') or ''):
+        return _automated("Auto-reply subject")
+    if sender and _matches_sender(sender, get_platform_senders()):
+        return _automated(f"Automated platform sender {sender}")
+
+    # A thread where the agent already answered several times is likely a loop with another bot
+    if count_agent_replies(headers) >= get_max_agent_replies():
+        return EmailClassification(
+            category=EmailCategory.REQUIRES_HUMAN, confidence=0.8,
+            reason="Long exchange with the agent, possible auto-responder loop"
+        )
+    return None
@@ -0,0 +1,197 @@
+import imaplib
+import os
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional, Union
+
+from app.services.imap_utils import run_command
+from app.services.traffic_recorder import IMAPRecording, get_traffic_recorder
+
+# imaplib knows no COMPRESS command (RFC 4978); it is valid once authenticated
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+CRLF = b'\r\n'
+# LITERAL- (RFC 7888) only allows non-synchronizing literals up to 4096 bytes
+LITERAL_MINUS_MAX = 4096
+
+def is_compression_enabled() -> bool:
+    return os.getenv('IMAP_COMPRESS', 'true').lower() in ('1', 'true', 'yes')
+
+def get_compression_level() -> int:
+    return int(os.getenv('IMAP_COMPRESS_LEVEL', zlib.Z_DEFAULT_COMPRESSION))
+
+def is_literal_plus_enabled() -> bool:
+    return os.getenv('IMAP_LITERAL_PLUS', 'true').lower() in ('1', 'true', 'yes')
+
+class TransportStats:
+    """Bytes before and after compression, per direction, summed over connections."""
+
+    def __init__(self):
+        self.connections = 0
+        self.compressed_connections = 0
+        self.literal_plus_appends = 0
+        self.bytes_in = 0
+        self.wire_bytes_in = 0
+        self.bytes_out = 0
+        self.wire_bytes_out = 0
+
+    def record_in(self, raw: int, wire: int) -> None:
+        self.bytes_in += raw
+        self.wire_bytes_in += wire
+
+    def record_out(self, raw: int, wire: int) -> None:
+        self.bytes_out += raw
+        self.wire_bytes_out += wire
+
+    def summary(self) -> Dict:
+        return {
+            "connections": self.connections,
+            "compressed_connections": self.compressed_connections,
+            "literal_plus_appends": self.literal_plus_appends,
+            "bytes_in": self.bytes_in,
+            "wire_bytes_in": self.wire_bytes_in,
+            "bytes_out": self.bytes_out,
+            "wire_bytes_out": self.wire_bytes_out,
+            # Wire bytes per payload byte; below 1.0 means compression is saving bandwidth
+            "ratio_in": round(self.wire_bytes_in / self.bytes_in, 3) if self.bytes_in else None,
+            "ratio_out": round(self.wire_bytes_out / self.bytes_out, 3) if self.bytes_out else None,
+        }
+
+@lru_cache()
+def get_transport_stats() -> TransportStats:
+    """IMAP transport totals for this process."""
+    return TransportStats()
+
+class TransportMixin:
+    """COMPRESS=DEFLATE, LITERAL+ APPEND and byte accounting for an imaplib connection.
+
+    Overrides the send/read/readline hooks imaplib does all its I/O
+    through; until enable_compression() succeeds they pass bytes through
+    unchanged and only count them. With TRAFFIC_RECORD_PATH set, the
+    uncompressed traffic is also recorded (scrubbed) for replay.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Set before imaplib's __init__, which already reads the greeting
+        self._deflater = None
+        self._inflater = None
+        self._inbuf = bytearray()
+        self.stats = TransportStats()
+        self.stats.connections = 1
+        get_transport_stats().connections += 1
+        recorder = get_traffic_recorder()
+        self.recording = IMAPRecording(recorder) if recorder else None
+        super().__init__(*args, **kwargs)
+
+    def _record_in(self, raw: int, wire: int) -> None:
+        self.stats.record_in(raw, wire)
+        get_transport_stats().record_in(raw, wire)
+
+    def _record_out(self, raw: int, wire: int) -> None:
+        self.stats.record_out(raw, wire)
+        get_transport_stats().record_out(raw, wire)
+
+    def refresh_capabilities(self) -> None:
+        """Re-read capabilities after login; servers often add extensions (COMPRESS, ESEARCH) then."""
+        data = self.untagged_responses.pop('CAPABILITY', None)
+        if not data or data[-1] is None:
+            _, data = self.capability()
+        self.capabilities = tuple(data[-1].decode().upper().split())
+
+    def enable_compression(self) -> bool:
+        """Negotiate COMPRESS=DEFLATE if the server offers it; True once active."""
+        if self._deflater is not None:
+            return True
+        if 'COMPRESS=DEFLATE' not in self.capabilities:
+            return False
+        typ, _ = run_command(self, 'COMPRESS', 'DEFLATE')
+        if typ != 'OK':
+            return False
+        # Raw deflate (no zlib header) in both directions, as RFC 4978 requires
+        self._deflater = zlib.compressobj(get_compression_level(), zlib.DEFLATED, -15)
+        self._inflater = zlib.decompressobj(-15)
+        self.stats.compressed_connections = 1
+        get_transport_stats().compressed_connections += 1
+        return True
+
+    def send(self, data) -> None:
+        if self.recording:
+            self.recording.sent(data)
+        if self._deflater is None:
+            super().send(data)
+            self._record_out(len(data), len(data))
+            return
+        # Sync-flush every write so the server can act on it without waiting for more
+        wire = self._deflater.compress(data) + self._deflater.flush(zlib.Z_SYNC_FLUSH)
+        self.sock.sendall(wire)
+        self._record_out(len(data), len(wire))
+
+    def _fill(self) -> None:
+        chunk = self.file.read1(65536)
+        if not chunk:
+            raise self.abort('socket closed while reading compressed stream')
+        inflated = self._inflater.decompress(chunk)
+        self._inbuf += inflated
+        self._record_in(len(inflated), len(chunk))
+
+    def readline(self) -> bytes:
+        if self._inflater is None:
+            line = super().readline()
+            self._record_in(len(line), len(line))
+        else:
+            while b'\n' not in self._inbuf:
+                if len(self._inbuf) > imaplib._MAXLINE:
+                    raise self.error("got more than %d bytes" % imaplib._MAXLINE)
+                self._fill()
+            end = self._inbuf.index(b'\n') + 1
+            line = bytes(self._inbuf[:end])
+            del self._inbuf[:end]
+        if self.recording:
+            self.recording.received_line(line)
+        return line
+
+    def read(self, size: int) -> bytes:
+        if self._inflater is None:
+            data = super().read(size)
+            self._record_in(len(data), len(data))
+        else:
+            while len(self._inbuf) < size:
+                self._fill()
+            data = bytes(self._inbuf[:size])
+            del self._inbuf[:size]
+        if self.recording:
+            # imaplib only calls read() for literals
+            self.recording.received_literal(data)
+        return data
+
+    def supports_literal_plus(self, size: int) -> bool:
+        if not is_literal_plus_enabled() or getattr(self, 'utf8_enabled', False):
+            return False
+        return 'LITERAL+' in self.capabilities or ('LITERAL-' in self.capabilities and size <= LITERAL_MINUS_MAX)
+
+    def append_literal_plus(self, mailbox: str, flags: Optional[str],
+                            message: Union[bytes, memoryview]):
+        """APPEND with a non-synchronizing literal: no wait for the server's "+" continuation.
+
+        ``message`` must already use CRLF line endings.
+        """
+        if self.state not in imaplib.Commands['APPEND']:
+            raise self.error(f"command APPEND illegal in state {self.state}")
+        for typ in ('OK', 'NO', 'BAD'):
+            self.untagged_responses.pop(typ, None)
+        tag = self._new_tag()
+        line = tag + b' APPEND ' + mailbox.encode()
+        if flags:
+            line += b' ' + flags.encode()
+        self.send(line + f' {{{len(message)}+}}'.encode() + CRLF)
+        self.send(message)
+        self.send(CRLF)
+        self.stats.literal_plus_appends += 1
+        get_transport_stats().literal_plus_appends += 1
+        return self._command_complete('APPEND', tag)
+
+class IMAPConnection(TransportMixin, imaplib.IMAP4_SSL):
+    """IMAP4_SSL with optional compression, LITERAL+ and transfer statistics."""
+
+class PlainIMAPConnection(TransportMixin, imaplib.IMAP4):
+    """Unencrypted variant, for a local replay server (EmailSettings.MAIL_TLS=false)."""
@@ -0,0 +1,395 @@
+import email
+import imaplib
+import re
+from datetime import date
+from email.header import decode_header
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LIST_RESPONSE_RE = re.compile(rb'\((?P<flags>[^)]*)\) (?:"(?P<delimiter>.)"|NIL) (?P<name>.+)')
+FETCH_UID_RE = re.compile(rb'UID (\d+)')
+FETCH_FLAGS_RE = re.compile(rb'FLAGS \(([^)]*)\)')
+FETCH_SIZE_RE = re.compile(rb'RFC822\.SIZE (\d+)')
+FETCH_SECTION_RE = re.compile(rb'(BODY\[[^\]]*\](?:<\d+>)?) \{\d+\}$')
+FETCH_START_RE = re.compile(rb'^(\d+) \(')
+ESEARCH_ITEM_RE = re.compile(rb'(COUNT|MAX|MIN|ALL|PARTIAL) (\([^)]*\)|\S+)')
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+HEADER_FIELDS = "FROM TO SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES"
+REVIEW_REASON_HEADER = "X-AI-Review-Reason"
+REVIEW_HEADER_FIELDS = f"{HEADER_FIELDS} {REVIEW_REASON_HEADER.upper()}"
+ASSIGNEE_KEYWORD_PREFIX = "$Assigned_"
+HUMAN_HANDLED_KEYWORD = "$Human_Handled"
+
+def decode_header_safe(header: Optional[str]) -> str:
+    """Decode an RFC 2047 header, replacing undecodable bytes."""
+    decoded = decode_header(header or "")
+    parts = []
+    for part, charset in decoded:
+        if isinstance(part, bytes):
+            try:
+                parts.append(part.decode(charset or 'utf-8', errors='replace'))
+            except (UnicodeDecodeError, LookupError):
+                parts.append(part.decode('utf-8', errors='replace'))
+        else:
+            parts.append(part)
+    return " ".join(parts)
+
+def parse_list_response(list_response: List[bytes]) -> List[Dict]:
+    """Parse LIST response lines into name, delimiter and flags."""
+    folders = []
+    for folder_info in list_response:
+        if not folder_info:
+            continue
+        match = LIST_RESPONSE_RE.match(folder_info)
+        if not match:
+            continue
+        name = match.group('name').decode(errors='replace').strip()
+        if name.startswith('"') and name.endswith('"'):
+            name = name[1:-1]
+        delimiter = match.group('delimiter')
+        folders.append({
+            "name": name,
+            "delimiter": delimiter.decode() if delimiter else None,
+            "flags": match.group('flags').decode().split()
+        })
+    return folders
+
+def get_folder_delimiter(mail: imaplib.IMAP4) -> str:
+    """Return the server's hierarchy delimiter, defaulting to '/'."""
+    _, list_response = mail.list('""', '""')
+    for folder in parse_list_response(list_response or []):
+        if folder['delimiter']:
+            return folder['delimiter']
+    return '/'
+
+def quote_folder(folder: str) -> str:
+    return folder if folder.startswith('"') else f'"{folder}"'
+
+def get_uidvalidity(mail: imaplib.IMAP4) -> Optional[int]:
+    """UIDVALIDITY of the currently selected folder."""
+    _, data = mail.response('UIDVALIDITY')
+    if data and data[0]:
+        return int(data[0])
+    return None
+
+def get_uidnext(mail: imaplib.IMAP4) -> Optional[int]:
+    """UIDNEXT of the currently selected folder, if the server reported it on SELECT."""
+    _, data = mail.response('UIDNEXT')
+    if data and data[0]:
+        return int(data[0])
+    return None
+
+def parse_fetch_items(msg_data: List) -> List[Dict]:
+    """Split a UID FETCH response into per-message metadata and literal payload."""
+    items = []
+    for entry in msg_data or []:
+        if not isinstance(entry, tuple):
+            continue
+        meta, payload = entry[0], entry[1]
+        uid_match = FETCH_UID_RE.search(meta)
+        if not uid_match:
+            continue
+        flags_match = FETCH_FLAGS_RE.search(meta)
+        size_match = FETCH_SIZE_RE.search(meta)
+        items.append({
+            "uid": int(uid_match.group(1)),
+            "flags": flags_match.group(1).decode().split() if flags_match else [],
+            "size": int(size_match.group(1)) if size_match else None,
+            "payload": payload
+        })
+    return items
+
+def parse_fetch_sections(msg_data: List) -> List[Dict]:
+    """Group a FETCH response with several literals per message (e.g. header and text).
+
+    Returns seq (the message sequence number), uid, flags and ``sections`` mapping the section name (``BODY[TEXT]<0>``,
+    ``BODY[HEADER.FIELDS (...)]``) to its bytes.
+    """
+    items: List[Dict] = []
+    for entry in msg_data or []:
+        meta = entry[0] if isinstance(entry, tuple) else entry
+        if not meta:
+            continue
+        start_match = FETCH_START_RE.match(meta)
+        if start_match or not items:
+            items.append({"seq": int(start_match.group(1)) if start_match else None,
+                          "uid": None, "flags": [], "sections": {}})
+        item = items[-1]
+        uid_match = FETCH_UID_RE.search(meta)
+        if uid_match:
+            item['uid'] = int(uid_match.group(1))
+        flags_match = FETCH_FLAGS_RE.search(meta)
+        if flags_match:
+            item['flags'] = flags_match.group(1).decode().split()
+        section_match = FETCH_SECTION_RE.search(meta)
+        if isinstance(entry, tuple) and section_match:
+            item['sections'][section_match.group(1).decode()] = entry[1]
+    return [item for item in items if item['uid'] is not None]
+
+def parse_fetch_flags(msg_data: List) -> Dict[int, List[str]]:
+    """Map UID to flags from a FETCH (UID FLAGS) response."""
+    flags_by_uid = {}
+    for entry in msg_data or []:
+        meta = entry[0] if isinstance(entry, tuple) else entry
+        uid_match = FETCH_UID_RE.search(meta or b"")
+        if uid_match:
+            flags_match = FETCH_FLAGS_RE.search(meta)
+            flags_by_uid[int(uid_match.group(1))] = flags_match.group(1).decode().split() if flags_match else []
+    return flags_by_uid
+
+def parse_header_summary(item: Dict, folder: str) -> Dict:
+    """Build a header-only message summary from a parsed FETCH item."""
+    headers = email.message_from_bytes(item['payload'] or b"")
+    return {
+        "uid": item['uid'],
+        "folder": folder,
+        "subject": decode_header_safe(headers.get('Subject')),
+        "sender": decode_header_safe(headers.get('From')),
+        "to": decode_header_safe(headers.get('To')),
+        "date": headers.get('Date', ''),
+        "message_id": headers.get('Message-ID', ''),
+        "in_reply_to": headers.get('In-Reply-To', ''),
+        "flags": item['flags'],
+        "size": item['size']
+    }
+
+def assignee_keyword(staff: str) -> str:
+    """IMAP keyword recording who a review item is assigned to (atom-safe)."""
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', staff.strip())
+    if not name:
+        raise ValueError("Staff name is required")
+    return f"{ASSIGNEE_KEYWORD_PREFIX}{name}"
+
+def parse_review_summary(item: Dict, folder: str) -> Dict:
+    """Header summary of a review-queue message plus its reason and assignee."""
+    summary = parse_header_summary(item, folder)
+    headers = email.message_from_bytes(item['payload'] or b"")
+    assigned = [flag for flag in item['flags'] if flag.startswith(ASSIGNEE_KEYWORD_PREFIX)]
+    summary.update({
+        "reason": decode_header_safe(headers.get(REVIEW_REASON_HEADER)),
+        "assignee": assigned[0][len(ASSIGNEE_KEYWORD_PREFIX):] if assigned else None,
+        "handled": HUMAN_HANDLED_KEYWORD in item['flags']
+    })
+    return summary
+
+def format_uid_set(uids: Sequence[int]) -> str:
+    """Compact UID set for one command, e.g. [1, 2, 3, 7] -> '1:3,7'."""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(low) if low == high else f"{low}:{high}" for low, high in ranges)
+
+def move_uids(mail: imaplib.IMAP4, uids: Sequence[int], target: str) -> None:
+    """UID MOVE when supported, else COPY + \\Deleted + (UID) EXPUNGE, as one batch."""
+    uid_set = format_uid_set(uids)
+    capabilities = get_capabilities(mail)
+    if 'MOVE' in capabilities:
+        mail.uid('MOVE', uid_set, quote_folder(target))
+        return
+    uidplus = 'UIDPLUS' in capabilities
+    if not uidplus:
+        # Check before COPY, so a refusal leaves no copies behind
+        check_expunge_is_safe(mail, uids)
+    typ, _ = mail.uid('COPY', uid_set, quote_folder(target))
+    if typ != 'OK':
+        raise imaplib.IMAP4.error(f"Could not copy messages to {target}")
+    _expunge_uids(mail, uid_set, uidplus)
+
+def delete_uids(mail: imaplib.IMAP4, uids: Sequence[int]) -> None:
+    """Mark messages \\Deleted and expunge just those (UID EXPUNGE) when the server allows."""
+    uidplus = 'UIDPLUS' in get_capabilities(mail)
+    if not uidplus:
+        check_expunge_is_safe(mail, uids)
+    _expunge_uids(mail, format_uid_set(uids), uidplus)
+
+def _expunge_uids(mail: imaplib.IMAP4, uid_set: str, uidplus: bool) -> None:
+    mail.uid('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)')
+    if uidplus:
+        mail.uid('EXPUNGE', uid_set)
+    else:
+        mail.expunge()
+
+def check_expunge_is_safe(mail: imaplib.IMAP4, uids: Sequence[int]) -> None:
+    """Refuse a plain EXPUNGE that would also remove messages someone else marked \\Deleted.
+
+    Without UIDPLUS, EXPUNGE removes every \\Deleted message in the folder,
+    e.g. ones a mail client or another worker is still deciding about.
+    """
+    _, data = mail.uid('SEARCH', None, 'DELETED')
+    foreign = {int(uid) for uid in (data[0].split() if data and data[0] else [])} - set(uids)
+    if foreign:
+        raise imaplib.IMAP4.error(
+            f"Server has no UIDPLUS and {len(foreign)} other messages are marked \\Deleted; not expunging"
+        )
+
+def get_capabilities(mail: imaplib.IMAP4) -> set:
+    return {str(capability).upper() for capability in getattr(mail, 'capabilities', ())}
+
+def imap_date(day: date) -> str:
+    """Format a date for SEARCH SINCE/BEFORE (locale independent, e.g. 19-Oct-2026)."""
+    return f"{day.day}-{MONTHS[day.month - 1]}-{day.year}"
+
+def build_search_criteria(unseen: bool = False, since: Optional[date] = None) -> List[str]:
+    criteria = ['NOT', 'DELETED']
+    if unseen:
+        criteria.append('UNSEEN')
+    if since is not None:
+        criteria.extend(['SINCE', imap_date(since)])
+    return criteria
+
+def parse_sequence_set(sequence_set: bytes) -> List[bytes]:
+    """Expand '1:3,7' into ids, keeping the order (and range direction) the server used."""
+    ids = []
+    for part in sequence_set.split(b','):
+        if not part:
+            continue
+        if b':' in part:
+            low, high = (int(n) for n in part.split(b':', 1))
+            step = 1 if high >= low else -1
+            ids.extend(str(n).encode() for n in range(low, high + step, step))
+        else:
+            ids.append(part)
+    return ids
+
+def parse_esearch_response(data: Sequence[Optional[bytes]]) -> Dict:
+    """Parse untagged ESEARCH data (RFC 4731) into count, max and ids."""
+    result: Dict = {"count": None, "max": None, "ids": []}
+    for line in data or []:
+        if not line:
+            continue
+        for key, value in ESEARCH_ITEM_RE.findall(line):
+            if key == b'COUNT':
+                result['count'] = int(value)
+            elif key in (b'MAX', b'MIN'):
+                result[key.decode().lower()] = int(value)
+            elif key == b'ALL':
+                result['ids'] = parse_sequence_set(value)
+            elif key == b'PARTIAL':
+                # PARTIAL (<range> <sequence-set or NIL>)
+                parts = value.strip(b'()').split()
+                if len(parts) == 2 and parts[1] != b'NIL':
+                    result['ids'] = parse_sequence_set(parts[1])
+    return result
+
+def run_command(mail: imaplib.IMAP4, name: str, *args, literal=None) -> Tuple[str, List]:
+    """Run an IMAP command imaplib has no method for, or one with a prepared literal.
+
+    imaplib's public methods cover neither extension syntax (e.g. SEARCH
+    RETURN, COMPRESS) nor sending a literal that is not bytes (e.g. a
+    memoryview over a spool file). This is the one place that relies on its
+    private ``_simple_command`` and ``literal`` attribute, which every
+    imaplib command goes through. ``name`` must be in imaplib.Commands.
+    """
+    if literal is not None:
+        mail.literal = literal
+    return mail._simple_command(name, *args)
+
+def _extended_search(mail: imaplib.IMAP4, command: str, *args) -> Optional[Dict]:
+    """Run SEARCH/SORT with RETURN options; None if the server rejects them."""
+    try:
+        typ, _ = run_command(mail, command, *args)
+    except imaplib.IMAP4.error:
+        return None
+    _, data = mail.response('ESEARCH')
+    if typ != 'OK' or not data or data[0] is None:
+        return None
+    return parse_esearch_response(data)
+
+def _search_range(mail: imaplib.IMAP4, scope: str, criteria: List[str], sort: bool) -> List[bytes]:
+    if sort:
+        try:
+            typ, data = mail.sort('REVERSE ARRIVAL', 'UTF-8', scope, *criteria)
+            if typ == 'OK':
+                return data[0].split() if data and data[0] else []
+        except imaplib.IMAP4.error:
+            pass
+    _, data = mail.search(None, scope, *criteria)
+    return sorted(data[0].split() if data and data[0] else [], key=int, reverse=True)
+
+def _window_search(mail: imaplib.IMAP4, limit: int, criteria: List[str], high: int,
+                   sort: bool) -> List[bytes]:
+    """Search ever larger windows downwards from the highest id until limit matches are found."""
+    found: List[bytes] = []
+    window = max(limit * 2, 50)
+    while high > 0 and len(found) < limit:
+        low = max(1, high - window + 1)
+        found.extend(_search_range(mail, f'{low}:{high}', criteria, sort))
+        high = low - 1
+        window *= 4
+    return found[:limit]
+
+def search_latest(mail: imaplib.IMAP4, limit: int, criteria: List[str],
+                  exists: int) -> Tuple[List[bytes], Optional[int]]:
+    """Newest ``limit`` message sequence numbers matching criteria, newest first.
+
+    Avoids transferring the whole ID list: SORT with CONTEXT=SORT partial
+    results, then ESEARCH PARTIAL, then ESEARCH MAX to bound a windowed
+    search, and on plain IMAP4rev1 a windowed SEARCH below EXISTS. Returns
+    the ids and the total match count when the server reported it.
+    """
+    if limit <= 0 or exists <= 0:
+        return [], 0
+    capabilities = get_capabilities(mail)
+
+    if 'SORT' in capabilities and 'CONTEXT=SORT' in capabilities:
+        result = _extended_search(
+            mail, 'SORT', 'RETURN', f'(PARTIAL 1:{limit} COUNT)', '(REVERSE ARRIVAL)', 'UTF-8', *criteria
+        )
+        if result is not None:
+            return result['ids'], result['count']
+
+    if 'ESEARCH' in capabilities:
+        if 'PARTIAL' in capabilities:
+            result = _extended_search(mail, 'SEARCH', 'RETURN', f'(PARTIAL -1:-{limit} COUNT)', *criteria)
+            if result is not None:
+                return sorted(result['ids'], key=int, reverse=True), result['count']
+        result = _extended_search(mail, 'SEARCH', 'RETURN', '(MAX COUNT)', *criteria)
+        if result is not None:
+            if not result['count']:
+                return [], 0
+            ids = _window_search(mail, limit, criteria, result['max'], 'SORT' in capabilities)
+            return ids, result['count']
+
+    return _window_search(mail, limit, criteria, exists, 'SORT' in capabilities), None
+
+def search_uids_before(mail: imaplib.IMAP4, before_uid: Optional[int], limit: int,
+                       criteria: List[str]) -> Tuple[List[int], bool]:
+    """Newest ``limit`` UIDs below before_uid matching criteria, newest first, and whether more remain.
+
+    Like search_latest, never lists the whole folder: ESEARCH PARTIAL when
+    advertised, otherwise UID SEARCH over ever larger UID windows downwards
+    from before_uid (or UIDNEXT for the first page).
+    """
+    if before_uid is not None and before_uid <= 1:
+        return [], False
+    capabilities = get_capabilities(mail)
+    scope = f'1:{before_uid - 1}' if before_uid else '1:*'
+
+    if 'ESEARCH' in capabilities and 'PARTIAL' in capabilities:
+        result = _extended_search(
+            mail, 'UID', 'SEARCH', 'RETURN', f'(PARTIAL -1:-{limit} COUNT)', 'UID', scope, *criteria
+        )
+        if result is not None:
+            uids = sorted((int(uid) for uid in result['ids']), reverse=True)
+            return uids, (result['count'] or 0) > len(uids)
+
+    high = before_uid - 1 if before_uid else get_uidnext(mail)
+    if high is None:
+        # No UIDNEXT to start a window from; one search of the whole folder
+        _, data = mail.uid('SEARCH', None, 'UID', scope, *criteria)
+        uids = sorted((int(uid) for uid in (data[0].split() if data and data[0] else [])), reverse=True)
+        return uids[:limit], len(uids) > limit
+    found: List[int] = []
+    window = max(limit * 2, 50)
+    # One match beyond the page tells whether there is a next page
+    while high > 0 and len(found) <= limit:
+        low = max(1, high - window + 1)
+        _, data = mail.uid('SEARCH', None, 'UID', f'{low}:{high}', *criteria)
+        found.extend(sorted((int(uid) for uid in (data[0].split() if data and data[0] else [])), reverse=True))
+        high = low - 1
+        window *= 4
+    return found[:limit], len(found) > limit
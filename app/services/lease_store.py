@@ -0,0 +1,136 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, List, Optional
+
+from app.services.private_store import connect_private, get_data_path
+
+IMAP_CLAIM_KEYWORD = "$AI_Claimed"
+
+def get_lease_db_path() -> str:
+    return os.getenv('LEASE_DB_PATH', get_data_path('leases.sqlite3'))
+
+def get_mailbox_lease_ttl() -> float:
+    return float(os.getenv('LEASE_MAILBOX_TTL', 600))
+
+def get_uid_lease_ttl() -> float:
+    return float(os.getenv('LEASE_UID_TTL', 900))
+
+def is_imap_mirror_enabled() -> bool:
+    return os.getenv('LEASE_MIRROR_IMAP', 'false').lower() in ('1', 'true', 'yes')
+
+def claim_expiry_keyword(expires_at: float) -> str:
+    """Keyword paired with IMAP_CLAIM_KEYWORD so a mirrored claim expires like its lease."""
+    return f"{IMAP_CLAIM_KEYWORD}_{int(expires_at)}"
+
+def _claim_expiry(flag: str) -> Optional[int]:
+    prefix = f"{IMAP_CLAIM_KEYWORD}_"
+    if flag.startswith(prefix) and flag[len(prefix):].isdigit():
+        return int(flag[len(prefix):])
+    return None
+
+def stale_claim_keywords(flags: Iterable[str], now: Optional[float] = None) -> List[str]:
+    """Mirrored claim keywords in flags whose expiry has passed."""
+    now = time.time() if now is None else now
+    return [flag for flag in flags if _claim_expiry(flag) is not None and _claim_expiry(flag) <= now]
+
+def has_active_claim(flags: Iterable[str], now: Optional[float] = None) -> bool:
+    """Whether flags carry an unexpired mirrored claim.
+
+    A bare IMAP_CLAIM_KEYWORD without an expiry keyword (e.g. left behind
+    by a worker that crashed) does not count, so it cannot pin a message.
+    """
+    now = time.time() if now is None else now
+    return any((_claim_expiry(flag) or 0) > now for flag in flags)
+
+def make_lease_owner() -> str:
+    """Unique owner id for this process and client."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def mailbox_key(address: str, folder: str = "INBOX") -> str:
+    return f"mailbox:{address}:{folder}"
+
+def uid_key(address: str, folder: str, uidvalidity: Optional[int], uid: int) -> str:
+    return f"uid:{address}:{folder}:{uidvalidity}:{uid}"
+
+class LeaseStore:
+    """Expiring leases in a local SQLite file shared by all workers on a host.
+
+    Every write runs in an IMMEDIATE transaction, so concurrent processes
+    serialize on SQLite's file lock and at most one owner holds a key.
+    Waiting for that lock blocks, so async code calls the store in an
+    executor (see hold_lease).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_lease_db_path()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = connect_private(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew a lease; False if another owner holds an unexpired one."""
+        return bool(self.acquire_many([key], owner, ttl))
+
+    def acquire_many(self, keys: List[str], owner: str, ttl: float) -> List[str]:
+        """Take every free lease in keys in one transaction and return those acquired."""
+        now = time.time()
+        acquired = []
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for key in keys:
+                row = conn.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+                if row and row[0] != owner and row[1] > now:
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                    (key, owner, now + ttl)
+                )
+                acquired.append(key)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return acquired
+
+    def release(self, key: str, owner: str) -> None:
+        self.release_many([key], owner)
+
+    def release_many(self, keys: List[str], owner: str) -> None:
+        conn = self._connect()
+        try:
+            conn.executemany("DELETE FROM leases WHERE key = ? AND owner = ?", [(key, owner) for key in keys])
+        finally:
+            conn.close()
+
+    def purge_expired(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("DELETE FROM leases WHERE expires_at <= ?", (time.time(),)).rowcount
+        finally:
+            conn.close()
+
+@asynccontextmanager
+async def hold_lease(store: LeaseStore, key: str, owner: str, ttl: float) -> AsyncIterator[bool]:
+    """Hold a lease for the duration of the block; yields whether it was acquired."""
+    loop = asyncio.get_running_loop()
+    acquired = await loop.run_in_executor(None, store.acquire, key, owner, ttl)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            await loop.run_in_executor(None, store.release, key, owner)
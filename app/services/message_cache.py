@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.services.private_store import connect_private, get_data_path
+
+def is_message_cache_enabled() -> bool:
+    return os.getenv('MESSAGE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+def get_message_cache_path() -> str:
+    return os.getenv('MESSAGE_CACHE_PATH', get_data_path('messages.sqlite3'))
+
+def get_message_cache_max_bytes() -> int:
+    return int(os.getenv('MESSAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+def get_message_cache_raw_max_bytes() -> int:
+    return int(os.getenv('MESSAGE_CACHE_RAW_MAX_BYTES', 1024 * 1024))
+
+def get_message_cache_ttl() -> float:
+    return float(os.getenv('MESSAGE_CACHE_TTL_DAYS', 7)) * 86400
+
+CacheKey = Tuple[str, int, int]
+
+class MessageCache:
+    """Parsed message records keyed by (folder, UIDVALIDITY, UID), in memory and on disk.
+
+    The memory tier is an LRU bounded by the records' encoded size; the disk
+    tier is a SQLite file shared by the workers on a host (in DATA_DIR,
+    readable by the service user only), which also keeps the raw bytes of
+    messages up to MESSAGE_CACHE_RAW_MAX_BYTES. A folder
+    seen with a new UIDVALIDITY has all its older entries dropped, since
+    its UIDs now name different messages. Safe to share between the event
+    loop and executor threads.
+    """
+
+    def __init__(self, account: str, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.account = account
+        self.path = path or get_message_cache_path()
+        self.max_bytes = get_message_cache_max_bytes() if max_bytes is None else max_bytes
+        self._memory: "OrderedDict[CacheKey, Tuple[Dict, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._uidvalidity: Dict[str, int] = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "account TEXT NOT NULL, folder TEXT NOT NULL, uidvalidity INTEGER NOT NULL, uid INTEGER NOT NULL, "
+            "record TEXT NOT NULL, raw BLOB, stored_at REAL NOT NULL, "
+            "PRIMARY KEY (account, folder, uidvalidity, uid))"
+        )
+        self._execute("DELETE FROM messages WHERE stored_at < ?", (time.time() - get_message_cache_ttl(),))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = connect_private(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _execute(self, sql: str, params: Tuple = ()) -> Optional[Tuple]:
+        """Run one statement in its own transaction and return the first row, if any."""
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    def _check_uidvalidity(self, folder: str, uidvalidity: int) -> None:
+        """Drop a folder's entries from an older UIDVALIDITY (checked once per folder and value)."""
+        if self._uidvalidity.get(folder) == uidvalidity:
+            return
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == folder and key[1] != uidvalidity]:
+                self._evict(key)
+        self._execute(
+            "DELETE FROM messages WHERE account = ? AND folder = ? AND uidvalidity != ?",
+            (self.account, folder, uidvalidity)
+        )
+        self._uidvalidity[folder] = uidvalidity
+
+    def get(self, folder: str, uidvalidity: Optional[int], uid: Optional[int]) -> Optional[Dict]:
+        """The parsed record of a message, or None if it was never cached."""
+        if uidvalidity is None or uid is None:
+            return None
+        self._check_uidvalidity(folder, uidvalidity)
+        key = (folder, uidvalidity, uid)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return dict(self._memory[key][0])
+        row = self._execute(
+            "SELECT record FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? AND uid = ?",
+            (self.account, folder, uidvalidity, uid)
+        )
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['disk_hits'] += 1
+        record = json.loads(row[0])
+        self._remember(key, record, len(row[0]))
+        return dict(record)
+
+    def get_raw(self, folder: str, uidvalidity: Optional[int], uid: Optional[int]) -> Optional[bytes]:
+        """The raw RFC822 bytes of a cached message, if it was small enough to keep."""
+        if uidvalidity is None or uid is None:
+            return None
+        self._check_uidvalidity(folder, uidvalidity)
+        row = self._execute(
+            "SELECT raw FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? AND uid = ?",
+            (self.account, folder, uidvalidity, uid)
+        )
+        return bytes(row[0]) if row and row[0] is not None else None
+
+    def put(self, folder: str, uidvalidity: Optional[int], uid: Optional[int], record: Dict,
+            raw: Optional[bytes] = None) -> None:
+        if uidvalidity is None or uid is None:
+            return
+        self._check_uidvalidity(folder, uidvalidity)
+        encoded = json.dumps(record)
+        if raw is not None and len(raw) > get_message_cache_raw_max_bytes():
+            raw = None
+        self._execute(
+            "INSERT OR REPLACE INTO messages (account, folder, uidvalidity, uid, record, raw, stored_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.account, folder, uidvalidity, uid, encoded, raw, time.time())
+        )
+        self._remember((folder, uidvalidity, uid), record, len(encoded))
+
+    def _remember(self, key: CacheKey, record: Dict, size: int) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._evict(key)
+            if size > self.max_bytes:
+                return
+            self._memory[key] = (dict(record), size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_bytes:
+                self._evict(next(iter(self._memory)))
+
+    def _evict(self, key: CacheKey) -> None:
+        _, size = self._memory.pop(key)
+        self._memory_bytes -= size
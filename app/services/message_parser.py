@@ -0,0 +1,174 @@
+import asyncio
+import email
+import io
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.message import Message
+from email.parser import BytesParser
+from html import unescape
+from html.parser import HTMLParser
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+from app.services.imap_utils import decode_header_safe
+from app.services.message_store import ViewReader
+
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'tr', 'li', 'ul', 'ol', 'table', 'h1', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'blockquote', 'section', 'article', 'header', 'footer', 'hr'
+}
+SKIP_TAGS = {'script', 'style', 'head', 'title'}
+BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n+')
+SPACES_RE = re.compile(r'[ \t\r\f\v]+')
+
+def get_offload_bytes() -> int:
+    return int(os.getenv('PARSE_OFFLOAD_BYTES', 256 * 1024))
+
+def get_offload_html_bytes() -> int:
+    return int(os.getenv('PARSE_OFFLOAD_HTML_BYTES', 32 * 1024))
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    """Convert HTML mail to readable plain text (no scripts, styles or markup)."""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+        text = "".join(extractor.parts)
+    except Exception:
+        # Badly broken markup: strip tags the crude way
+        text = unescape(re.sub(r'<[^>]+>', ' ', html))
+
+    lines = [SPACES_RE.sub(' ', line).strip() for line in text.split("\n")]
+    return BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+def decode_part(part: Message) -> str:
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset() or 'utf-8'
+    try:
+        return payload.decode(charset, errors='replace')
+    except (UnicodeDecodeError, LookupError):
+        return payload.decode('utf-8', errors='replace')
+
+def extract_body(message: Message) -> str:
+    """Return the text/plain body, falling back to converted text/html."""
+    html_part = None
+    for part in message.walk():
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            return decode_part(part)
+        if content_type == 'text/html' and html_part is None:
+            html_part = part
+
+    return html_to_text(decode_part(html_part)) if html_part is not None else ""
+
+def parse_message(raw: Union[bytes, BinaryIO]) -> Dict:
+    """Parse raw RFC822 bytes (or a binary stream of them) into the fields the workflow uses.
+
+    Pure and picklable so it can run in a worker process.
+    """
+    message = email.message_from_bytes(raw) if isinstance(raw, bytes) else BytesParser().parse(raw)
+    return {
+        "message_id": message.get('Message-ID', ''),
+        "references": message.get('References', '').split(),
+        "in_reply_to": message.get('In-Reply-To', ''),
+        "subject": decode_header_safe(message["subject"]),
+        "from": decode_header_safe(message.get("from", "")),
+        "date": message.get("date", ""),
+        "body": extract_body(message)
+    }
+
+def parse_message_file(path: str, parser: Callable[[Union[bytes, BinaryIO]], Dict] = parse_message) -> Dict:
+    """Parse a spooled message from disk, so only the path crosses the process boundary.
+
+    The parser reads the memory-mapped file as a stream, so a large message
+    is never copied into one bytes object.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            return parser(io.BufferedReader(ViewReader(view)))
+        finally:
+            # The map can only close once no view of it is left
+            view.release()
+
+def should_offload(raw: bytes) -> bool:
+    """Large messages, or HTML beyond a small size, are parsed off the event loop."""
+    if len(raw) > get_offload_bytes():
+        return True
+    return len(raw) > get_offload_html_bytes() and b'text/html' in raw
+
+class ParseStage:
+    """Parse step of the fetch pipeline, pluggable and optionally process-backed.
+
+    Small plain-text mail is parsed inline; large or HTML mail goes to a
+    process pool so CPU-heavy decoding scales across cores without stalling I/O.
+    """
+
+    def __init__(self, parser: Callable[[Union[bytes, BinaryIO]], Dict] = parse_message,
+                 max_workers: Optional[int] = None,
+                 offload: Callable[[bytes], bool] = should_offload):
+        self.parser = parser
+        self.offload = offload
+        self.max_workers = max_workers or int(os.getenv('PARSE_WORKERS', 0)) or None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    async def parse(self, raw: bytes) -> Dict:
+        if not self.offload(raw):
+            return self.parser(raw)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), self.parser, raw)
+        except BrokenProcessPool as e:
+            print(f"Parse pool broken, parsing inline: {str(e)}")
+            self._pool = None
+            return self.parser(raw)
+
+    async def parse_file(self, path: str) -> Dict:
+        """Parse a spooled message; always offloaded since spooling implies a large message."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), parse_message_file, path, self.parser)
+        except BrokenProcessPool as e:
+            print(f"Parse pool broken, parsing inline: {str(e)}")
+            self._pool = None
+            return parse_message_file(path, self.parser)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
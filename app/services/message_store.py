@@ -0,0 +1,209 @@
+import imaplib
+import io
+import mmap
+import os
+import re
+import tempfile
+import uuid
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.parser import BytesHeaderParser
+from email.policy import SMTP
+from typing import Dict, List, Optional, Union
+
+from app.services.imap_utils import FETCH_FLAGS_RE, FETCH_SIZE_RE, FETCH_UID_RE, run_command
+
+HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+
+def get_spool_threshold() -> int:
+    return int(os.getenv('SPOOL_THRESHOLD_BYTES', 1024 * 1024))
+
+def get_spool_chunk_size() -> int:
+    return int(os.getenv('SPOOL_CHUNK_BYTES', 1024 * 1024))
+
+def get_spool_dir() -> str:
+    return os.getenv('SPOOL_DIR', tempfile.gettempdir())
+
+class ViewReader(io.RawIOBase):
+    """Raw binary stream over a memoryview, so parsers can read a mapped spool in chunks."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._pos)
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+class SpooledMessage:
+    """Raw RFC822 bytes held in memory when small, or in a memory-mapped spool file.
+
+    ``view()`` returns a memoryview either way, so consumers never copy the
+    payload. Close the message (or use it as a context manager) to unmap and
+    delete the spool file.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, path: Optional[str] = None,
+                 uid: Optional[int] = None, flags: Optional[List[str]] = None):
+        self.uid = uid
+        self.flags = flags or []
+        self.path = path
+        self._data = data
+        self._file = None
+        self._mmap = None
+        if path is not None:
+            self._file = open(path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def is_spooled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._mmap) if self._mmap is not None else len(self._data or b"")
+
+    def view(self) -> memoryview:
+        return memoryview(self._mmap if self._mmap is not None else (self._data or b""))
+
+    def headers(self) -> Dict[str, str]:
+        """Parse only the header block, leaving the body untouched."""
+        source = self._mmap if self._mmap is not None else (self._data or b"")
+        match = HEADER_END_RE.search(source)
+        header_bytes = source[:match.end()] if match else source[:]
+        return dict(BytesHeaderParser().parsebytes(header_bytes).items())
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self) -> "SpooledMessage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def _new_spool_file():
+    return tempfile.NamedTemporaryFile(dir=get_spool_dir(), prefix="mail_spool_", suffix=".eml", delete=False)
+
+def spool_chunks(chunks: List[Union[bytes, memoryview]], threshold: Optional[int] = None, **kwargs) -> SpooledMessage:
+    """Join chunks in memory if small, otherwise write them to a spool file."""
+    threshold = get_spool_threshold() if threshold is None else threshold
+    total = sum(len(chunk) for chunk in chunks)
+    if total <= threshold:
+        return SpooledMessage(data=b"".join(chunks), **kwargs)
+
+    with _new_spool_file() as spool:
+        for chunk in chunks:
+            spool.write(chunk)
+    return SpooledMessage(path=spool.name, **kwargs)
+
+def _fetch(mail, message_id: Union[str, bytes], spec: str, use_uid: bool):
+    message_id = message_id.decode() if isinstance(message_id, bytes) else message_id
+    if use_uid:
+        return mail.uid('FETCH', message_id, spec)
+    return mail.fetch(message_id, spec)
+
+def _literals(msg_data) -> List[bytes]:
+    return [entry[1] for entry in msg_data or [] if isinstance(entry, tuple)]
+
+def fetch_spooled(mail, message_id: Union[str, bytes], use_uid: bool = False,
+                  threshold: Optional[int] = None,
+                  chunk_size: Optional[int] = None) -> SpooledMessage:
+    """Fetch a message's raw bytes, spooling large ones to disk chunk by chunk.
+
+    Messages above the threshold are downloaded with partial BODY.PEEK[]
+    fetches, so the whole message is never held in memory at once.
+    """
+    threshold = get_spool_threshold() if threshold is None else threshold
+    chunk_size = chunk_size or get_spool_chunk_size()
+
+    _, meta_data = _fetch(mail, message_id, '(UID FLAGS RFC822.SIZE)', use_uid)
+    meta = b" ".join(entry if isinstance(entry, bytes) else entry[0] for entry in meta_data if entry)
+    uid_match, flags_match, size_match = (
+        FETCH_UID_RE.search(meta), FETCH_FLAGS_RE.search(meta), FETCH_SIZE_RE.search(meta)
+    )
+    if not size_match:
+        raise ValueError(f"Could not read size of message {message_id!r}")
+    size = int(size_match.group(1))
+    details = {
+        "uid": int(uid_match.group(1)) if uid_match else None,
+        "flags": flags_match.group(1).decode().split() if flags_match else []
+    }
+
+    if size <= threshold:
+        _, msg_data = _fetch(mail, message_id, '(BODY.PEEK[])', use_uid)
+        return SpooledMessage(data=b"".join(_literals(msg_data)), **details)
+
+    with _new_spool_file() as spool:
+        for offset in range(0, size, chunk_size):
+            _, msg_data = _fetch(mail, message_id, f'(BODY.PEEK[]<{offset}.{chunk_size}>)', use_uid)
+            for literal in _literals(msg_data):
+                spool.write(literal)
+    return SpooledMessage(path=spool.name, **details)
+
+def build_flagged_message(original: SpooledMessage, text: str,
+                          attachment_name: str = "original.eml",
+                          extra_headers: Optional[Dict[str, str]] = None) -> SpooledMessage:
+    """Wrap an original message for staff: a text part plus the original attached as-is.
+
+    The original is embedded as a message/rfc822 part straight from its raw
+    bytes (by reference to the spool), so its attachments are never decoded
+    or re-encoded.
+    """
+    headers = original.headers()
+    marker = f"ORIGINAL-{uuid.uuid4().hex}"
+
+    msg = MIMEMultipart()
+    for name in ('From', 'To', 'Subject', 'Date', 'Message-ID'):
+        if headers.get(name):
+            msg[name] = headers[name]
+    for name, value in (extra_headers or {}).items():
+        if value:
+            msg[name] = " ".join(str(value).split())
+    msg.attach(MIMEText(text, 'plain', 'utf-8'))
+
+    attached = MIMEBase('message', 'rfc822')
+    attached.add_header('Content-Disposition', 'attachment', filename=attachment_name)
+    attached.set_payload(marker)
+    msg.attach(attached)
+
+    prefix, suffix = msg.as_bytes(policy=SMTP).split(marker.encode(), 1)
+    return spool_chunks([prefix, original.view(), suffix])
+
+def append_message(mail, mailbox: str, flags: Optional[str], message: SpooledMessage):
+    """APPEND a message, sending spooled bytes straight from the memory map.
+
+    imaplib.append normalizes line endings with a regex, which copies the
+    whole message; spooled messages are already CRLF (server bytes plus
+    SMTP-policy headers), so they are sent as a literal memoryview instead.
+    When the connection supports LITERAL+ (see imap_transport) the literal
+    is sent without waiting for the server's continuation.
+    """
+    if flags and (flags[0], flags[-1]) != ('(', ')'):
+        flags = f"({flags})"
+    if hasattr(mail, 'supports_literal_plus'):
+        data = message.view() if message.is_spooled else imaplib.MapCRLF.sub(imaplib.CRLF, bytes(message.view()))
+        if mail.supports_literal_plus(len(data)):
+            return mail.append_literal_plus(mailbox, flags, data)
+
+    if not message.is_spooled or getattr(mail, 'utf8_enabled', False):
+        return mail.append(mailbox, flags, None, bytes(message.view()))
+
+    return run_command(mail, 'APPEND', mailbox, flags or None, None, literal=message.view())
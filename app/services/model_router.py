@@ -0,0 +1,143 @@
+import os
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from app.schemas.email_schemas import EmailClassification
+from app.services.email_classifier import FALLBACK_REASON
+
+FAST_TIER = "fast"
+LARGE_TIER = "large"
+
+class ModelTier(BaseModel):
+    name: str
+    model: str
+    input_cost_per_1k: float
+    output_cost_per_1k: float
+
+class RoutingDecision(BaseModel):
+    tier: str
+    model: str
+    reason: str
+    escalated: bool = False
+    latency: float = 0.0
+    cost: float = 0.0
+    ttft: Optional[float] = None
+    self_confidence: Optional[float] = None
+
+class TierStats(BaseModel):
+    calls: int = 0
+    total_latency: float = 0.0
+    total_cost: float = 0.0
+    total_ttft: float = 0.0
+    timeouts: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.calls if self.calls else 0.0
+
+    @property
+    def avg_ttft(self) -> float:
+        return self.total_ttft / self.calls if self.calls else 0.0
+
+def get_model_tiers() -> Dict[str, ModelTier]:
+    """Load the fast and large model tiers from the environment."""
+    return {
+        FAST_TIER: ModelTier(
+            name=FAST_TIER,
+            model=os.getenv('OPENAI_FAST_MODEL', 'gpt-4o-mini'),
+            input_cost_per_1k=float(os.getenv('OPENAI_FAST_INPUT_COST', 0.00015)),
+            output_cost_per_1k=float(os.getenv('OPENAI_FAST_OUTPUT_COST', 0.0006)),
+        ),
+        LARGE_TIER: ModelTier(
+            name=LARGE_TIER,
+            model=os.getenv('OPENAI_MODEL', 'gpt-4'),
+            input_cost_per_1k=float(os.getenv('OPENAI_INPUT_COST', 0.03)),
+            output_cost_per_1k=float(os.getenv('OPENAI_OUTPUT_COST', 0.06)),
+        ),
+    }
+
+def is_routing_enabled() -> bool:
+    return os.getenv('MODEL_ROUTING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+def choose_initial_tier(classification: Optional[EmailClassification],
+                        email_length: int,
+                        thread_depth: int) -> Tuple[str, str]:
+    """Pick the tier to try first and the reason for it.
+
+    ``thread_depth`` counts every earlier turn, including those folded into
+    the thread summary. The rules' default verdict carries no real
+    confidence, so only other classifications (keyword matches, the LLM
+    pass) can route on confidence.
+    """
+    if not is_routing_enabled():
+        return LARGE_TIER, "routing disabled"
+
+    min_confidence = float(os.getenv('ROUTING_MIN_CLASSIFIER_CONFIDENCE', 0.7))
+    max_length = int(os.getenv('ROUTING_MAX_FAST_EMAIL_CHARS', 3000))
+    max_depth = int(os.getenv('ROUTING_MAX_FAST_THREAD_DEPTH', 4))
+
+    if classification and classification.reason != FALLBACK_REASON and classification.confidence < min_confidence:
+        return LARGE_TIER, f"classifier confidence {classification.confidence:.2f} < {min_confidence}"
+    if email_length > max_length:
+        return LARGE_TIER, f"email length {email_length} > {max_length} chars"
+    if thread_depth > max_depth:
+        return LARGE_TIER, f"thread depth {thread_depth} > {max_depth}"
+    return FAST_TIER, "default fast tier"
+
+def should_escalate(self_confidence: Optional[float]) -> bool:
+    """Escalate a fast-tier reply whose self-assessed confidence is too low.
+
+    A reply without a self-assessment (the model ignored the JSON format)
+    is treated as neutral rather than generated twice.
+    """
+    if self_confidence is None:
+        return False
+    return self_confidence < float(os.getenv('ROUTING_ESCALATE_BELOW', 0.7))
+
+def estimate_cost(tier: ModelTier, prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * tier.input_cost_per_1k
+            + completion_tokens * tier.output_cost_per_1k) / 1000
+
+class RoutingStats:
+    """In-process record of routing decisions and per-tier latency and cost."""
+
+    def __init__(self, history_size: int = 200):
+        self.tiers: Dict[str, TierStats] = {}
+        self.escalations = 0
+        self.decisions: List[RoutingDecision] = []
+        self.history_size = history_size
+
+    def record_call(self, tier: str, latency: float, cost: float,
+                    prompt_tokens: int, completion_tokens: int,
+                    ttft: Optional[float] = None) -> None:
+        stats = self.tiers.setdefault(tier, TierStats())
+        stats.calls += 1
+        stats.total_ttft += ttft or 0.0
+        stats.total_latency += latency
+        stats.total_cost += cost
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+
+    def record_timeout(self, tier: str) -> None:
+        self.tiers.setdefault(tier, TierStats()).timeouts += 1
+
+    def record_decision(self, decision: RoutingDecision) -> None:
+        if decision.escalated:
+            self.escalations += 1
+        self.decisions.append(decision)
+        del self.decisions[:-self.history_size]
+
+    def summary(self) -> Dict:
+        return {
+            "escalations": self.escalations,
+            "tiers": {
+                name: {
+                    **stats.model_dump(),
+                    "avg_latency": stats.avg_latency,
+                    "avg_ttft": stats.avg_ttft,
+                }
+                for name, stats in self.tiers.items()
+            },
+        }
@@ -0,0 +1,23 @@
+import os
+import sqlite3
+
+def get_data_dir() -> str:
+    """Directory for the agent's local databases (message cache, search index, leases)."""
+    return os.getenv('DATA_DIR', os.path.join(os.path.expanduser('~'), '.local', 'state', 'email_agent'))
+
+def get_data_path(name: str) -> str:
+    return os.path.join(get_data_dir(), name)
+
+def connect_private(path: str, **kwargs) -> sqlite3.Connection:
+    """Open a SQLite file that only the service user can read.
+
+    These files hold guest mail, so the directory is created 0700 and the
+    file 0600 before SQLite opens it; SQLite gives the -wal and -shm files
+    the same mode. A file left by an older version with the umask's mode
+    is tightened too.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    os.chmod(path, 0o600)
+    return sqlite3.connect(path, **kwargs)
@@ -0,0 +1,213 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+_current_capture: ContextVar[Optional["ProfileCapture"]] = ContextVar('profile_capture', default=None)
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, 'false').lower() in ('1', 'true', 'yes')
+
+class ProfileCapture:
+    """Timing, phase breakdown and (when sampled) CPU/allocation data for one section."""
+
+    def __init__(self, name: str, key: Optional[str], cpu: bool, memory: bool):
+        self.name = name
+        self.key = key
+        self.parent = _current_capture.get()
+        self.thread = threading.get_ident()
+        # Set when a concurrent task's capture ran while this one held the CPU profile
+        self.cpu_shared = False
+        self.phases: Dict[str, float] = {}
+        self.profile: Optional[cProfile.Profile] = cProfile.Profile() if cpu else None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 1)))
+            self.snapshot = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def encloses(self, other: "ProfileCapture") -> bool:
+        """Whether other runs inside this capture rather than alongside it."""
+        while other is not None:
+            if other is self:
+                return True
+            other = other.parent
+        return False
+
+class Profiler:
+    """Opt-in, sampled profiling of the processing pipeline.
+
+    Disabled by default (PROFILE_ENABLED). When enabled, every capture
+    records wall time and per-phase timings (imap, parse, classify, llm,
+    store); a PROFILE_SAMPLE_RATE fraction also runs cProfile and tracemalloc.
+    Captures slower than PROFILE_SLOW_MS are dumped to PROFILE_DUMP_DIR as a
+    .prof file (for pstats/snakeviz) plus a text summary of the top CPU and
+    allocation sites. Settings can be changed at runtime via configure().
+    """
+
+    def __init__(self):
+        self.enabled = _env_flag('PROFILE_ENABLED')
+        self.sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 1.0))
+        self.slow_ms = float(os.getenv('PROFILE_SLOW_MS', 5000))
+        self.trace_memory = _env_flag('PROFILE_TRACEMALLOC')
+        self.dump_dir = os.getenv('PROFILE_DUMP_DIR', os.path.join(tempfile.gettempdir(), 'email_agent_profiles'))
+        self.top_n = int(os.getenv('PROFILE_TOP_N', 15))
+        self.recent: deque = deque(maxlen=int(os.getenv('PROFILE_HISTORY', 50)))
+        self._cpu_active = False
+        self._active: List[ProfileCapture] = []
+
+    def configure(self, **settings) -> Dict:
+        for name in ('enabled', 'sample_rate', 'slow_ms', 'trace_memory', 'top_n'):
+            if settings.get(name) is not None:
+                setattr(self, name, settings[name])
+        if not self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.status()
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled, "sample_rate": self.sample_rate, "slow_ms": self.slow_ms,
+            "trace_memory": self.trace_memory, "top_n": self.top_n, "dump_dir": self.dump_dir
+        }
+
+    @contextmanager
+    def capture(self, name: str, key: Optional[str] = None, cpu: bool = True,
+                dump_if_slow: bool = True) -> Iterator[Optional[ProfileCapture]]:
+        """Profile the enclosed block; a no-op unless profiling is enabled.
+
+        Only one cProfile can run per thread, so a capture nested inside a
+        CPU-profiled one (or started with cpu=False) records timings only.
+        cProfile also sees every task on the event loop, so a capture that
+        starts while a sibling (e.g. another message under the scheduler) is
+        still running skips CPU sampling; if a sibling starts after it, its
+        CPU profile is marked cpu_shared since it covers the loop, not just
+        this message.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        sampled = random.random() < self.sample_rate
+        parent = _current_capture.get()
+        thread = threading.get_ident()
+        siblings = [other for other in self._active
+                    if other.thread == thread and not other.encloses(parent)]
+        use_cpu = cpu and sampled and not self._cpu_active and not siblings
+        capture = ProfileCapture(name, key, use_cpu, sampled and self.trace_memory)
+        for other in siblings:
+            if other.profile is not None:
+                other.cpu_shared = True
+        self._active.append(capture)
+        if capture.profile is not None:
+            try:
+                capture.profile.enable()
+                self._cpu_active = True
+            except ValueError:
+                # Another profiler (e.g. an attached debugger) already owns the hook
+                capture.profile = None
+        token = _current_capture.set(capture)
+        try:
+            yield capture
+        finally:
+            _current_capture.reset(token)
+            self._active.remove(capture)
+            if capture.profile is not None:
+                capture.profile.disable()
+                self._cpu_active = False
+            try:
+                self._finish(capture, dump_if_slow)
+            except Exception as e:
+                # Profiling must never break message processing
+                print(f"Error summarizing profile: {str(e)}")
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add the block's wall time to the current capture's phase breakdown."""
+        capture = _current_capture.get()
+        if capture is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            capture.add_phase(name, time.perf_counter() - started)
+
+    def _finish(self, capture: ProfileCapture, dump_if_slow: bool) -> None:
+        elapsed_ms = (time.perf_counter() - capture.started) * 1000
+        summary = {
+            "name": capture.name,
+            "key": capture.key,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in capture.phases.items()},
+            "top_cpu": self._top_cpu(capture.profile) if capture.profile is not None else [],
+            "cpu_shared": capture.cpu_shared,
+            "top_alloc": self._top_alloc(capture.snapshot) if capture.snapshot is not None else [],
+            "dump": None
+        }
+        if dump_if_slow and elapsed_ms >= self.slow_ms:
+            summary['dump'] = self._dump(capture, summary)
+            print(f"Slow {capture.name} ({summary['elapsed_ms']} ms, {capture.key}), profile saved to {summary['dump']}")
+        self.recent.append(summary)
+
+    def _top_cpu(self, profile: cProfile.Profile) -> List[Dict]:
+        stats = pstats.Stats(profile)
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({function})",
+                "calls": calls, "total_ms": round(total * 1000, 2), "cumulative_ms": round(cumulative * 1000, 2)
+            })
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:self.top_n]
+
+    def _top_alloc(self, before: tracemalloc.Snapshot) -> List[Dict]:
+        if not tracemalloc.is_tracing():
+            return []
+        # Leave out tracemalloc's own bookkeeping
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        return [
+            {"site": str(stat.traceback[0]), "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+            for stat in after.compare_to(before.filter_traces(filters), 'lineno')[:self.top_n]
+        ]
+
+    def _dump(self, capture: ProfileCapture, summary: Dict) -> str:
+        os.makedirs(self.dump_dir, exist_ok=True)
+        label = re.sub(r'[^A-Za-z0-9_.-]', '_', str(capture.key or ''))[:40]
+        base = os.path.join(self.dump_dir, f"{capture.name}-{time.strftime('%Y%m%d-%H%M%S')}-{label}")
+
+        lines = [f"{capture.name} {capture.key}: {summary['elapsed_ms']} ms", "", "Phases (ms):"]
+        lines += [f"  {phase}: {ms}" for phase, ms in summary['phases_ms'].items()]
+        if capture.profile is not None:
+            capture.profile.dump_stats(f"{base}.prof")
+            text = io.StringIO()
+            pstats.Stats(capture.profile, stream=text).sort_stats('cumulative').print_stats(self.top_n)
+            scope = " - includes concurrent tasks on the event loop" if capture.cpu_shared else ""
+            lines += ["", f"Top CPU (cumulative){scope}:", text.getvalue()]
+        if summary['top_alloc']:
+            lines += ["", "Top allocations:"]
+            lines += [f"  {row['site']}: {row['size_kb']} KiB in {row['count']} blocks" for row in summary['top_alloc']]
+        with open(f"{base}.txt", 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        return f"{base}.txt"
+
+@lru_cache()
+def get_profiler() -> Profiler:
+    """The process-wide profiler (each worker process has its own)."""
+    return Profiler()
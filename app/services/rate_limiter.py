@@ -0,0 +1,40 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from typing import Optional
+
+def get_llm_requests_per_minute() -> float:
+    return float(os.getenv('LLM_REQUESTS_PER_MINUTE', 60))
+
+class SharedRateLimiter:
+    """Token bucket shared by all worker processes through shared memory.
+
+    The lock is only held to reserve a slot; the wait itself happens with
+    asyncio.sleep so a worker's event loop keeps running.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 burst: Optional[int] = None, ctx=None):
+        ctx = ctx or multiprocessing.get_context('spawn')
+        self.rate = (requests_per_minute or get_llm_requests_per_minute()) / 60.0
+        self.capacity = float(burst or max(1, int(self.rate * 10)))
+        self._tokens = ctx.Value('d', self.capacity, lock=False)
+        self._updated = ctx.Value('d', time.time(), lock=False)
+        self._lock = ctx.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how long to wait before using it."""
+        with self._lock:
+            now = time.time()
+            elapsed = max(0.0, now - self._updated.value)
+            tokens = min(self.capacity, self._tokens.value + elapsed * self.rate)
+            self._updated.value = now
+            # Tokens may go negative: later callers queue behind earlier reservations
+            self._tokens.value = tokens - 1
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    async def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.schemas.email_schemas import EmailCategory
+from app.services.email_classifier import URGENT_KEYWORDS
+from app.services.header_prefilter import AGENT_MESSAGE_ID_MARKER
+from app.services.search_index import normalize_subject, thread_ids
+
+HIGH, NORMAL, LOW = "high", "normal", "low"
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+# Guests writing about an imminent stay, on top of the classifier's urgency keywords
+ARRIVAL_KEYWORDS = {
+    'today', 'tonight', 'this evening', 'arriving', 'arrival', 'check-in', 'check in', 'locked out'
+}
+LOW_VALUE_CATEGORIES = {EmailCategory.SPAM.value, EmailCategory.NEWSLETTER.value, EmailCategory.AUTOMATED.value}
+
+def is_scheduler_enabled() -> bool:
+    return os.getenv('SCHEDULER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+def _parse_levels(value: str, default: Dict[str, float]) -> Dict[str, float]:
+    """Parse "high=60,normal=240,low=1440" over the defaults."""
+    levels = dict(default)
+    for part in value.split(','):
+        name, _, amount = part.partition('=')
+        if name.strip() in levels and amount.strip():
+            levels[name.strip()] = float(amount)
+    return levels
+
+def get_sla_minutes() -> Dict[str, float]:
+    """Target response time per priority; mail past it is promoted one level."""
+    return _parse_levels(os.getenv('SCHEDULER_SLA_MINUTES', ''), {HIGH: 60, NORMAL: 240, LOW: 1440})
+
+def get_priority_limits() -> Dict[str, int]:
+    """How many emails of each priority may be processed at once."""
+    limits = _parse_levels(os.getenv('SCHEDULER_CONCURRENCY', ''), {HIGH: 3, NORMAL: 2, LOW: 1})
+    return {name: max(1, int(limit)) for name, limit in limits.items()}
+
+def get_max_concurrency() -> int:
+    return max(1, int(os.getenv('SCHEDULER_MAX_CONCURRENCY', 3)))
+
+def get_scan_limit() -> int:
+    """How many of the newest INBOX messages are considered when picking what to process."""
+    return int(os.getenv('SCHEDULER_SCAN_LIMIT', 50))
+
+def arrival_time(email_data: Dict, now: float) -> float:
+    """Arrival from the Date header, clamped to now; unknown dates count as just arrived."""
+    try:
+        return min(parsedate_to_datetime(email_data.get('date') or '').timestamp(), now)
+    except (TypeError, ValueError, IndexError):
+        return now
+
+def prioritize(email_data: Dict, now: Optional[float] = None) -> Dict:
+    """Priority, response deadline and reason for one email.
+
+    Works on header-only records (before the body is fetched) as well as on
+    classified ones. Mail past the SLA of its priority is promoted one
+    level, so low-value mail is delayed but never starved.
+    """
+    now = time.time() if now is None else now
+    category = (email_data.get('classification') or {}).get('category')
+    text = f"{email_data.get('subject') or ''} {email_data.get('body') or ''}".lower()
+    chain = " ".join(email_data.get('references') or []) + " " + (email_data.get('in_reply_to') or '')
+
+    if category in LOW_VALUE_CATEGORIES:
+        priority, reason = LOW, f"category {category}"
+    elif category == EmailCategory.REQUIRES_HUMAN.value:
+        priority, reason = HIGH, "needs staff"
+    elif any(keyword in text for keyword in URGENT_KEYWORDS | ARRIVAL_KEYWORDS):
+        priority, reason = HIGH, "urgent or imminent arrival"
+    elif AGENT_MESSAGE_ID_MARKER in chain:
+        priority, reason = HIGH, "guest replied in an open thread"
+    else:
+        priority, reason = NORMAL, "default"
+
+    sla = get_sla_minutes()
+    arrived = arrival_time(email_data, now)
+    promoted = priority != HIGH and now > arrived + sla[priority] * 60
+    if promoted:
+        priority = PRIORITIES[PRIORITIES.index(priority) - 1]
+        reason += ", past its SLA"
+    return {
+        "priority": priority,
+        "deadline": arrived + sla[priority] * 60,
+        "promoted": promoted,
+        "reason": reason
+    }
+
+def order_emails(emails: List[Dict], now: Optional[float] = None) -> List[Dict]:
+    """Set ``schedule`` on each email and sort by priority, then earliest deadline."""
+    now = time.time() if now is None else now
+    for email_data in emails:
+        email_data['schedule'] = prioritize(email_data, now)
+    return sorted(emails, key=lambda e: (PRIORITIES.index(e['schedule']['priority']), e['schedule']['deadline']))
+
+def thread_keys(email_data: Dict) -> Set[str]:
+    """Keys shared by messages of one conversation: the subject thread key and the Message-ID chain.
+
+    Filing a reply rewrites the stored thread found by subject, so two
+    messages sharing any key must not be processed at the same time.
+    """
+    keys = {f"subject:{normalize_subject(email_data.get('subject'))}"}
+    keys.update(thread_ids(email_data))
+    if email_data.get('message_id'):
+        keys.add(email_data['message_id'])
+    return keys
+
+async def run_prioritized(emails: List[Dict], worker: Callable[[Dict], Awaitable[bool]],
+                          limits: Optional[Dict[str, int]] = None,
+                          max_concurrency: Optional[int] = None) -> List[Tuple[Dict, bool]]:
+    """Run ``worker`` over emails ordered by order_emails, concurrently within limits.
+
+    Whenever a slot frees up, the first waiting email whose priority is
+    under its own limit starts, so low-priority mail can never hold every
+    slot. An email waits while another message of its thread (see
+    thread_keys) is running, so one conversation is handled in order.
+    Returns (email, success) pairs in completion order.
+    """
+    limits = limits or get_priority_limits()
+    max_concurrency = max_concurrency or get_max_concurrency()
+    pending = list(emails)
+    running: Dict[asyncio.Future, Dict] = {}
+    active = {name: 0 for name in PRIORITIES}
+    busy: Set[str] = set()
+    results: List[Tuple[Dict, bool]] = []
+
+    while pending or running:
+        for email_data in list(pending):
+            if len(running) >= max_concurrency:
+                break
+            priority = email_data['schedule']['priority']
+            if active[priority] >= limits.get(priority, max_concurrency):
+                continue
+            keys = thread_keys(email_data)
+            if keys & busy:
+                continue
+            pending.remove(email_data)
+            active[priority] += 1
+            busy |= keys
+            running[asyncio.ensure_future(worker(email_data))] = email_data
+
+        done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            email_data = running.pop(task)
+            active[email_data['schedule']['priority']] -= 1
+            busy -= thread_keys(email_data)
+            try:
+                success = task.result()
+            except Exception as e:
+                print(f"Error processing email {email_data.get('subject')}: {str(e)}")
+                success = False
+            results.append((email_data, success))
+    return results
@@ -0,0 +1,194 @@
+import os
+import re
+import sqlite3
+import time
+from email.utils import parseaddr
+from typing import Dict, List, Optional, Tuple
+
+from app.services.private_store import connect_private, get_data_path
+
+SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|fwd?|aw|sv)\s*:\s*)+', re.IGNORECASE)
+QUERY_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+def get_search_index_path() -> str:
+    return os.getenv('SEARCH_INDEX_PATH', get_data_path('search.sqlite3'))
+
+def folder_for_category(category: str) -> str:
+    """Logical AI_Processed folder name, e.g. requires_human -> AI_Processed/Requires_Human."""
+    return "AI_Processed/" + "_".join(part.capitalize() for part in category.split("_"))
+
+def normalize_subject(subject: Optional[str]) -> str:
+    """Thread key for a subject: Re:/Fwd: prefixes stripped, case folded."""
+    return SUBJECT_PREFIX_RE.sub('', subject or '').strip().lower()
+
+def thread_ids(email_data: Dict) -> List[str]:
+    """Message-IDs a message refers to (References, then In-Reply-To), oldest first."""
+    ids = list(email_data.get('references') or [])
+    in_reply_to = (email_data.get('in_reply_to') or '').strip()
+    if in_reply_to and in_reply_to not in ids:
+        ids.append(in_reply_to)
+    return ids
+
+def thread_root(email_data: Dict) -> str:
+    """Thread key: the first Message-ID in the chain, or the message's own for a new thread."""
+    ids = thread_ids(email_data)
+    return ids[0] if ids else email_data.get('message_id', '')
+
+def correspondent(sender: Optional[str]) -> str:
+    return parseaddr(sender or '')[1].lower()
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every term must match, last one as a prefix.
+
+    Terms are quoted, so user input can't inject FTS5 syntax; a booking
+    number like "BK-2041" becomes the phrase "BK" "2041".
+    """
+    terms = QUERY_TERM_RE.findall(query)
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return " ".join(quoted)
+
+class SearchIndex:
+    """SQLite FTS5 index of mail the agent has filed into AI_Processed/*.
+
+    Updated incrementally as messages are filed, so staff lookups and thread
+    history never need a server-side IMAP SEARCH. Like MessageCache, one
+    private file in DATA_DIR is shared by every account on a host, so all
+    rows and queries are scoped to ``account``. Threads are keyed on Message-ID, In-Reply-To and
+    References; the subject only decides within one correspondent.
+    """
+
+    COLUMNS = (
+        "subject", "sender", "body", "category",
+        "account", "message_id", "thread", "correspondent", "subject_key", "folder", "date", "filed_at"
+    )
+
+    def __init__(self, account: str, path: Optional[str] = None):
+        self.account = account
+        self.path = path or get_search_index_path()
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+            if columns and columns != list(self.COLUMNS):
+                # An index from an older layout can't be attributed to accounts; refill it as mail is filed
+                conn.execute("DROP TABLE messages")
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                "subject, sender, body, category, "
+                "account UNINDEXED, message_id UNINDEXED, thread UNINDEXED, correspondent UNINDEXED, "
+                "subject_key UNINDEXED, folder UNINDEXED, date UNINDEXED, filed_at UNINDEXED, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = connect_private(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add(self, email_data: Dict, category: str, folder: str,
+            body: Optional[str] = None, replace_thread: bool = False) -> None:
+        """Index one filed message, replacing any earlier entry for it.
+
+        With replace_thread, older entries of the same thread in the folder
+        are dropped too, mirroring how the Legitimate folder keeps one
+        message per thread.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                self._add(conn, email_data, category, folder, body, replace_thread)
+        finally:
+            conn.close()
+
+    def _add(self, conn: sqlite3.Connection, email_data: Dict, category: str, folder: str,
+             body: Optional[str], replace_thread: bool) -> None:
+        message_id = email_data.get('message_id', '')
+        if message_id:
+            conn.execute("DELETE FROM messages WHERE account = ? AND message_id = ?", (self.account, message_id))
+        thread_rows = self._thread_rows(conn, email_data, folder)
+        # A message joining a known thread keeps its key, even if its References are incomplete
+        thread = thread_rows[0][1] if thread_rows else thread_root(email_data)
+        if replace_thread:
+            conn.executemany("DELETE FROM messages WHERE rowid = ?", [(row[0],) for row in thread_rows])
+        conn.execute(
+            "INSERT INTO messages (subject, sender, body, category, account, message_id, thread, correspondent, "
+            "subject_key, folder, date, filed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                email_data.get('subject', ''), email_data.get('from', ''),
+                email_data.get('body', '') if body is None else body, category,
+                self.account, message_id, thread, correspondent(email_data.get('from')),
+                normalize_subject(email_data.get('subject')), folder, email_data.get('date', ''), time.time()
+            )
+        )
+
+    def _thread_rows(self, conn: sqlite3.Connection, email_data: Dict, folder: str) -> List[Tuple[int, str]]:
+        """(rowid, thread) of this account's entries in a folder from the message's thread, newest first.
+
+        Entries are matched on the Message-ID chain; only without a match is
+        the subject used, and then only for the same correspondent.
+        """
+        ids = thread_ids(email_data)
+        if ids:
+            marks = ", ".join("?" * len(ids))
+            rows = conn.execute(
+                f"SELECT rowid, thread FROM messages WHERE account = ? AND folder = ? "
+                f"AND (thread IN ({marks}) OR message_id IN ({marks})) ORDER BY filed_at DESC",
+                [self.account, folder] + ids + ids
+            ).fetchall()
+            if rows:
+                return rows
+        subject_key, sender = normalize_subject(email_data.get('subject')), correspondent(email_data.get('from'))
+        if not subject_key or not sender:
+            return []
+        return conn.execute(
+            "SELECT rowid, thread FROM messages WHERE account = ? AND folder = ? AND subject_key = ? "
+            "AND correspondent = ? ORDER BY filed_at DESC",
+            (self.account, folder, subject_key, sender)
+        ).fetchall()
+
+    def search(self, query: str, category: Optional[str] = None,
+               folder: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Best matches first (bm25), with a highlighted body snippet."""
+        match = build_match_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT subject, sender, category, message_id, folder, date, filed_at, "
+            "snippet(messages, 2, '[', ']', '...', 12), bm25(messages, 4.0, 2.0, 1.0, 1.0) "
+            "FROM messages WHERE messages MATCH ? AND account = ?"
+        )
+        params: List = [match, self.account]
+        if category:
+            sql += " AND category = ?"
+            params.append(category)
+        if folder:
+            sql += " AND folder = ?"
+            params.append(folder)
+        sql += " ORDER BY bm25(messages, 4.0, 2.0, 1.0, 1.0) LIMIT ?"
+        params.append(limit)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "subject": row[0], "sender": row[1], "category": row[2], "message_id": row[3],
+                "folder": row[4], "date": row[5], "filed_at": row[6], "snippet": row[7], "score": row[8]
+            }
+            for row in rows
+        ]
+
+    def latest_in_thread(self, email_data: Dict, folder: str) -> Optional[str]:
+        """Body of the most recently filed message of an email's thread, if indexed."""
+        conn = self._connect()
+        try:
+            thread_rows = self._thread_rows(conn, email_data, folder)
+            row = conn.execute(
+                "SELECT body FROM messages WHERE rowid = ?", (thread_rows[0][0],)
+            ).fetchone() if thread_rows else None
+        finally:
+            conn.close()
+        return row[0] if row else None
@@ -0,0 +1,144 @@
+import os
+import re
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# Stored threads are plain text: newest turn first, each older turn appended
+# after THREAD_SEPARATOR, and the rolling summary of dropped turns last.
+THREAD_SEPARATOR = f"\n\n{'-' * 60}\nPrevious Thread:\n"
+SUMMARY_SEPARATOR = f"\n\n{'-' * 60}\nEarlier Conversation Summary:\n"
+
+# First line of a stored summary: how many turns have been folded into it
+FOLDED_TURNS_RE = re.compile(r'^\((\d+) earlier turns?\)\n')
+
+CHARS_PER_TOKEN = 4
+
+def get_thread_max_turns() -> int:
+    return int(os.getenv('THREAD_MAX_TURNS', 3))
+
+def get_thread_token_budget() -> int:
+    return int(os.getenv('THREAD_TOKEN_BUDGET', 2000))
+
+def get_summary_token_budget() -> int:
+    return int(os.getenv('THREAD_SUMMARY_TOKEN_BUDGET', 300))
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate, good enough for prompt budgeting."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Truncate text to roughly max_tokens, marking the cut; ``keep_end`` keeps the tail instead."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 20:
+        return ""
+    if keep_end:
+        return "[...truncated]\n" + text[-(max_chars - 15):].lstrip()
+    return text[:max_chars - 15].rstrip() + "\n[...truncated]"
+
+def _split_thread(thread_history: Optional[str]) -> Tuple[List[str], str, int]:
+    """Turns (newest first), rolling summary and the number of turns folded into it."""
+    if not thread_history:
+        return [], "", 0
+
+    summary = ""
+    if SUMMARY_SEPARATOR in thread_history:
+        thread_history, summary = thread_history.split(SUMMARY_SEPARATOR, 1)
+    summary = summary.strip()
+    folded = 1 if summary else 0
+    match = FOLDED_TURNS_RE.match(summary + "\n")
+    if match:
+        folded, summary = int(match.group(1)), summary[match.end():].strip()
+
+    turns = [turn.strip() for turn in thread_history.split(THREAD_SEPARATOR)]
+    return [turn for turn in turns if turn], summary, folded
+
+def split_thread(thread_history: Optional[str]) -> Tuple[List[str], str]:
+    """Split a stored thread into turns (newest first) and the rolling summary."""
+    turns, summary, _ = _split_thread(thread_history)
+    return turns, summary
+
+def get_thread_depth(thread_history: Optional[str]) -> int:
+    """Number of earlier turns in a stored thread, including those folded into the summary.
+
+    Threads stored before the folded count was kept count their summary as one turn.
+    """
+    turns, _, folded = _split_thread(thread_history)
+    return len(turns) + folded
+
+def join_thread(turns: List[str], summary: str = "", folded: int = 0) -> str:
+    """Serialize turns (newest first) and summary back into stored thread text."""
+    content = THREAD_SEPARATOR.join(turns)
+    if summary:
+        count = f"({folded} earlier turn{'s' if folded != 1 else ''})\n" if folded else ""
+        content += f"{SUMMARY_SEPARATOR}{count}{summary}"
+    return content
+
+def build_thread_context(thread_history: Optional[str], new_message: str,
+                         max_turns: Optional[int] = None,
+                         token_budget: Optional[int] = None) -> str:
+    """Build prompt content for a reply with a bounded amount of thread history.
+
+    The rolling summary and the most recent ``max_turns`` turns are included,
+    newest first, until ``token_budget`` is spent. The new message is always
+    included in full.
+    """
+    max_turns = get_thread_max_turns() if max_turns is None else max_turns
+    token_budget = get_thread_token_budget() if token_budget is None else token_budget
+
+    turns, summary = split_thread(thread_history)
+    if not turns and not summary:
+        return new_message
+
+    remaining = token_budget
+    summary_text = ""
+    if summary:
+        summary_text = truncate_to_tokens(summary, min(get_summary_token_budget(), remaining))
+        remaining -= estimate_tokens(summary_text)
+
+    recent_turns = []
+    for turn in turns[:max_turns]:
+        if remaining <= 0:
+            break
+        turn_text = truncate_to_tokens(turn, remaining)
+        if not turn_text:
+            break
+        recent_turns.append(turn_text)
+        remaining -= estimate_tokens(turn_text)
+
+    sections = []
+    if summary_text:
+        sections.append(f"Summary of earlier conversation:\n{summary_text}")
+    if recent_turns:
+        # Oldest first reads naturally for the model
+        sections.append("Previous conversation:\n" + "\n\n---\n\n".join(reversed(recent_turns)))
+    sections.append(f"New message:\n{new_message}")
+    return "\n\n".join(sections)
+
+async def compact_thread(new_turn: str, thread_history: Optional[str],
+                         summarize: Callable[[str, List[str]], Awaitable[str]],
+                         max_turns: Optional[int] = None) -> str:
+    """Prepend a new turn to the stored thread and fold aged-out turns into the summary.
+
+    Only turns that drop out of the verbatim window are passed to ``summarize``
+    together with the cached summary, so each turn is summarized once.
+    """
+    max_turns = get_thread_max_turns() if max_turns is None else max_turns
+
+    turns, summary, folded = _split_thread(thread_history)
+    turns = [new_turn.strip()] + turns
+
+    kept_turns, dropped_turns = turns[:max_turns], turns[max_turns:]
+    if dropped_turns:
+        folded += len(dropped_turns)
+        try:
+            # Oldest first so the summary reads chronologically
+            summary = await summarize(summary, list(reversed(dropped_turns)))
+            summary = truncate_to_tokens(summary, get_summary_token_budget())
+        except Exception as e:
+            print(f"Error summarizing thread, keeping truncated turns: {str(e)}")
+            # Keep the end: the turns closest to the current message matter most
+            summary = "\n".join([summary] + list(reversed(dropped_turns))).strip()
+            summary = truncate_to_tokens(summary, get_summary_token_budget(), keep_end=True)
+
+    return join_thread(kept_turns, summary, folded)
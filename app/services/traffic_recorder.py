@@ -0,0 +1,242 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import re
+import smtplib
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Union
+
+RECORDING_VERSION = 1
+
+EMAIL_RE = re.compile(rb'[A-Za-z0-9._%+=-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+# Letters, digits and any non-ASCII byte; masking keeps lengths, line structure and punctuation
+MASK_RE = re.compile(rb'[A-Za-z0-9\x80-\xff]')
+QUOTED_RE = re.compile(rb'"(?:[^"\\]|\\.)*"')
+HEADER_NAME_RE = re.compile(rb'^[\x21-\x39\x3b-\x7e]+$')
+LITERAL_RE = re.compile(rb'\{(\d+)(\+?)\}\r?\n?$')
+
+# Header values replayed as-is: they shape parsing, threading and filtering, not content
+KEEP_HEADERS = {
+    b'content-type', b'content-transfer-encoding', b'mime-version', b'date', b'message-id',
+    b'in-reply-to', b'references', b'list-id', b'auto-submitted', b'precedence',
+    b'x-auto-response-suppress', b'content-language'
+}
+# IMAP commands whose quoted arguments are search terms (subjects, names)
+SEARCH_VERBS = {b'SEARCH', b'SORT', b'THREAD', b'ESEARCH'}
+
+def get_traffic_record_path() -> Optional[str]:
+    """Recording is on when TRAFFIC_RECORD_PATH is set; each process writes its own file.
+
+    "{pid}" in the path is replaced by the process id; without it the id
+    goes before the extensions (traffic.jsonl.gz -> traffic.1234.jsonl.gz).
+    Worker processes appending to one gzip file would interleave lines.
+    """
+    path = os.getenv('TRAFFIC_RECORD_PATH')
+    if not path:
+        return None
+    pid = str(os.getpid())
+    if '{pid}' in path:
+        return path.replace('{pid}', pid)
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition('.')
+    return os.path.join(directory, f"{stem}.{pid}{dot}{extensions}")
+
+def _hash_address(match) -> bytes:
+    digest = hashlib.sha1(match.group(0).lower()).hexdigest()[:10]
+    return f"user-{digest}@example.invalid".encode()
+
+def scrub_addresses(data: bytes) -> bytes:
+    """Replace email addresses with stable placeholders, so senders and threads still group."""
+    return EMAIL_RE.sub(_hash_address, data)
+
+def mask_text(data: bytes) -> bytes:
+    """Mask content but keep addresses (hashed), lengths elsewhere and punctuation."""
+    parts = []
+    position = 0
+    for match in EMAIL_RE.finditer(data):
+        parts.append(MASK_RE.sub(lambda m: b'x', data[position:match.start()]))
+        parts.append(_hash_address(match))
+        position = match.end()
+    parts.append(MASK_RE.sub(lambda m: b'x', data[position:]))
+    return b"".join(parts)
+
+def scrub_message(data: Union[bytes, memoryview]) -> bytes:
+    """Scrub an RFC822 message (or a header block) but keep its MIME skeleton.
+
+    Structural headers (KEEP_HEADERS) and multipart boundaries are kept;
+    other header values and all body text are masked character by
+    character, so sizes, line lengths and nesting match the original.
+    """
+    in_headers = True
+    keep = False
+    boundaries = []
+    lines = []
+    for line in bytes(data).splitlines(keepends=True):
+        stripped = line.rstrip(b'\r\n')
+        if in_headers:
+            if not stripped:
+                in_headers = False
+                lines.append(line)
+                continue
+            if stripped[:1] in (b' ', b'\t'):
+                lines.append(line if keep else mask_text(line))
+                continue
+            name, colon, value = line.partition(b':')
+            if not colon or not HEADER_NAME_RE.match(name):
+                # Not a header after all (e.g. a partial body fetch): mask the whole line
+                keep = False
+                lines.append(mask_text(line))
+                continue
+            keep = name.lower() in KEEP_HEADERS
+            if keep:
+                boundaries += re.findall(rb'boundary="?([^";\r\n]+)', line, re.IGNORECASE)
+                lines.append(scrub_addresses(line))
+            else:
+                lines.append(name + colon + mask_text(value))
+        elif stripped.startswith(b'--') and any(stripped[2:].startswith(b) for b in boundaries):
+            # Each part starts with its own headers
+            in_headers = True
+            lines.append(line)
+        else:
+            lines.append(mask_text(line))
+    return b"".join(lines)
+
+def scrub_imap_command(line: bytes) -> bytes:
+    """Drop credentials and search terms from an IMAP command line."""
+    words = line.split(b' ', 3)
+    verb = words[1].upper() if len(words) > 1 else b''
+    if verb == b'UID' and len(words) > 2:
+        verb = words[2].upper()
+    if verb in (b'LOGIN', b'AUTHENTICATE'):
+        return b' '.join(words[:2]) + b' ***\r\n'
+    if verb in SEARCH_VERBS:
+        line = QUOTED_RE.sub(lambda m: b'"' + mask_text(m.group(0)[1:-1]) + b'"', line)
+    return scrub_addresses(line)
+
+class TrafficRecorder:
+    """Append-only log of mail protocol traffic and LLM call metadata, for replay.
+
+    One gzip-compressed JSON object per line: a header, then events with a
+    monotonic offset ``t`` in seconds. IMAP and SMTP events carry the
+    scrubbed bytes of one send or read (``dir`` "c" for client, "s" for
+    server); LLM events carry only timings, token counts and sizes.
+    Shared by every connection in the process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'at', encoding='latin-1')
+        self._start = time.monotonic()
+        self._connections = 0
+        self._unflushed = 0
+        self.events = 0
+        self._write({"version": RECORDING_VERSION, "started": time.time(), "pid": os.getpid()})
+
+    def _write(self, event: Dict) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(event, separators=(',', ':')) + "\n")
+            self.events += 1
+            self._unflushed += 1
+            if self._unflushed >= 100:
+                self._file.flush()
+                self._unflushed = 0
+
+    def open_connection(self, proto: str) -> int:
+        with self._lock:
+            self._connections += 1
+            conn = self._connections
+        self._write({"t": self._elapsed(), "conn": conn, "proto": proto, "dir": "open"})
+        return conn
+
+    def _elapsed(self) -> float:
+        return round(time.monotonic() - self._start, 6)
+
+    def record(self, conn: int, proto: str, direction: str, data: bytes, literal: bool = False) -> None:
+        """Record data that has already been scrubbed by the caller."""
+        event = {"t": self._elapsed(), "conn": conn, "proto": proto, "dir": direction,
+                 "data": data.decode('latin-1')}
+        if literal:
+            event["literal"] = True
+        self._write(event)
+
+    def record_llm(self, kind: str, **metadata) -> None:
+        self._write({"t": self._elapsed(), "proto": "llm", "kind": kind, **metadata})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+@lru_cache()
+def get_traffic_recorder() -> Optional[TrafficRecorder]:
+    """The process-wide recorder, or None when TRAFFIC_RECORD_PATH is unset."""
+    path = get_traffic_record_path()
+    if not path:
+        return None
+    recorder = TrafficRecorder(path)
+    atexit.register(recorder.close)
+    print(f"Recording IMAP/SMTP/LLM traffic to {path}")
+    return recorder
+
+class IMAPRecording:
+    """Scrubs and records the I/O of one IMAP connection (see imap_transport.TransportMixin)."""
+
+    def __init__(self, recorder: TrafficRecorder):
+        self.recorder = recorder
+        self.conn = recorder.open_connection("imap")
+        self._client_literal = False
+
+    def sent(self, data: Union[bytes, memoryview]) -> None:
+        if self._client_literal:
+            self._client_literal = False
+            self.recorder.record(self.conn, "imap", "c", scrub_message(data), literal=True)
+            return
+        data = bytes(data)
+        self._client_literal = bool(LITERAL_RE.search(data))
+        self.recorder.record(self.conn, "imap", "c", scrub_imap_command(data))
+
+    def received_line(self, line: bytes) -> None:
+        self.recorder.record(self.conn, "imap", "s", scrub_addresses(line))
+
+    def received_literal(self, data: bytes) -> None:
+        self.recorder.record(self.conn, "imap", "s", scrub_message(data), literal=True)
+
+class RecordingSMTP(smtplib.SMTP):
+    """smtplib.SMTP that records each command and reply, with credentials and content scrubbed."""
+
+    def __init__(self, host: str = '', port: int = 0, recorder: Optional[TrafficRecorder] = None, **kwargs):
+        # Set before SMTP.__init__, which connects and reads the greeting
+        self._recorder = recorder or get_traffic_recorder()
+        self._conn = self._recorder.open_connection("smtp")
+        self._last_code = None
+        super().__init__(host, port, **kwargs)
+
+    def send(self, s) -> None:
+        data = s.encode(self.command_encoding) if isinstance(s, str) else bytes(s)
+        if self._last_code == 334:
+            scrubbed = b'***\r\n'
+        elif self._last_code == 354:
+            scrubbed = scrub_message(data)
+        elif data[:5].upper() == b'AUTH ':
+            scrubbed = b' '.join(data.split(b' ')[:2]).rstrip(b'\r\n') + b' ***\r\n'
+        else:
+            scrubbed = scrub_addresses(data)
+        self._recorder.record(self._conn, "smtp", "c", scrubbed)
+        super().send(s)
+
+    def getreply(self):
+        code, message = super().getreply()
+        lines = message.split(b'\n') if message else [b'']
+        raw = b"".join(f"{code}-".encode() + line + b"\r\n" for line in lines[:-1])
+        raw += f"{code} ".encode() + lines[-1] + b"\r\n"
+        self._recorder.record(self._conn, "smtp", "s", scrub_addresses(raw))
+        self._last_code = code
+        return code, message
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import re
+import socket
+import socketserver
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.traffic_recorder import LITERAL_RE
+
+CAPABILITY_LINE_RE = re.compile(rb'CAPABILITY', re.IGNORECASE)
+# The replay server speaks neither TLS nor DEFLATE, so the client must not negotiate them
+UNREPLAYABLE_CAPABILITIES_RE = re.compile(rb' (?:COMPRESS=DEFLATE|STARTTLS)(?=[ \]\r])', re.IGNORECASE)
+SMTP_DATA_END = b'\r\n.\r\n'
+
+def load_recording(path: str) -> List[Dict]:
+    """Events of a recording (gzip or plain JSON lines), header lines skipped."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='latin-1') as file:
+        return [event for event in map(json.loads, filter(None, map(str.strip, file))) if 'version' not in event]
+
+class Exchange:
+    """One client command and the server data that followed it in the recording."""
+
+    def __init__(self, verb: bytes, tag: Optional[bytes], client_t: float):
+        self.verb = verb
+        self.tag = tag
+        self.client_t = client_t
+        self.responses: List[Dict] = []
+
+def imap_verb(line: bytes) -> bytes:
+    words = line.split(b' ', 3)
+    verb = words[1].upper().rstrip(b'\r\n') if len(words) > 1 else b''
+    if verb == b'UID' and len(words) > 2:
+        verb += b' ' + words[2].upper().rstrip(b'\r\n')
+    return verb
+
+def smtp_verb(line: bytes, last_code: Optional[int]) -> bytes:
+    if last_code == 354:
+        return b'<DATA>'
+    if last_code == 334:
+        return b'<AUTH>'
+    return line.split(b' ', 1)[0].strip().upper()
+
+def build_exchanges(events: List[Dict]) -> Tuple[Exchange, List[Exchange]]:
+    """Group one connection's events into the greeting plus one Exchange per client command."""
+    greeting = current = Exchange(b'', None, events[0]['t'] if events else 0.0)
+    exchanges: List[Exchange] = []
+    in_command = False
+    last_code = None
+    proto = events[0]['proto'] if events else 'imap'
+    for event in events:
+        data = event.get('data', '').encode('latin-1')
+        if event['dir'] == 'c':
+            if proto == 'imap' and in_command:
+                # Literal or the rest of a command line after it
+                in_command = bool(LITERAL_RE.search(data)) or bool(event.get('literal'))
+                current.client_t = event['t']
+                continue
+            if proto == 'imap':
+                current = Exchange(imap_verb(data), data.split(b' ', 1)[0], event['t'])
+                in_command = bool(LITERAL_RE.search(data))
+            else:
+                current = Exchange(smtp_verb(data, last_code), None, event['t'])
+            exchanges.append(current)
+        elif event['dir'] == 's':
+            if proto == 'imap' and in_command and data.startswith(b'+'):
+                # Continuation for a synchronizing literal; the replay server sends its own
+                continue
+            if proto == 'smtp' and data[:3].isdigit():
+                last_code = int(data[:3])
+            current.responses.append(event)
+    return greeting, exchanges
+
+class ReplayStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.commands = 0
+        self.mismatches = 0
+        self.skipped = 0
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def summary(self) -> Dict:
+        return {
+            "connections": self.connections, "commands": self.commands,
+            "mismatches": self.mismatches, "skipped": self.skipped
+        }
+
+def _strip_starttls(reply: bytes) -> bytes:
+    """Drop STARTTLS from an EHLO reply, keeping "code SP" on the last line."""
+    lines = [line for line in reply.split(b'\r\n') if line]
+    kept = [line for line in lines if line[4:].upper() != b'STARTTLS']
+    if len(kept) == len(lines) or not kept:
+        return reply
+    kept = [line[:3] + b'-' + line[4:] for line in kept[:-1]] + [kept[-1][:3] + b' ' + kept[-1][4:]]
+    return b"".join(line + b'\r\n' for line in kept)
+
+class _Session:
+    """Plays one recorded connection back to one live client."""
+
+    def __init__(self, sock: socket.socket, proto: str, events: List[Dict], speed: float, stats: ReplayStats):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        self.proto = proto
+        self.speed = speed
+        self.stats = stats
+        self.greeting, self.exchanges = build_exchanges(events)
+        self.position = 0
+        self.last_code = None
+
+    def run(self) -> None:
+        self.stats.add(connections=1)
+        self._respond(self.greeting, None, time.monotonic())
+        while True:
+            command = self._read_command()
+            if not command:
+                break
+            received = time.monotonic()
+            verb = imap_verb(command) if self.proto == 'imap' else smtp_verb(command, self.last_code)
+            exchange = self._find(verb)
+            tag = command.split(b' ', 1)[0]
+            if exchange is None:
+                self.stats.add(commands=1, mismatches=1)
+                self._send(tag + b' OK replay\r\n' if self.proto == 'imap' else b'250 OK replay\r\n')
+                self.last_code = 250
+                continue
+            self.stats.add(commands=1)
+            self._respond(exchange, tag, received)
+            if verb in (b'LOGOUT', b'QUIT'):
+                break
+
+    def _find(self, verb: bytes) -> Optional[Exchange]:
+        """The next recorded exchange for this verb; commands the live client skipped are dropped."""
+        for index in range(self.position, len(self.exchanges)):
+            if self.exchanges[index].verb == verb:
+                self.stats.add(skipped=index - self.position)
+                self.position = index + 1
+                return self.exchanges[index]
+        return None
+
+    def _read_command(self) -> bytes:
+        line = self.file.readline()
+        if self.proto == 'smtp':
+            if line and self.last_code == 354:
+                while not line.endswith(SMTP_DATA_END):
+                    more = self.file.readline()
+                    if not more:
+                        break
+                    line += more
+            return line
+        parts = [line]
+        while line and LITERAL_RE.search(line):
+            match = LITERAL_RE.search(line)
+            if not match.group(2):
+                self._send(b'+ Ready for literal\r\n')
+            parts.append(self.file.read(int(match.group(1))))
+            line = self.file.readline()
+            parts.append(line)
+        return b"".join(parts)
+
+    def _respond(self, exchange: Exchange, tag: Optional[bytes], received: float) -> None:
+        responses = exchange.responses
+        for index, event in enumerate(responses):
+            data = event['data'].encode('latin-1')
+            if not event.get('literal'):
+                if tag is not None and exchange.tag and data.startswith(exchange.tag + b' '):
+                    data = tag + data[len(exchange.tag):]
+                if self.proto == 'imap' and CAPABILITY_LINE_RE.search(data):
+                    data = UNREPLAYABLE_CAPABILITIES_RE.sub(b'', data)
+                if self.proto == 'smtp':
+                    data = _strip_starttls(data)
+                if index + 1 < len(responses) and responses[index + 1].get('literal'):
+                    # Scrubbing may change a literal's size; announce the replayed one
+                    size = len(responses[index + 1]['data'].encode('latin-1'))
+                    data = LITERAL_RE.sub(b'{%d}\r\n' % size, data)
+                if self.proto == 'smtp' and data[:3].isdigit():
+                    self.last_code = int(data[:3])
+            if self.speed > 0:
+                delay = (event['t'] - exchange.client_t) / self.speed - (time.monotonic() - received)
+                if delay > 0:
+                    time.sleep(delay)
+            self._send(data)
+
+    def _send(self, data: bytes) -> None:
+        self.sock.sendall(data)
+
+class _ReplayTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class ReplayServer:
+    """Serve recorded IMAP and SMTP sessions to a live client, at original or scaled speed.
+
+    Each accepted connection replays the next recorded connection of that
+    protocol (cycling when the recording runs out). Client commands are
+    matched to the recording by verb, so tags, literal sizes and commands
+    the live client no longer sends do not break the replay; unmatched
+    commands get a bare OK and are counted as mismatches. ``speed`` scales
+    the recorded server latencies (2.0 is twice as fast, 0 means no delay).
+    """
+
+    def __init__(self, events: List[Dict], speed: float = 1.0, host: str = '127.0.0.1',
+                 imap_port: int = 0, smtp_port: int = 0):
+        self.speed = speed
+        self.stats = ReplayStats()
+        self.servers: Dict[str, socketserver.ThreadingTCPServer] = {}
+        connections: Dict[str, Dict[int, List[Dict]]] = {'imap': {}, 'smtp': {}}
+        for event in events:
+            if event.get('proto') in connections and 'conn' in event:
+                connections[event['proto']].setdefault(event['conn'], []).append(event)
+        for proto, port in (('imap', imap_port), ('smtp', smtp_port)):
+            if connections[proto]:
+                self.servers[proto] = self._make_server(proto, list(connections[proto].values()), host, port)
+
+    def _make_server(self, proto: str, recorded: List[List[Dict]], host: str, port: int):
+        replay = self
+        sessions = itertools.cycle(recorded)
+        lock = threading.Lock()
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with lock:
+                    events = next(sessions)
+                try:
+                    _Session(self.request, proto, events, replay.speed, replay.stats).run()
+                except (ConnectionError, OSError):
+                    pass
+
+        return _ReplayTCPServer((host, port), Handler)
+
+    def port(self, proto: str) -> Optional[int]:
+        server = self.servers.get(proto)
+        return server.server_address[1] if server else None
+
+    def start(self) -> "ReplayServer":
+        for server in self.servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+class _ReplayStream:
+    """Async iterator over streamed chat completion chunks, paced like the recording."""
+
+    def __init__(self, content: str, usage: SimpleNamespace, ttft: float, rest: float):
+        self.content = content
+        self.usage = usage
+        self.ttft = ttft
+        self.rest = rest
+        self.sent = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.usage is None:
+            raise StopAsyncIteration
+        if not self.sent:
+            self.sent = True
+            await asyncio.sleep(self.ttft)
+            head = self.content[:1]
+            return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=head))])
+        await asyncio.sleep(self.rest)
+        usage, self.usage = self.usage, None
+        chunk = SimpleNamespace(delta=SimpleNamespace(content=self.content[1:]))
+        return SimpleNamespace(usage=usage, choices=[chunk])
+
+    async def close(self) -> None:
+        pass
+
+class ReplayLLMClient:
+    """Stands in for AsyncOpenAI, answering with the recorded timing, token counts and sizes.
+
+    Content is synthetic: replies are filler of the recorded length (with
+    the recorded self-confidence), batched classifications repeat the
+    recorded categories. Calls of each kind are answered in recorded order.
+    """
+
+    def __init__(self, events: List[Dict], speed: float = 1.0):
+        self.speed = speed
+        self.calls: Dict[str, Iterator[Dict]] = {}
+        for kind in ('reply', 'classify', 'summary'):
+            recorded = [event for event in events if event.get('proto') == 'llm' and event.get('kind') == kind]
+            if recorded:
+                self.calls[kind] = itertools.cycle(recorded)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @classmethod
+    def from_recording(cls, path: str, speed: Optional[float] = None) -> "ReplayLLMClient":
+        speed = float(os.getenv('LLM_REPLAY_SPEED', 1.0)) if speed is None else speed
+        return cls(load_recording(path), speed=speed)
+
+    def _scaled(self, seconds: Optional[float]) -> float:
+        return (seconds or 0.0) / self.speed if self.speed > 0 else 0.0
+
+    async def create(self, model: str, messages: List[Dict], stream: bool = False,
+                     response_format: Optional[Dict] = None, **kwargs):
+        kind = 'reply' if stream else 'classify' if response_format else 'summary'
+        if kind not in self.calls:
+            raise RuntimeError(f"Recording has no '{kind}' LLM calls to replay")
+        call = next(self.calls[kind])
+        usage = SimpleNamespace(prompt_tokens=call.get('prompt_tokens', 0),
+                                completion_tokens=call.get('completion_tokens', 0))
+        if kind == 'classify':
+            items = [
+                {"id": index, "category": item['category'], "confidence": item['confidence'], "reason": "replay"}
+                for index, item in enumerate(call.get('items') or []) if item
+            ]
+            content = json.dumps({"items": items})
+        elif kind == 'reply':
+            reply = {"reply": "", "confidence": call.get('confidence')}
+            filler = max(0, call.get('response_chars', 0) - len(json.dumps(reply)))
+            content = json.dumps({**reply, "reply": "x" * filler})
+        else:
+            content = "x" * call.get('response_chars', 0)
+
+        if stream:
+            ttft = self._scaled(call.get('ttft'))
+            return _ReplayStream(content, usage, ttft, max(0.0, self._scaled(call.get('latency')) - ttft))
+        await asyncio.sleep(self._scaled(call.get('latency')))
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=message)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded IMAP/SMTP traffic (TRAFFIC_RECORD_PATH)")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="latency divisor; 0 replays without delays")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--imap-port", type=int, default=1143)
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    args = parser.parse_args()
+    replay = ReplayServer(load_recording(args.recording), speed=args.speed, host=args.host,
+                          imap_port=args.imap_port, smtp_port=args.smtp_port).start()
+    print(f"Replaying {args.recording}: IMAP on {replay.port('imap')}, SMTP on {replay.port('smtp')}")
+    print(f"Point the agent at it with EMAIL_HOST={args.host} IMAP_PORT={replay.port('imap')} "
+          f"SMTP_PORT={replay.port('smtp')} MAIL_TLS=false LLM_REPLAY_PATH={args.recording}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        replay.stop()
+        print(json.dumps(replay.stats.summary()))
@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel
+
+from app.services.rate_limiter import SharedRateLimiter
+
+class MailboxAccount(BaseModel):
+    name: str
+    email_host: str
+    email_address: str
+    email_password: Optional[str] = None
+    # Name of an environment variable holding the password, to keep it out of the file
+    password_env: Optional[str] = None
+    imap_port: int = 993
+    smtp_port: int = 587
+    poll_interval: float = 60
+    batch_size: int = 5
+
+    def to_settings(self):
+        from app.config.email_config import EmailSettings
+        password = self.email_password
+        if self.password_env:
+            password = os.getenv(self.password_env, password)
+        return EmailSettings(
+            EMAIL_HOST=self.email_host,
+            EMAIL_ADDRESS=self.email_address,
+            EMAIL_PASSWORD=password or "",
+            IMAP_PORT=self.imap_port,
+            SMTP_PORT=self.smtp_port
+        )
+
+def load_accounts(path: str) -> List[MailboxAccount]:
+    """Load mailbox accounts from a JSON or YAML file with an ``accounts`` list."""
+    with open(path, 'r') as file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            data = yaml.safe_load(file)
+        else:
+            data = json.load(file)
+    accounts = [MailboxAccount(**account) for account in data['accounts']]
+
+    names = [account.name for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError("Mailbox account names must be unique")
+    return accounts
+
+def shard_accounts(accounts: List[MailboxAccount], n_workers: int) -> List[List[MailboxAccount]]:
+    """Spread accounts round-robin over at most n_workers shards."""
+    n_workers = max(1, min(n_workers, len(accounts)))
+    shards: List[List[MailboxAccount]] = [[] for _ in range(n_workers)]
+    for index, account in enumerate(accounts):
+        shards[index % n_workers].append(account)
+    return shards
+
+async def run_mailbox(account: MailboxAccount, rate_limiter: SharedRateLimiter, stop_event) -> None:
+    """Poll and process one mailbox until the stop event is set."""
+    from app.services.email_client import EmailClient
+
+    client = EmailClient(settings=account.to_settings())
+    client.ai_client.rate_limiter = rate_limiter
+    loop = asyncio.get_running_loop()
+
+    while not stop_event.is_set():
+        try:
+            processed = await client.process_latest_emails(limit=account.batch_size)
+            print(f"[{account.name}] processed {len(processed)} emails")
+        except Exception as e:
+            print(f"[{account.name}] error processing mailbox: {str(e)}")
+        # Wait for the next poll without blocking the loop, waking early on shutdown
+        await loop.run_in_executor(None, stop_event.wait, account.poll_interval)
+
+    await client.close()
+
+def run_worker(worker_id: int, accounts: List[MailboxAccount],
+               rate_limiter: SharedRateLimiter, stop_event) -> None:
+    """Worker process entry point: serve a shard of mailboxes, each on its own thread and loop.
+
+    EmailClient's IMAP calls block, so mailboxes sharing one event loop
+    would wait on each other's network round trips.
+    """
+    print(f"Worker {worker_id} (pid {os.getpid()}) serving {[a.name for a in accounts]}")
+
+    with ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix=f"mailbox-worker-{worker_id}") as pool:
+        futures = [
+            pool.submit(asyncio.run, run_mailbox(account, rate_limiter, stop_event))
+            for account in accounts
+        ]
+        for future in futures:
+            future.result()
+
+class MailboxSupervisor:
+    """Shard mailbox accounts over worker processes and keep them running.
+
+    A worker that dies is restarted with its shard. A slot that keeps
+    crashing (more than ``max_restarts`` times) is retired and its accounts
+    are spread over the least-loaded remaining workers.
+    """
+
+    def __init__(self, accounts: List[MailboxAccount], n_workers: Optional[int] = None,
+                 max_restarts: int = 3, worker_target: Callable = run_worker,
+                 requests_per_minute: Optional[float] = None):
+        self.ctx = multiprocessing.get_context('spawn')
+        n_workers = n_workers or int(os.getenv('MAILBOX_WORKERS', os.cpu_count() or 1))
+        self.assignments: Dict[int, List[MailboxAccount]] = dict(enumerate(shard_accounts(accounts, n_workers)))
+        self.max_restarts = max_restarts
+        self.worker_target = worker_target
+        self.rate_limiter = SharedRateLimiter(requests_per_minute, ctx=self.ctx)
+        self.stop_event = self.ctx.Event()
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.restarts: Dict[int, int] = {slot: 0 for slot in self.assignments}
+
+    def start(self) -> None:
+        for slot, accounts in self.assignments.items():
+            self._start_worker(slot, accounts)
+
+    def _start_worker(self, slot: int, accounts: List[MailboxAccount]) -> None:
+        process = self.ctx.Process(
+            target=self.worker_target,
+            args=(slot, accounts, self.rate_limiter, self.stop_event),
+            name=f"mailbox-worker-{slot}",
+            daemon=True
+        )
+        process.start()
+        self.processes[slot] = process
+
+    def _stop_worker(self, slot: int, timeout: float = 10) -> None:
+        process = self.processes.pop(slot, None)
+        if process is None:
+            return
+        process.terminate()
+        process.join(timeout)
+
+    def check_workers(self) -> None:
+        """Restart or rebalance any worker that has exited."""
+        for slot, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            print(f"Worker {slot} exited with code {process.exitcode}")
+            self.processes.pop(slot)
+            self._handle_dead_worker(slot)
+
+    def _handle_dead_worker(self, slot: int) -> None:
+        self.restarts[slot] += 1
+        if self.restarts[slot] <= self.max_restarts or len(self.assignments) == 1:
+            print(f"Restarting worker {slot} (restart {self.restarts[slot]})")
+            self._start_worker(slot, self.assignments[slot])
+            return
+
+        print(f"Worker {slot} keeps crashing, moving its accounts to other workers")
+        orphaned = self.assignments.pop(slot)
+        touched = set()
+        for account in orphaned:
+            target = min(self.assignments, key=lambda s: len(self.assignments[s]))
+            self.assignments[target].append(account)
+            touched.add(target)
+        for target in touched:
+            self._stop_worker(target)
+            self._start_worker(target, self.assignments[target])
+
+    def run(self, check_interval: float = 5) -> None:
+        """Start the workers and supervise them until interrupted."""
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                time.sleep(check_interval)
+                self.check_workers()
+        except KeyboardInterrupt:
+            print("Shutting down mailbox workers...")
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout: float = 30) -> None:
+        self.stop_event.set()
+        for slot, process in list(self.processes.items()):
+            process.join(timeout)
+            if process.is_alive():
+                self._stop_worker(slot)
+        self.processes.clear()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve several mailboxes across worker processes")
+    parser.add_argument("accounts_file", help="JSON or YAML file with an 'accounts' list")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--requests-per-minute", type=float, default=None,
+                        help="LLM request budget shared by all workers")
+    args = parser.parse_args()
+
+    MailboxSupervisor(
+        load_accounts(args.accounts_file),
+        n_workers=args.workers,
+        requests_per_minute=args.requests_per_minute
+    ).run()
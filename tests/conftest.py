@@ -0,0 +1,256 @@
+import re
+from email.message import EmailMessage
+
+import pytest
+
+def make_raw_email(subject: str, sender: str = "guest@example.com", body: str = "Hello",
+                   **headers) -> bytes:
+    msg = EmailMessage()
+    msg['From'] = sender
+    msg['To'] = "info@hostellybeer.com"
+    msg['Subject'] = subject
+    msg['Date'] = "Mon, 19 Oct 2026 10:00:00 +0000"
+    msg['Message-ID'] = f"<{abs(hash(subject))}@example.com>"
+    for name, value in headers.items():
+        msg[name.replace('_', '-')] = value
+    msg.set_content(body)
+    return msg.as_bytes()
+
+class FakeIMAP:
+    """Small in-memory IMAP server object covering the imaplib calls we use."""
+
+    def __init__(self, folders=None, uidvalidity=1, capabilities=()):
+        self.folders = {name: dict(messages) for name, messages in (folders or {"INBOX": {}}).items()}
+        self.uidvalidity = uidvalidity
+        self.capabilities = tuple(capabilities)
+        self.selected = None
+        self.commands = []
+        self.untagged = {}
+
+    def add(self, folder, raw, flags=()):
+        messages = self.folders.setdefault(folder, {})
+        uid = max(messages, default=0) + 1
+        messages[uid] = {"raw": raw, "flags": list(flags)}
+        return uid
+
+    def _unquote(self, folder):
+        return folder[1:-1] if folder.startswith('"') else folder
+
+    def select(self, folder="INBOX", readonly=False):
+        folder = self._unquote(folder)
+        if folder not in self.folders:
+            return 'NO', [b'no such folder']
+        self.selected = folder
+        return 'OK', [str(len(self.folders[folder])).encode()]
+
+    def response(self, code):
+        if code in self.untagged:
+            return code, self.untagged.pop(code)
+        if code == 'UIDVALIDITY':
+            return code, [str(self.uidvalidity).encode()]
+        if code == 'UIDNEXT' and self.selected is not None:
+            return code, [str(max(self.folders[self.selected], default=0) + 1).encode()]
+        return code, [None]
+
+    def list(self, directory='""', pattern='*'):
+        if pattern == '""':
+            return 'OK', [b'(\\Noselect) "/" ""']
+        return 'OK', [f'(\\HasNoChildren) "/" "{name}"'.encode() for name in self.folders]
+
+    def _match_uids(self, criteria):
+        messages = self.folders[self.selected]
+        uids = sorted(messages)
+        text = " ".join(criteria)
+        range_match = re.search(r'UID (\d+):(\d+|\*)', text)
+        if range_match:
+            low = int(range_match.group(1))
+            high = max(uids, default=0) if range_match.group(2) == '*' else int(range_match.group(2))
+            uids = [uid for uid in uids if low <= uid <= high]
+        if 'NOT DELETED' in text:
+            uids = [uid for uid in uids if '\\Deleted' not in messages[uid]['flags']]
+        elif 'DELETED' in criteria:
+            uids = [uid for uid in uids if '\\Deleted' in messages[uid]['flags']]
+        return uids
+
+    def _fetch(self, uids, spec):
+        messages = self.folders[self.selected]
+        seqs = {uid: seq for seq, uid in enumerate(sorted(messages), 1)}
+        data = []
+        for uid in uids:
+            if uid not in messages:
+                continue
+            message, seq = messages[uid], seqs[uid]
+            flags = " ".join(message['flags'])
+            payload = message['raw']
+            if 'TEXT' in spec:
+                # Header and text as two literals, like a server answering both sections
+                header, text = payload.split(b"\n\n", 1)
+                text = text[:int(re.search(r'TEXT\]<0\.(\d+)>', spec).group(1))]
+                data.extend([
+                    (f'{seq} (UID {uid} FLAGS ({flags}) BODY[HEADER.FIELDS (SUBJECT)] {{{len(header) + 2}}}'.encode(),
+                     header + b"\n\n"),
+                    (f' BODY[TEXT]<0> {{{len(text)}}}'.encode(), text),
+                    b')'
+                ])
+                continue
+            if 'HEADER' in spec:
+                payload = payload.split(b"\n\n", 1)[0] + b"\n\n"
+            partial = re.search(r'<(\d+)\.(\d+)>', spec)
+            if partial:
+                offset = int(partial.group(1))
+                payload = payload[offset:offset + int(partial.group(2))]
+            meta = f'{seq} (UID {uid} FLAGS ({flags}) RFC822.SIZE {len(message["raw"])} BODY[] {{{len(payload)}}}'
+            data.extend([(meta.encode(), payload), b')'])
+        return 'OK', data
+
+    def _parse_set(self, uid_set):
+        uids = []
+        for part in uid_set.split(','):
+            if ':' in part:
+                low, high = part.split(':')
+                high = max(self.folders[self.selected], default=0) if high == '*' else int(high)
+                uids.extend(range(int(low), high + 1))
+            else:
+                uids.append(int(part))
+        return uids
+
+    def uid(self, command, *args):
+        self.commands.append((command.upper(), args))
+        command = command.upper()
+        if command == 'SEARCH':
+            uids = self._match_uids([a for a in args if a])
+            return 'OK', [" ".join(str(uid) for uid in uids).encode()]
+        if command == 'FETCH':
+            return self._fetch(self._parse_set(args[0]), args[1])
+        if command == 'STORE':
+            return self._store(self._parse_set(args[0]), args[1], args[2])
+        if command == 'EXPUNGE':
+            messages = self.folders[self.selected]
+            for uid in self._parse_set(args[0]):
+                if uid in messages and '\\Deleted' in messages[uid]['flags']:
+                    del messages[uid]
+            return 'OK', [None]
+        if command in ('COPY', 'MOVE'):
+            target = self._unquote(args[1])
+            for uid in self._parse_set(args[0]):
+                message = self.folders[self.selected][uid]
+                self.add(target, message['raw'], message['flags'])
+                if command == 'MOVE':
+                    del self.folders[self.selected][uid]
+            return 'OK', [None]
+        raise NotImplementedError(command)
+
+    def _store(self, uids, operation, flag_list):
+        for uid in uids:
+            flags = self.folders[self.selected][uid]['flags']
+            for flag in flag_list.strip('()').split():
+                if operation.startswith('+') and flag not in flags:
+                    flags.append(flag)
+                if operation.startswith('-') and flag in flags:
+                    flags.remove(flag)
+        return 'OK', [None]
+
+    def store(self, message_set, operation, flag_list):
+        self.commands.append(('STORE', (message_set, operation, flag_list)))
+        uids = sorted(self.folders[self.selected])
+        return self._store([uids[seq - 1] for seq in self._parse_set(message_set)], operation, flag_list)
+
+    def fetch(self, message_set, spec):
+        self.commands.append(('FETCH', (message_set, spec)))
+        uids = sorted(self.folders[self.selected])
+        return self._fetch([uids[seq - 1] for seq in self._parse_set(message_set) if seq <= len(uids)], spec)
+
+    def append(self, mailbox, flags, date_time, message):
+        self.add(self._unquote(mailbox), bytes(message), (flags or '').strip('()').split())
+        return 'OK', [None]
+
+    def _match_seqs(self, criteria):
+        """Sequence numbers matching SEARCH criteria (ranges, UID, NOT DELETED, UNSEEN)."""
+        messages = [self.folders[self.selected][uid] for uid in sorted(self.folders[self.selected])]
+        seqs = list(range(1, len(messages) + 1))
+        if 'UID' in criteria:
+            wanted = set(self._parse_set(criteria[criteria.index('UID') + 1]))
+            uids = sorted(self.folders[self.selected])
+            seqs = [seq for seq in seqs if uids[seq - 1] in wanted]
+        for criterion in criteria:
+            range_match = re.fullmatch(r'(\d+):(\d+)', criterion)
+            if range_match:
+                low, high = int(range_match.group(1)), int(range_match.group(2))
+                seqs = [seq for seq in seqs if low <= seq <= high]
+        text = " ".join(criteria)
+        if 'NOT DELETED' in text:
+            seqs = [seq for seq in seqs if '\\Deleted' not in messages[seq - 1]['flags']]
+        if 'UNSEEN' in text:
+            seqs = [seq for seq in seqs if '\\Seen' not in messages[seq - 1]['flags']]
+        return seqs
+
+    def search(self, charset, *criteria):
+        self.commands.append(('SEARCH', criteria))
+        return 'OK', [" ".join(str(seq) for seq in self._match_seqs(criteria)).encode()]
+
+    def sort(self, sort_criteria, charset, *criteria):
+        self.commands.append(('SORT', criteria))
+        # Arrival order is sequence order here
+        return 'OK', [" ".join(str(seq) for seq in reversed(self._match_seqs(criteria))).encode()]
+
+    def _esearch(self, name, options, criteria, uids=False):
+        seqs = self._match_uids(criteria) if uids else self._match_seqs(criteria)
+        if name == 'SORT':
+            seqs = list(reversed(seqs))
+        items = [f'COUNT {len(seqs)}']
+        if 'MAX' in options and seqs:
+            items.append(f'MAX {max(seqs)}')
+        partial = re.search(r'PARTIAL (-?\d+):(-?\d+)', options)
+        if partial:
+            low, high = int(partial.group(1)), int(partial.group(2))
+            selected = seqs[high:low - 1 if low != -1 else None] if low < 0 else seqs[low - 1:high]
+            ids = ",".join(str(seq) for seq in selected) or 'NIL'
+            items.append(f'PARTIAL ({partial.group(0)[8:]} {ids})')
+        self.untagged['ESEARCH'] = [f'(TAG "A1") {" ".join(items)}'.encode()]
+        return 'OK', [None]
+
+    def _simple_command(self, name, *args):
+        self.commands.append((name, args))
+        # imaplib sends a pre-set literal (e.g. a memoryview) with APPEND
+        if name == 'APPEND':
+            literal, self.literal = self.literal, None
+            return self.append(args[0], args[1], None, literal)
+        if name == 'SEARCH' and args[0] == 'RETURN' and 'ESEARCH' in self.capabilities:
+            return self._esearch(name, args[1], args[2:])
+        if name == 'UID' and args[:2] == ('SEARCH', 'RETURN') and 'ESEARCH' in self.capabilities:
+            return self._esearch(name, args[2], args[3:], uids=True)
+        if name == 'SORT' and args[0] == 'RETURN' and 'CONTEXT=SORT' in self.capabilities:
+            return self._esearch(name, args[1], args[4:])
+        return 'BAD', [b'unknown command']
+
+    def status(self, folder, items):
+        messages = self.folders[self._unquote(folder)]
+        uidnext = max(messages, default=0) + 1
+        return 'OK', [f'{folder} (UIDNEXT {uidnext} UIDVALIDITY {self.uidvalidity})'.encode()]
+
+    def create(self, folder):
+        self.folders.setdefault(self._unquote(folder), {})
+        return 'OK', [None]
+
+    def expunge(self):
+        messages = self.folders[self.selected]
+        for uid in [uid for uid, m in messages.items() if '\\Deleted' in m['flags']]:
+            del messages[uid]
+        return 'OK', [None]
+
+    def logout(self):
+        return 'BYE', [None]
+
+@pytest.fixture(autouse=True)
+def isolated_message_cache(tmp_path, monkeypatch):
+    # Cached messages from one test (or a real run) must not leak into another
+    monkeypatch.setenv('DATA_DIR', str(tmp_path / "data"))
+    monkeypatch.setenv('MESSAGE_CACHE_PATH', str(tmp_path / "messages.sqlite3"))
+
+@pytest.fixture
+def fake_imap():
+    return FakeIMAP()
+
+@pytest.fixture
+def raw_email():
+    return make_raw_email
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.schemas.email_schemas import EmailCategory
+from app.services.ai_client import AIClient, AIGenerationTimeout, CLASSIFY_TIER, parse_classification_batch
+from app.services.email_classifier import classify_batch, refine_ambiguous
+from app.services.model_router import FAST_TIER, RoutingStats, get_model_tiers
+
+class FakeStream:
+    def __init__(self, deltas, delay):
+        self.deltas = deltas
+        self.delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for delta in self.deltas:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5), choices=[])
+
+    async def close(self):
+        self.closed = True
+
+def make_client(deltas, delay=0.0):
+    """AIClient wired to a fake streaming completions endpoint."""
+    stream = FakeStream(deltas, delay)
+
+    async def create(**kwargs):
+        return stream
+
+    client = AIClient.__new__(AIClient)
+    client._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    client._system_prompt = None
+    client.tiers = get_model_tiers()
+    client.routing_stats = RoutingStats()
+    client.temperature = 0.7
+    client.rate_limiter = None
+    return client, stream
+
+def test_streamed_reply_records_ttft():
+    client, stream = make_client(['{"reply": "Hel', 'lo", "confidence": 0.9}'])
+    response = asyncio.run(client.generate_response("Do you have lockers?", {"subject": "Lockers"}))
+    assert response.content == "Hello"
+    assert response.routing.tier == FAST_TIER
+    assert response.routing.ttft is not None
+    assert stream.closed
+
+def test_deadline_cancels_stream():
+    client, stream = make_client(["slow"] * 10, delay=0.05)
+    with pytest.raises(AIGenerationTimeout):
+        asyncio.run(client.generate_response("Hi", {"subject": "Hi"}, deadline=0.1))
+    assert stream.closed
+    assert client.routing_stats.tiers[FAST_TIER].timeouts == 1
+
+def test_first_token_deadline_covers_stream_open_and_first_chunk(monkeypatch):
+    monkeypatch.setenv("LLM_FIRST_TOKEN_DEADLINE", "0.1")
+    client, stream = make_client(["late"], delay=0.07)
+    open_stream = client._client.chat.completions.create
+
+    async def slow_create(**kwargs):
+        await asyncio.sleep(0.07)
+        return await open_stream(**kwargs)
+
+    client._client.chat.completions.create = slow_create
+    with pytest.raises(AIGenerationTimeout):
+        asyncio.run(client.generate_response("Hi", {"subject": "Hi"}))
+    assert stream.closed
+
+def test_ambiguous_emails_share_one_classification_call():
+    client, _ = make_client([])
+    requests = []
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        content = ('{"items": [{"id": 0, "category": "spam", "confidence": 0.9, "reason": "crypto pitch"},'
+                   ' {"id": 1, "category": "legitimate", "confidence": 0.95}]}')
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=200, completion_tokens=40),
+                               choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    client._client.chat.completions.create = create
+    emails = [
+        {"subject": "Partnership", "body": "Grow your wallet 10x"},
+        {"subject": "Lockers", "body": "Do you have lockers?"},
+        {"subject": "Newsletter", "body": "Our monthly update"},
+    ]
+    classifications = asyncio.run(refine_ambiguous(emails, classify_batch(emails), client.classify_emails))
+
+    assert [c.category for c in classifications] == [
+        EmailCategory.SPAM, EmailCategory.LEGITIMATE, EmailCategory.NEWSLETTER
+    ]
+    assert classifications[0].reason == "LLM: crypto pitch"
+    assert len(requests) == 1 and "Newsletter" not in requests[0]['messages'][0]['content']
+    assert client.routing_stats.tiers[CLASSIFY_TIER].calls == 1
+
+def test_invalid_classification_items_are_dropped():
+    raw = ('{"items": [{"id": 0, "category": "phishing", "confidence": 0.9},'
+           ' {"id": 1, "category": "spam", "confidence": 7}, {"id": 5, "category": "spam", "confidence": 0.8},'
+           ' {"id": 2, "category": "requires_human", "confidence": 0.7}]}')
+    results = parse_classification_batch(raw, 3)
+    assert results[:2] == [None, None]
+    assert results[2].category == EmailCategory.REQUIRES_HUMAN
+    assert parse_classification_batch("not json", 2) == [None, None]
@@ -0,0 +1,87 @@
+from app.schemas.email_schemas import EmailCategory, EmailClassification
+from app.services import ai_client
+from app.services.backfill import BackfillJob, merge_reports, partition_uid_range, refine_batch, run_partition
+from app.services.email_classifier import classify_batch
+
+def fill_archive(fake_imap, raw_email):
+    folder = "AI_Processed/Legitimate"
+    for i in range(1, 13):
+        if i % 4 == 0:
+            raw = raw_email(f"Deal {i}", body="Our weekly newsletter. Unsubscribe here.")
+        elif i % 3 == 0:
+            raw = raw_email(f"Broken shower {i}", body="Urgent: the shower in room 4 is broken")
+        else:
+            raw = raw_email(f"Question {i}", body="Do you have lockers?")
+        fake_imap.add(folder, raw)
+    return folder
+
+def make_job(folder, tmp_path, **kwargs):
+    return BackfillJob(folder=folder, job_id="test", batch_size=5, checkpoint_dir=str(tmp_path),
+                       update_index=False, **kwargs)
+
+def test_partition_uid_range_covers_every_uid_once():
+    assert partition_uid_range(1, 10, 3) == [(1, 4), (5, 7), (8, 10)]
+    assert partition_uid_range(1, 2, 8) == [(1, 1), (2, 2)]
+    assert partition_uid_range(1, 0, 4) == []
+
+def test_dry_run_reports_without_moving(fake_imap, raw_email, tmp_path):
+    folder = fill_archive(fake_imap, raw_email)
+    stats = run_partition(None, make_job(folder, tmp_path), (1, 12), 1, mail=fake_imap)
+
+    assert stats['scanned'] == 12 and stats['done']
+    assert stats['by_category'] == {"legitimate": 6, "requires_human": 3, "newsletter": 3}
+    # Mail for staff needs the review tagging of flag_for_human_attention, so it is not bulk-moved
+    assert stats['moves'] == {"AI_Processed/Newsletter": 3}
+    assert stats['examples']["AI_Processed/Newsletter"] == ["4: Deal 4", "8: Deal 8", "12: Deal 12"]
+    assert len(fake_imap.folders[folder]) == 12
+    fetches = [args for command, args in fake_imap.commands if command == 'FETCH']
+    assert [args[0] for args in fetches] == ['1:5', '6:10', '11:12']
+
+def test_apply_moves_in_bulk_and_resumes_from_checkpoint(fake_imap, raw_email, tmp_path):
+    folder = fill_archive(fake_imap, raw_email)
+    job = make_job(folder, tmp_path, dry_run=False)
+
+    calls = []
+
+    def crash_on_second_batch(emails):
+        calls.append(len(emails))
+        if len(calls) == 2:
+            raise RuntimeError("worker died")
+        return classify_batch(emails)
+
+    try:
+        run_partition(None, job, (1, 12), 1, classifier=crash_on_second_batch, mail=fake_imap)
+    except RuntimeError:
+        pass
+    assert sorted(fake_imap.folders[folder]) == [1, 2, 3, 5, 6, 7, 8, 9, 10, 11, 12]
+
+    fake_imap.commands.clear()
+    stats = run_partition(None, job, (1, 12), 1, mail=fake_imap)
+    assert [args[0] for command, args in fake_imap.commands if command == 'FETCH'] == ['6:10', '11:12']
+    assert stats['scanned'] == 12
+    assert len(fake_imap.folders[folder]) == 9
+    assert len(fake_imap.folders["AI_Processed/Newsletter"]) == 3
+    moves = [args for command, args in fake_imap.commands if command in ('MOVE', 'COPY')]
+    assert ('8', '"AI_Processed/Newsletter"') in moves
+
+    report = merge_reports(job, [stats], elapsed=1.0)
+    assert report['complete'] and report['by_category']["requires_human"] == 3
+    assert "AI_Processed/Requires_Human" not in report['moves']
+
+def test_refine_sends_ambiguous_mail_to_the_model_in_batches(fake_imap, raw_email, tmp_path, monkeypatch):
+    folder = fill_archive(fake_imap, raw_email)
+    calls = []
+
+    class FakeAIClient:
+        async def classify_emails(self, emails):
+            calls.append([e['subject'] for e in emails])
+            return [EmailClassification(category=EmailCategory.AUTOMATED, confidence=0.9, reason="LLM")
+                    for _ in emails]
+
+    monkeypatch.setattr(ai_client, "AIClient", FakeAIClient)
+    stats = run_partition(None, make_job(folder, tmp_path), (1, 12), 1, classifier=refine_batch, mail=fake_imap)
+
+    # Only the questions the rules could not decide went to the model, one call per fetched batch
+    assert calls == [["Question 1", "Question 2", "Question 5"], ["Question 7", "Question 10"], ["Question 11"]]
+    assert stats['by_category'] == {"automated": 6, "requires_human": 3, "newsletter": 3}
+    assert stats['moves'] == {"AI_Processed/Automated": 6, "AI_Processed/Newsletter": 3}
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from app.services.batch_processor import (
+    BatchError, LocalBatchEndpoint, build_batch_line, fetch_batch_results,
+    submit_batch, wait_for_batch, write_batch_file
+)
+
+def echo_subject(body):
+    subject = body['messages'][-1]['content']
+    if "fail" in subject:
+        raise ValueError("model error")
+    return json.dumps({"reply": f"Re: {subject}", "confidence": 0.9})
+
+def test_batch_roundtrip_through_local_endpoint(tmp_path):
+    lines = [
+        build_batch_line(f"email-{i}", "gpt-4o-mini", [{"role": "user", "content": f"question {i}"}], 0.7)
+        for i in range(3)
+    ] + [build_batch_line("email-bad", "gpt-4o-mini", [{"role": "user", "content": "fail"}], 0.7)]
+    path = write_batch_file(lines, str(tmp_path / "job.jsonl"))
+    assert len(open(path).read().splitlines()) == 4
+
+    async def run():
+        endpoint = LocalBatchEndpoint(echo_subject)
+        batch_id = await submit_batch(endpoint, path)
+        batch = await wait_for_batch(endpoint, batch_id, poll_interval=0, timeout=5)
+        return await fetch_batch_results(endpoint, batch)
+
+    results = asyncio.run(run())
+    assert json.loads(results["email-2"])["reply"] == "Re: question 2"
+    assert results["email-bad"] is None
+
+def test_wait_for_batch_raises_on_failed_batch(tmp_path):
+    path = write_batch_file([build_batch_line("email-1", "m", [], 0.7)], str(tmp_path / "job.jsonl"))
+
+    async def run():
+        endpoint = LocalBatchEndpoint(echo_subject)
+        batch_id = await submit_batch(endpoint, path)
+        endpoint.stored_batches[batch_id].status = "expired"
+        await wait_for_batch(endpoint, batch_id, poll_interval=0, timeout=5)
+
+    with pytest.raises(BatchError):
+        asyncio.run(run())
+
+def test_job_files_started_together_do_not_collide(tmp_path, monkeypatch):
+    monkeypatch.setenv('BATCH_WORK_DIR', str(tmp_path))
+    first = write_batch_file([build_batch_line("email-1", "m", [], 0.7)])
+    second = write_batch_file([build_batch_line("email-2", "m", [], 0.7)])
+    assert first != second and sorted(os.listdir(tmp_path)) == sorted(map(os.path.basename, (first, second)))
+    assert json.loads(open(first).read())["custom_id"] == "email-1"
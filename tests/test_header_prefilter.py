@@ -0,0 +1,83 @@
+import asyncio
+import email
+
+import pytest
+
+from app.config.email_config import EmailSettings
+from app.schemas.email_schemas import EmailCategory, EmailClassification
+from app.services.email_client import EmailClient
+from app.services.header_prefilter import prefilter_headers
+
+def headers(raw_email, subject="Question", sender="guest@example.com", **extra):
+    return email.message_from_bytes(raw_email(subject, sender=sender, **extra))
+
+@pytest.mark.parametrize("sender,extra,category", [
+    ("guest@example.com", {"Auto_Submitted": "auto-replied"}, EmailCategory.AUTOMATED),
+    ("guest@example.com", {"Precedence": "bulk"}, EmailCategory.NEWSLETTER),
+    ("guest@example.com", {"List_Id": "<deals.example.com>"}, EmailCategory.NEWSLETTER),
+    ("guest@example.com", {"Return_Path": "<>"}, EmailCategory.AUTOMATED),
+    ("MAILER-DAEMON@mx.example.com", {}, EmailCategory.AUTOMATED),
+    ("noreply@booking.example.com", {}, EmailCategory.AUTOMATED),
+    ("info@hostellybeer.com", {}, EmailCategory.AUTOMATED),
+])
+def test_prefilter_rules(raw_email, sender, extra, category):
+    result = prefilter_headers(headers(raw_email, sender=sender, **extra), "info@hostellybeer.com")
+    assert result.category == category
+
+def test_ordinary_mail_and_replies_go_to_the_body_classifier(raw_email):
+    assert prefilter_headers(headers(raw_email, Auto_Submitted="no"), "info@hostellybeer.com") is None
+    assert prefilter_headers(headers(raw_email, "Re: Late check-in"), "info@hostellybeer.com") is None
+    assert prefilter_headers(headers(raw_email, "Out of Office: back Monday")).category == EmailCategory.AUTOMATED
+
+def test_long_agent_thread_is_sent_to_staff(raw_email, monkeypatch):
+    monkeypatch.setenv('PREFILTER_MAX_AGENT_REPLIES', '2')
+    chain = "<a@example.com> <1.2.3.mail-agent@hostellybeer.com>"
+    assert prefilter_headers(headers(raw_email, "Re: Parking", References=chain)) is None
+
+    chain += " <4.5.6.mail-agent@hostellybeer.com>"
+    result = prefilter_headers(headers(raw_email, "Re: Parking", References=chain))
+    assert result.category == EmailCategory.REQUIRES_HUMAN
+
+def test_fetch_skips_body_download_for_prefiltered_mail(fake_imap, raw_email, monkeypatch):
+    fake_imap.add("INBOX", raw_email("Is breakfast included?"))
+    fake_imap.add("INBOX", raw_email("Weekly deals", List_Unsubscribe="<mailto:unsub@example.com>"))
+    fake_imap.add("INBOX", raw_email("Automatic reply: Booking", Auto_Submitted="auto-replied"))
+    client = EmailClient(settings=EmailSettings(
+        EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@hostellybeer.com", EMAIL_PASSWORD="x"
+    ))
+
+    async def connect():
+        return fake_imap
+
+    monkeypatch.setattr(client, "connect_imap", connect)
+    emails = asyncio.run(client.fetch_latest_emails(limit=5))
+
+    by_subject = {e['subject']: e for e in emails}
+    assert by_subject["Weekly deals"]['classification']['category'] == "newsletter"
+    assert by_subject["Automatic reply: Booking"]['classification']['category'] == "automated"
+    assert not by_subject["Is breakfast included?"].get('prefiltered')
+    assert by_subject["Is breakfast included?"]['body'].strip() == "Hello"
+    # One batched header FETCH, then body fetches for the single message that needs them
+    fetched = [args[0] for command, args in fake_imap.commands if command == 'FETCH']
+    assert fetched[0] == "3,2,1" and set(fetched[1:]) == {'1'}
+
+def test_prefiltered_mail_for_staff_points_to_the_attached_original(fake_imap, raw_email, monkeypatch):
+    monkeypatch.setenv('PREFILTER_MAX_AGENT_REPLIES', '1')
+    chain = "<a@example.com> <1.2.3.mail-agent@hostellybeer.com> <4.5.6.mail-agent@hostellybeer.com>"
+    fake_imap.add("INBOX", raw_email("Re: Parking", References=chain))
+    client = EmailClient(settings=EmailSettings(
+        EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@hostellybeer.com", EMAIL_PASSWORD="x"
+    ))
+
+    async def connect():
+        return fake_imap
+
+    monkeypatch.setattr(client, "connect_imap", connect)
+    email_data, = asyncio.run(client.fetch_latest_emails(limit=5))
+    assert email_data['prefiltered'] and email_data['classification']['category'] == "requires_human"
+
+    classification = EmailClassification(**email_data['classification'])
+    assert asyncio.run(client.process_and_store_response(email_data, classification))
+    stored, = fake_imap.folders["AI_Processed/Requires_Human"].values()
+    notice = email.message_from_bytes(stored['raw'])
+    assert "See the attached original message." in notice.get_payload(0).get_payload(decode=True).decode()
@@ -0,0 +1,57 @@
+from datetime import date
+
+import pytest
+
+from app.services.imap_utils import (
+    build_search_criteria, parse_esearch_response, parse_sequence_set, search_latest
+)
+
+def make_inbox(mail, raw_email, capabilities=(), count=200):
+    mail.capabilities = capabilities
+    for i in range(1, count + 1):
+        flags = ['\\Deleted'] if i % 10 == 0 else (['\\Seen'] if i % 3 == 0 else [])
+        mail.add("INBOX", raw_email(f"Question {i}"), flags=flags)
+    mail.select("INBOX")
+    return mail
+
+@pytest.mark.parametrize("capabilities", [
+    (), ('ESEARCH',), ('ESEARCH', 'PARTIAL'), ('SORT',), ('SORT', 'CONTEXT=SORT', 'ESEARCH')
+])
+def test_search_latest_returns_newest_matches(fake_imap, raw_email, capabilities):
+    mail = make_inbox(fake_imap, raw_email, capabilities)
+    ids, total = search_latest(mail, 5, build_search_criteria(), exists=200)
+    assert ids == [b'199', b'198', b'197', b'196', b'195']
+    assert total in (None, 180)
+
+    unseen, _ = search_latest(mail, 3, build_search_criteria(unseen=True), exists=200)
+    assert unseen == [b'199', b'197', b'196']
+
+def test_plain_search_never_asks_for_the_whole_mailbox(fake_imap, raw_email):
+    mail = make_inbox(fake_imap, raw_email)
+    search_latest(mail, 5, build_search_criteria(), exists=200)
+    assert [args[0] for command, args in mail.commands if command == 'SEARCH'] == ['151:200']
+
+def test_window_grows_until_enough_matches(fake_imap, raw_email):
+    mail = make_inbox(fake_imap, raw_email)
+    for uid in range(101, 201):
+        mail.folders["INBOX"][uid]['flags'].append('\\Seen')
+    ids, _ = search_latest(mail, 2, build_search_criteria(unseen=True), exists=200)
+    assert ids == [b'98', b'97']
+    assert [args[0] for command, args in mail.commands if command == 'SEARCH'] == ['151:200', '1:150']
+
+def test_esearch_partial_is_a_single_round_trip(fake_imap, raw_email):
+    mail = make_inbox(fake_imap, raw_email, ('ESEARCH', 'PARTIAL'))
+    search_latest(mail, 5, build_search_criteria(), exists=200)
+    assert [command for command, _ in mail.commands] == ['SEARCH']
+
+def test_esearch_and_sequence_set_parsing():
+    result = parse_esearch_response([b'(TAG "A7") COUNT 42 MAX 980 PARTIAL (-1:-4 977:978,980)'])
+    assert (result['count'], result['max']) == (42, 980)
+    assert result['ids'] == [b'977', b'978', b'980']
+    assert parse_sequence_set(b'9:7,3') == [b'9', b'8', b'7', b'3']
+    assert parse_esearch_response([b'(TAG "A8") COUNT 0'])['ids'] == []
+
+def test_since_criteria_uses_imap_date_format():
+    assert build_search_criteria(unseen=True, since=date(2026, 10, 5)) == [
+        'NOT', 'DELETED', 'UNSEEN', 'SINCE', '5-Oct-2026'
+    ]
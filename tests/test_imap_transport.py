@@ -0,0 +1,120 @@
+import imaplib
+import re
+import socket
+import threading
+import zlib
+
+from app.services.imap_transport import TransportMixin
+from app.services.message_store import SpooledMessage, append_message
+
+class _TestIMAP(TransportMixin, imaplib.IMAP4):
+    pass
+
+class _Server:
+    """Just enough of an IMAP server for COMPRESS=DEFLATE and LITERAL+ APPEND."""
+
+    def __init__(self, capabilities="IMAP4rev1 LITERAL+ COMPRESS=DEFLATE"):
+        self.capabilities = capabilities
+        self.appended = []
+        self.compressed = False
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        conn, _ = self.listener.accept()
+        self.conn = conn
+        self.buffer = b""
+        self.inflater = self.deflater = None
+        self._send(f"* OK [CAPABILITY {self.capabilities}] ready\r\n".encode())
+        while True:
+            line = self._readline()
+            if not line:
+                break
+            tag, command, rest = (line.rstrip(b"\r\n").split(b" ", 2) + [b""])[:3]
+            command = command.upper()
+            if command == b"LOGIN":
+                self._send(tag + b" OK [CAPABILITY " + self.capabilities.encode() + b"] logged in\r\n")
+            elif command == b"CAPABILITY":
+                self._send(b"* CAPABILITY " + self.capabilities.encode() + b"\r\n" + tag + b" OK done\r\n")
+            elif command == b"COMPRESS":
+                self._send(tag + b" OK DEFLATE active\r\n")
+                self.inflater = zlib.decompressobj(-15)
+                self.deflater = zlib.compressobj(9, zlib.DEFLATED, -15)
+                self.compressed = True
+            elif command == b"APPEND":
+                size = int(re.search(rb"\{(\d+)\+\}$", rest).group(1))
+                self.appended.append(self._read(size))
+                self._readline()
+                self._send(tag + b" OK [APPENDUID 1 " + str(len(self.appended)).encode() + b"] done\r\n")
+            elif command == b"NOOP":
+                self._send(b"* 3 EXISTS\r\n" + b"* OK " + b"padding " * 50 + b"\r\n" + tag + b" OK noop\r\n")
+            elif command == b"LOGOUT":
+                self._send(b"* BYE\r\n" + tag + b" OK bye\r\n")
+                break
+            else:
+                self._send(tag + b" BAD unknown\r\n")
+        conn.close()
+
+    def _send(self, data):
+        if self.deflater:
+            data = self.deflater.compress(data) + self.deflater.flush(zlib.Z_SYNC_FLUSH)
+        self.conn.sendall(data)
+
+    def _fill(self):
+        chunk = self.conn.recv(65536)
+        if chunk and self.inflater:
+            chunk = self.inflater.decompress(chunk)
+        self.buffer += chunk
+        return bool(chunk)
+
+    def _readline(self):
+        while b"\n" not in self.buffer:
+            if not self._fill():
+                return b""
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+    def _read(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def test_compressed_session_with_literal_plus_append():
+    server = _Server()
+    mail = _TestIMAP("127.0.0.1", server.port)
+    mail.login("info@hostellybeer.com", "x")
+    mail.refresh_capabilities()
+    assert mail.enable_compression()
+
+    message = b"Subject: Booking\r\n\r\n" + b"We would like to book four beds.\r\n" * 200
+    typ, data = append_message(mail, "Sent", "\\Seen", SpooledMessage(data=message))
+    assert typ == "OK" and b"APPENDUID" in data[0]
+    assert mail.noop()[0] == "OK"
+    mail.logout()
+    server.thread.join(timeout=5)
+
+    assert server.compressed and server.appended == [message]
+    stats = mail.stats.summary()
+    assert stats["literal_plus_appends"] == 1 and stats["compressed_connections"] == 1
+    # Repetitive bodies compress well; wire bytes must be well under the payload
+    assert stats["ratio_out"] < 0.5 and stats["wire_bytes_out"] < stats["bytes_out"]
+    assert stats["bytes_in"] > stats["wire_bytes_in"] > 0
+
+def test_plain_session_when_not_advertised(monkeypatch):
+    monkeypatch.setenv("IMAP_LITERAL_PLUS", "false")
+    server = _Server(capabilities="IMAP4rev1 LITERAL+")
+    mail = _TestIMAP("127.0.0.1", server.port)
+    mail.login("info@hostellybeer.com", "x")
+    mail.refresh_capabilities()
+    assert not mail.enable_compression()
+    assert not mail.supports_literal_plus(10)
+    mail.logout()
+    server.thread.join(timeout=5)
+
+    stats = mail.stats.summary()
+    assert not server.compressed and stats["ratio_in"] == stats["ratio_out"] == 1.0
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time allowed for app.services, measured with -X importtime
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 750))
+
+LAZY_MODULES = ("openai", "yaml", "dotenv", "pydantic_settings")
+
+def run_import(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+
+def test_services_import_within_budget():
+    result = run_import("import app.services.email_client")
+    cumulative_us = [
+        int(line.split('|')[1])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and line.split('|')[2].strip() == "app.services.email_client"
+    ]
+    assert cumulative_us, result.stderr[-500:]
+    assert cumulative_us[0] / 1000 < IMPORT_TIME_BUDGET_MS
+
+def test_heavy_dependencies_are_not_imported_eagerly():
+    code = (
+        "import sys; import app.services.email_client as m; m.EmailClient(); "
+        f"print([name for name in {LAZY_MODULES!r} if name in sys.modules])"
+    )
+    assert run_import(code).stdout.strip() == "[]"
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from app.services.email_client import EmailClient, EmailClientError, InvalidCursorError, StaleCursorError
+
+@pytest.fixture
+def client(fake_imap, raw_email):
+    client = EmailClient()
+    client._read_mail = fake_imap
+    client._delimiter = '/'
+    for i in range(1, 8):
+        fake_imap.add("INBOX", raw_email(f"Question {i}"), flags=['\\Seen'])
+    return client
+
+def test_list_messages_pages_newest_first_by_uid(client):
+    first = asyncio.run(client.list_messages("INBOX", limit=3))
+    assert [m['uid'] for m in first['messages']] == [7, 6, 5]
+    assert first['messages'][0]['subject'] == "Question 7"
+    assert first['messages'][0]['flags'] == ['\\Seen']
+    assert first['next_cursor'] == "1:5"
+
+    second = asyncio.run(client.list_messages("INBOX", cursor=first['next_cursor'], limit=3))
+    third = asyncio.run(client.list_messages("INBOX", cursor=second['next_cursor'], limit=3))
+    assert [m['uid'] for m in second['messages']] == [4, 3, 2]
+    assert [m['uid'] for m in third['messages']] == [1]
+    assert third['next_cursor'] is None
+
+def test_stale_cursor_is_rejected(client, fake_imap):
+    fake_imap.uidvalidity = 2
+    with pytest.raises(StaleCursorError):
+        asyncio.run(client.list_messages("INBOX", cursor="1:5"))
+
+def test_iter_messages_streams_across_pages(client):
+    async def collect():
+        return [m['uid'] async for m in client.iter_messages("INBOX", limit=5, page_size=2)]
+
+    assert asyncio.run(collect()) == [7, 6, 5, 4, 3]
+
+@pytest.fixture
+def review_client(fake_imap, raw_email):
+    client = EmailClient()
+    client._read_mail = fake_imap
+    client._open_imap = lambda: fake_imap
+    client._delimiter = '/'
+    for i in range(1, 6):
+        raw = raw_email(f"Complaint {i}", X_AI_Review_Reason=f"Reason {i}")
+        fake_imap.add("AI_Processed/Requires_Human", raw, flags=['\\Flagged', '$Requires_Human'])
+    return client
+
+def test_review_queue_lists_reason_and_assignee(review_client, fake_imap):
+    asyncio.run(review_client.reassign_reviews([2, 3], "Maria"))
+    page = asyncio.run(review_client.list_review_queue(limit=10))
+    by_uid = {m['uid']: m for m in page['messages']}
+    assert by_uid[2]['reason'] == "Reason 2"
+    assert (by_uid[2]['assignee'], by_uid[1]['assignee']) == ("Maria", None)
+    assert [command for command, _ in fake_imap.commands].count('FETCH') == 2
+
+def test_reassign_replaces_previous_assignee_and_release_clears_it(review_client, fake_imap):
+    asyncio.run(review_client.reassign_reviews([1, 2], "Maria"))
+    result = asyncio.run(review_client.reassign_reviews([2, 99], "Joost"))
+    assert (result['uids'], result['not_found']) == ([2], [99])
+    queue = fake_imap.folders["AI_Processed/Requires_Human"]
+    assert '$Assigned_Maria' not in queue[2]['flags'] and '$Assigned_Joost' in queue[2]['flags']
+
+    asyncio.run(review_client.release_reviews([1, 2]))
+    assert not any(flag.startswith('$Assigned_') for uid in (1, 2) for flag in queue[uid]['flags'])
+
+@pytest.mark.parametrize("capabilities", [('MOVE',), ('UIDPLUS',), ()])
+def test_complete_moves_many_uids_in_one_batch(review_client, fake_imap, capabilities):
+    fake_imap.capabilities = capabilities
+    result = asyncio.run(review_client.complete_reviews([1, 2, 3, 4]))
+    assert result['uids'] == [1, 2, 3, 4]
+    assert list(fake_imap.folders["AI_Processed/Requires_Human"]) == [5]
+    completed = fake_imap.folders["AI_Processed/Completed"]
+    assert len(completed) == 4
+    assert all('$Human_Handled' in m['flags'] for m in completed.values())
+    moves = [args for command, args in fake_imap.commands if command in ('MOVE', 'COPY')]
+    assert moves == [('1:4', '"AI_Processed/Completed"')]
+
+def test_complete_without_uidplus_refuses_to_expunge_foreign_deletions(review_client, fake_imap):
+    queue = fake_imap.folders["AI_Processed/Requires_Human"]
+    queue[5]['flags'].append('\\Deleted')
+    with pytest.raises(EmailClientError):
+        asyncio.run(review_client.complete_reviews([1, 2]))
+    assert list(queue) == [1, 2, 3, 4, 5]
+    assert "AI_Processed/Completed" not in fake_imap.folders or not fake_imap.folders["AI_Processed/Completed"]
+
+@pytest.mark.parametrize("capabilities", [(), ('ESEARCH', 'PARTIAL')])
+def test_pages_search_only_near_the_cursor(fake_imap, raw_email, capabilities):
+    client = EmailClient()
+    client._read_mail = fake_imap
+    fake_imap.capabilities = capabilities
+    for i in range(1, 301):
+        fake_imap.add("INBOX", raw_email(f"Question {i}"))
+
+    page = asyncio.run(client.list_messages("INBOX", cursor="1:201", limit=3))
+    assert [m['uid'] for m in page['messages']] == [200, 199, 198]
+    assert page['next_cursor'] == "1:198"
+    searches = [args for command, args in fake_imap.commands if command in ('SEARCH', 'UID')]
+    if capabilities:
+        assert searches == [('SEARCH', 'RETURN', '(PARTIAL -1:-3 COUNT)', 'UID', '1:200', 'NOT', 'DELETED')]
+    else:
+        assert searches == [(None, 'UID', '151:200', 'NOT', 'DELETED')]
+
+    last = asyncio.run(client.list_messages("INBOX", cursor="1:3", limit=5))
+    assert [m['uid'] for m in last['messages']] == [2, 1] and last['next_cursor'] is None
+
+def test_malformed_cursor_is_rejected_before_any_imap_call(client, fake_imap):
+    with pytest.raises(InvalidCursorError):
+        client.parse_cursor("not-a-cursor")
+    with pytest.raises(InvalidCursorError):
+        asyncio.run(client.list_messages("INBOX", cursor="7"))
+    assert fake_imap.commands == []
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+from app.config.email_config import EmailSettings
+from app.services.batch_processor import LocalBatchEndpoint
+from app.services.email_client import EmailClient
+from app.services.lease_store import (
+    IMAP_CLAIM_KEYWORD, LeaseStore, claim_expiry_keyword, has_active_claim, hold_lease, stale_claim_keywords
+)
+
+def make_settings():
+    return EmailSettings(EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@example.com", EMAIL_PASSWORD="x")
+
+def test_lease_excludes_other_owners_until_expiry(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite3"))
+    assert store.acquire("mailbox:a", "worker-1", ttl=60)
+    assert not store.acquire("mailbox:a", "worker-2", ttl=60)
+    assert store.acquire("mailbox:a", "worker-1", ttl=60)
+
+    assert store.acquire("mailbox:b", "worker-1", ttl=0.01)
+    time.sleep(0.02)
+    assert store.acquire("mailbox:b", "worker-2", ttl=60)
+
+def test_hold_lease_releases_on_exit(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite3"))
+
+    async def run():
+        async with hold_lease(store, "mailbox:a", "worker-1", ttl=60) as first:
+            async with hold_lease(store, "mailbox:a", "worker-2", ttl=60) as second:
+                assert (first, second) == (True, False)
+        async with hold_lease(store, "mailbox:a", "worker-2", ttl=60) as third:
+            assert third
+
+    asyncio.run(run())
+
+def test_waiting_for_a_locked_lease_db_does_not_block_the_event_loop(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.sqlite3"))
+    # Another worker is in the middle of a write transaction
+    other = sqlite3.connect(store.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        ticker = asyncio.ensure_future(tick())
+        asyncio.get_running_loop().call_later(0.2, other.execute, "COMMIT")
+        async with hold_lease(store, "mailbox:a", "worker-1", ttl=60) as acquired:
+            ticker.cancel()
+            return acquired
+
+    try:
+        assert asyncio.run(run())
+    finally:
+        other.close()
+    assert len(ticks) > 5
+
+def test_workers_never_claim_the_same_uid(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEASE_DB_PATH', str(tmp_path / "leases.sqlite3"))
+    first, second = EmailClient(settings=make_settings()), EmailClient(settings=make_settings())
+    emails = [{"id": str(i), "uid": 100 + i, "uidvalidity": 7, "subject": f"Q{i}"} for i in range(4)]
+
+    claimed_first = asyncio.run(first.claim_emails([dict(e) for e in emails[:3]]))
+    claimed_second = asyncio.run(second.claim_emails([dict(e) for e in emails]))
+    assert [e['uid'] for e in claimed_first] == [100, 101, 102]
+    assert [e['uid'] for e in claimed_second] == [103]
+
+    asyncio.run(first.release_claims(claimed_first[:1]))
+    assert [e['uid'] for e in asyncio.run(second.claim_emails([dict(emails[0])]))] == [100]
+
+def test_mirrored_claims_expire_with_their_lease():
+    now = time.time()
+    live, stale = claim_expiry_keyword(now + 60), claim_expiry_keyword(now - 60)
+    assert has_active_claim([IMAP_CLAIM_KEYWORD, live], now)
+    # A crashed worker's keyword no longer pins the message
+    assert not has_active_claim([IMAP_CLAIM_KEYWORD, stale], now)
+    assert not has_active_claim([IMAP_CLAIM_KEYWORD], now)
+    assert stale_claim_keywords(["\\Seen", IMAP_CLAIM_KEYWORD, live, stale], now) == [stale]
+
+def test_backlog_frees_the_mailbox_during_the_batch(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEASE_DB_PATH', str(tmp_path / "leases.sqlite3"))
+    monkeypatch.setenv('BATCH_WORK_DIR', str(tmp_path / "batches"))
+    monkeypatch.setenv('SEARCH_INDEX_PATH', str(tmp_path / "search.sqlite3"))
+    worker, poller = EmailClient(settings=make_settings()), EmailClient(settings=make_settings())
+    emails = [{"id": "1", "uid": 100, "uidvalidity": 7, "subject": "Lockers?", "body": "Do you have lockers?",
+               "from": "guest@example.com", "date": "Mon, 19 Oct 2026 10:00:00 +0000",
+               "classification": {"category": "legitimate", "confidence": 0.9, "reason": "rules"}}]
+    seen = {}
+
+    def complete(body):
+        # While the batch runs, a regular poll gets the mailbox but not the claimed UID
+        seen['job_files'] = os.listdir(tmp_path / "batches")
+        seen['mailbox'] = poller.renew_mailbox_lease()
+        seen['claimed'] = poller.lease_store.acquire(poller._claim_key(emails[0]), poller.lease_owner, 60)
+        return '{"reply": "Yes, in every room.", "confidence": 0.9}'
+
+    async def fetch(limit):
+        return [dict(e) for e in emails]
+
+    async def noop(*args, **kwargs):
+        return True
+
+    sent = []
+
+    async def send(email_data, ai_response, is_reply):
+        sent.append(ai_response.content)
+        return True
+
+    monkeypatch.setattr(worker, "fetch_latest_emails", fetch)
+    monkeypatch.setattr(worker, "setup_folders", noop)
+    monkeypatch.setattr(worker, "classify_emails", noop)
+    monkeypatch.setattr(worker, "send_and_store_reply", send)
+    processed = asyncio.run(worker.process_backlog(batch_client=LocalBatchEndpoint(complete), poll_interval=0))
+
+    assert [e['uid'] for e in processed] == [100] and sent == ["Yes, in every room."]
+    assert seen == {"job_files": [], "mailbox": True, "claimed": False}
+    # Claims are released after filing
+    assert [e['uid'] for e in asyncio.run(poller.claim_emails([dict(e) for e in emails]))] == [100]
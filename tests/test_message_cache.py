@@ -0,0 +1,70 @@
+import asyncio
+import os
+import stat
+
+from app.config.email_config import EmailSettings
+from app.services.email_client import EmailClient
+from app.services.message_cache import MessageCache
+
+def record(uid, body="Hello"):
+    return {"uid": uid, "subject": f"Question {uid}", "body": body}
+
+def test_memory_tier_is_bounded_and_disk_tier_refills_it(tmp_path):
+    cache = MessageCache("info@example.com", path=str(tmp_path / "cache.sqlite3"), max_bytes=200)
+    for uid in range(1, 6):
+        cache.put("INBOX", 7, uid, record(uid))
+
+    assert cache._memory_bytes <= 200 and ("INBOX", 7, 1) not in cache._memory
+    assert cache.get("INBOX", 7, 1) == record(1)
+    assert cache.get("INBOX", 7, 5) == record(5)
+    assert cache.stats['disk_hits'] == 1 and cache.stats['memory_hits'] == 1
+    assert cache.get("INBOX", 7, 99) is None
+
+def test_uidvalidity_change_drops_the_folder(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = MessageCache("info@example.com", path=path)
+    cache.put("INBOX", 7, 1, record(1), raw=b"Subject: Question 1\r\n\r\nHello")
+    cache.put("Archive", 3, 1, record(1, "archived"))
+    assert cache.get_raw("INBOX", 7, 1).startswith(b"Subject")
+
+    assert cache.get("INBOX", 8, 1) is None
+    # Another worker sharing the file sees the invalidation too
+    other = MessageCache("info@example.com", path=path)
+    assert other.get("INBOX", 7, 1) is None and other.get_raw("INBOX", 7, 1) is None
+    assert other.get("Archive", 3, 1)['body'] == "archived"
+    assert MessageCache("other@example.com", path=path).get("Archive", 3, 1) is None
+
+def test_disk_tier_is_private_to_the_service_user(tmp_path, monkeypatch):
+    monkeypatch.delenv('MESSAGE_CACHE_PATH')
+    cache = MessageCache("info@example.com")
+    cache.put("INBOX", 7, 1, record(1), raw=b"Subject: Question 1\r\n\r\nHello")
+
+    assert os.path.dirname(cache.path) == str(tmp_path / "data")
+    assert stat.S_IMODE(os.stat(os.path.dirname(cache.path)).st_mode) == 0o700
+    for name in os.listdir(tmp_path / "data"):
+        assert stat.S_IMODE(os.stat(tmp_path / "data" / name).st_mode) == 0o600, name
+
+def test_second_poll_and_flagging_reuse_the_cached_message(fake_imap, raw_email, monkeypatch):
+    fake_imap.add("INBOX", raw_email("Complaint about noise", body="Room 12 was loud all night"))
+    client = EmailClient(settings=EmailSettings(
+        EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@hostellybeer.com", EMAIL_PASSWORD="x"
+    ))
+
+    async def connect():
+        return fake_imap
+
+    monkeypatch.setattr(client, "connect_imap", connect)
+    first = asyncio.run(client.fetch_latest_emails(limit=5))
+    fake_imap.commands.clear()
+    second = asyncio.run(client.fetch_latest_emails(limit=5))
+
+    assert second[0]['body'] == first[0]['body']
+    assert [args[0] for command, args in fake_imap.commands if command == 'FETCH'] == ["1"]
+
+    fake_imap.commands.clear()
+    assert asyncio.run(client.flag_for_human_attention(
+        "1", "Complaint", uid=second[0]['uid'], uidvalidity=second[0]['uidvalidity']
+    ))
+    assert not [command for command, _ in fake_imap.commands if command == 'FETCH']
+    flagged = fake_imap.folders["AI_Processed/Requires_Human"][1]['raw']
+    assert b"Room 12 was loud all night" in flagged
@@ -0,0 +1,43 @@
+import asyncio
+from email.message import EmailMessage
+
+from app.services.message_parser import ParseStage, html_to_text, parse_message, parse_message_file
+
+BOOKING_HTML = """<html><head><style>p {color: red}</style><title>Booking</title></head>
+<body><div>New reservation&nbsp;#12345</div><table><tr><td>Guest:</td><td>Jane Doe</td></tr></table>
+<script>track()</script><p>Check-in: 14:00</p></body></html>"""
+
+def make_html_email(html):
+    msg = EmailMessage()
+    msg['From'] = "noreply@booking.com"
+    msg['Subject'] = "=?utf-8?q?Nieuwe_boeking?="
+    msg.set_content(html, subtype='html')
+    return msg.as_bytes()
+
+def test_html_to_text_drops_markup_scripts_and_styles():
+    text = html_to_text(BOOKING_HTML)
+    assert "New reservation\xa0#12345" in text
+    assert "Jane Doe" in text
+    assert "Check-in: 14:00" in text
+    assert "track()" not in text and "color" not in text and "<" not in text
+
+def test_html_only_mail_gets_a_body():
+    parsed = parse_message(make_html_email(BOOKING_HTML))
+    assert parsed['subject'] == "Nieuwe boeking"
+    assert "Jane Doe" in parsed['body']
+
+def test_parse_stage_offloads_to_process_pool():
+    stage = ParseStage(max_workers=1, offload=lambda raw: True)
+    try:
+        parsed = asyncio.run(stage.parse(make_html_email(BOOKING_HTML)))
+    finally:
+        stage.shutdown()
+    assert "Check-in: 14:00" in parsed['body']
+
+def test_spooled_file_parses_from_the_mapped_view(tmp_path):
+    path = tmp_path / "spool.eml"
+    raw = make_html_email(BOOKING_HTML + "<p>" + "x" * 100000 + "</p>")
+    path.write_bytes(raw)
+    parsed = parse_message_file(str(path))
+    assert parsed == parse_message(raw)
+    assert "Jane Doe" in parsed['body']
@@ -0,0 +1,56 @@
+import email
+import os
+from email import policy
+
+from app.services.message_store import append_message, build_flagged_message, fetch_spooled
+
+def make_large_email(raw_email):
+    msg = email.message_from_bytes(raw_email("Photos of the damage"), policy=policy.default)
+    msg.add_attachment(os.urandom(300_000), maintype='image', subtype='jpeg', filename='room.jpg')
+    return msg.as_bytes(policy=policy.SMTP)
+
+def test_large_message_is_spooled_in_chunks(fake_imap, raw_email, tmp_path, monkeypatch):
+    monkeypatch.setenv('SPOOL_DIR', str(tmp_path))
+    raw = make_large_email(raw_email)
+    uid = fake_imap.add("INBOX", raw, flags=["\\Seen"])
+    fake_imap.select("INBOX")
+
+    with fetch_spooled(fake_imap, str(uid), use_uid=True, threshold=64 * 1024, chunk_size=100_000) as spooled:
+        assert spooled.is_spooled and os.path.dirname(spooled.path) == str(tmp_path)
+        assert bytes(spooled.view()) == raw
+        assert (spooled.uid, spooled.flags) == (uid, ["\\Seen"])
+        assert spooled.headers()['Subject'] == "Photos of the damage"
+        path = spooled.path
+
+    partial_fetches = [args for command, args in fake_imap.commands if '<' in args[1]]
+    assert len(partial_fetches) == len(raw) // 100_000 + 1
+    assert not os.path.exists(path)
+
+def test_small_message_stays_in_memory(fake_imap, raw_email):
+    uid = fake_imap.add("INBOX", raw_email("Late check-in?"))
+    fake_imap.select("INBOX")
+    with fetch_spooled(fake_imap, str(uid), use_uid=True) as spooled:
+        assert not spooled.is_spooled
+        assert spooled.headers()['Subject'] == "Late check-in?"
+
+def test_flagged_message_attaches_original_unchanged(fake_imap, raw_email, tmp_path, monkeypatch):
+    monkeypatch.setenv('SPOOL_DIR', str(tmp_path))
+    monkeypatch.setenv('SPOOL_THRESHOLD_BYTES', str(64 * 1024))
+    raw = make_large_email(raw_email)
+    uid = fake_imap.add("INBOX", raw)
+    fake_imap.select("INBOX")
+
+    with fetch_spooled(fake_imap, str(uid), use_uid=True) as original:
+        with build_flagged_message(original, "Reason: damage claim") as flagged:
+            assert flagged.is_spooled
+            append_message(fake_imap, '"Requires_Human"', '\\Flagged $Requires_Human', flagged)
+
+    stored = fake_imap.folders["Requires_Human"][1]
+    assert stored['flags'] == ['\\Flagged', '$Requires_Human']
+    message = email.message_from_bytes(stored['raw'])
+    assert message['Subject'] == "Photos of the damage"
+    text, attached = message.get_payload()
+    assert "damage claim" in text.get_payload(decode=True).decode()
+    assert attached.get_content_type() == 'message/rfc822'
+    assert attached.get_payload(0).as_bytes(policy=policy.SMTP) == raw
+    assert os.listdir(tmp_path) == []
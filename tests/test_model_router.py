@@ -0,0 +1,55 @@
+import asyncio
+
+from app.schemas.email_schemas import EmailCategory, EmailClassification
+from app.services.ai_client import parse_structured_reply
+from app.services.email_classifier import classify_text
+from app.services.model_router import (
+    FAST_TIER, LARGE_TIER, RoutingStats, choose_initial_tier, should_escalate
+)
+from app.services.thread_context import compact_thread, get_thread_depth
+
+def test_easy_mail_goes_to_fast_tier():
+    classification = classify_text("what time is breakfast?")
+    tier, _ = choose_initial_tier(classification, email_length=400, thread_depth=1)
+    assert tier == FAST_TIER
+
+def test_hard_mail_goes_to_large_tier():
+    unsure = EmailClassification(category=EmailCategory.LEGITIMATE, confidence=0.3)
+    assert choose_initial_tier(unsure, 400, 0)[0] == LARGE_TIER
+    assert choose_initial_tier(None, 10000, 0)[0] == LARGE_TIER
+    assert choose_initial_tier(None, 400, 10)[0] == LARGE_TIER
+
+def test_escalation_on_low_self_confidence_only():
+    assert should_escalate(0.4)
+    assert not should_escalate(0.95)
+    # A reply without a self-assessment is not generated twice
+    assert not should_escalate(None)
+
+def test_escalation_under_default_settings():
+    async def summarize(previous_summary, turns):
+        return "guest asked about parking"
+
+    stored = None
+    for i in range(1, 7):
+        stored = asyncio.run(compact_thread(f"turn {i}", stored, summarize))
+    # Three verbatim turns plus three folded into the summary
+    assert get_thread_depth(stored) == 6
+    plain = classify_text("do you have lockers?")
+    assert choose_initial_tier(plain, 400, get_thread_depth(stored))[0] == LARGE_TIER
+    assert choose_initial_tier(plain, 400, 2)[0] == FAST_TIER
+
+    unsure = EmailClassification(category=EmailCategory.LEGITIMATE, confidence=0.6, reason="LLM: vague request")
+    assert choose_initial_tier(unsure, 400, 0)[0] == LARGE_TIER
+
+def test_parse_structured_reply():
+    assert parse_structured_reply('{"reply": "Hi!", "confidence": 0.8}') == ("Hi!", 0.8)
+    assert parse_structured_reply('```json\n{"reply": "Hi!", "confidence": 2}\n```') == ("Hi!", 1.0)
+    assert parse_structured_reply("Plain text reply") == ("Plain text reply", None)
+
+def test_routing_stats_summary():
+    stats = RoutingStats()
+    stats.record_call(FAST_TIER, latency=0.5, cost=0.001, prompt_tokens=100, completion_tokens=50)
+    stats.record_call(FAST_TIER, latency=1.5, cost=0.001, prompt_tokens=100, completion_tokens=50)
+    summary = stats.summary()
+    assert summary["tiers"][FAST_TIER]["calls"] == 2
+    assert summary["tiers"][FAST_TIER]["avg_latency"] == 1.0
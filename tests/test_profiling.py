@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from app.services.profiling import Profiler
+
+def busy(n=20000):
+    return sum(i * i for i in range(n))
+
+def test_disabled_profiler_is_a_no_op():
+    profiler = Profiler()
+    profiler.enabled = False
+    with profiler.capture("message", key="1") as capture:
+        with profiler.phase("llm"):
+            busy()
+    assert capture is None and not profiler.recent
+
+def test_slow_message_is_dumped_with_phases_cpu_and_allocations(tmp_path):
+    profiler = Profiler()
+    profiler.configure(enabled=True, sample_rate=1.0, slow_ms=0, trace_memory=True)
+    profiler.dump_dir = str(tmp_path)
+
+    async def handle():
+        with profiler.capture("message", key="42 Late check-in?"):
+            with profiler.phase("classify"):
+                busy()
+            with profiler.phase("llm"):
+                await asyncio.sleep(0.01)
+                blobs = [bytearray(1024) for _ in range(200)]
+        return blobs
+
+    try:
+        asyncio.run(handle())
+    finally:
+        profiler.configure(trace_memory=False)
+
+    summary = profiler.recent[-1]
+    assert set(summary['phases_ms']) == {"classify", "llm"} and summary['phases_ms']['llm'] >= 10
+    assert any("busy" in row['function'] or "genexpr" in row['function'] for row in summary['top_cpu'])
+    assert summary['top_alloc'] and summary['top_alloc'][0]['size_kb'] > 100
+    assert os.path.exists(summary['dump'])
+    assert any(name.endswith(".prof") for name in os.listdir(tmp_path))
+
+def test_nested_capture_records_timings_without_a_second_cpu_profile():
+    profiler = Profiler()
+    profiler.configure(enabled=True, slow_ms=10_000)
+    with profiler.capture("process_latest_emails", cpu=False, dump_if_slow=False):
+        with profiler.capture("message", key="1") as outer:
+            with profiler.capture("message", key="2") as inner:
+                busy()
+    assert outer.profile is not None and inner.profile is None
+    assert [s['name'] for s in profiler.recent] == ["message", "message", "process_latest_emails"]
+    assert all(s['dump'] is None for s in profiler.recent)
+
+def test_concurrent_captures_do_not_claim_each_others_cpu():
+    profiler = Profiler()
+    profiler.configure(enabled=True, slow_ms=10_000)
+    captures = {}
+
+    async def handle(key, delay):
+        await asyncio.sleep(delay)
+        with profiler.capture("message", key=key) as capture:
+            captures[key] = capture
+            await asyncio.sleep(0.02)
+            busy()
+
+    async def run():
+        with profiler.capture("process_latest_emails", cpu=False, dump_if_slow=False):
+            await asyncio.gather(handle("1", 0), handle("2", 0.01))
+
+    asyncio.run(run())
+    # The first message holds the loop-wide CPU profile and says so; the overlapping one gets none
+    assert captures["1"].profile is not None and captures["1"].cpu_shared
+    assert captures["2"].profile is None
+    assert [s['cpu_shared'] for s in profiler.recent if s['name'] == "message"] == [True, False]
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+from app.config.email_config import EmailSettings
+from app.services.email_client import EmailClient
+from app.services.scheduler import order_emails, prioritize, run_prioritized
+
+NOW = time.time()
+
+def make_email(subject, body="", minutes_ago=0, category=None, **fields):
+    email_data = {"subject": subject, "body": body, "date": formatdate(NOW - minutes_ago * 60), **fields}
+    if category:
+        email_data['classification'] = {"category": category, "confidence": 0.9}
+    return email_data
+
+def test_priority_from_category_urgency_and_thread_state():
+    assert prioritize(make_email("Arriving tonight after 23:00"), NOW)['priority'] == "high"
+    assert prioritize(make_email("Weekly deals", category="newsletter"), NOW)['priority'] == "low"
+    assert prioritize(make_email("Group booking question"), NOW)['priority'] == "normal"
+    reply = make_email("Re: Parking", in_reply_to="<1.2.3.mail-agent@hostellybeer.com>")
+    assert prioritize(reply, NOW)['reason'] == "guest replied in an open thread"
+
+def test_mail_past_its_sla_is_promoted_one_level():
+    old_newsletter = prioritize(make_email("Deals", minutes_ago=2000, category="newsletter"), NOW)
+    assert (old_newsletter['priority'], old_newsletter['promoted']) == ("normal", True)
+    old_question = prioritize(make_email("Group booking", minutes_ago=300), NOW)
+    assert old_question['priority'] == "high"
+
+def test_order_is_priority_then_earliest_deadline():
+    emails = [
+        make_email("Deals", category="newsletter"),
+        make_email("Towels?", minutes_ago=10),
+        make_email("Arriving today", minutes_ago=5),
+        make_email("Bike rental?", minutes_ago=100),
+    ]
+    assert [e['subject'] for e in order_emails(emails, NOW)] == ["Arriving today", "Bike rental?", "Towels?", "Deals"]
+
+def test_per_priority_concurrency_limits():
+    emails = order_emails(
+        [make_email(f"Deals {i}", category="newsletter") for i in range(3)]
+        + [make_email(f"Arriving today {i}") for i in range(3)], NOW
+    )
+    running = {"high": 0, "low": 0}
+    peak = {"high": 0, "low": 0}
+    started = []
+
+    async def worker(email_data):
+        priority = email_data['schedule']['priority']
+        started.append(email_data['subject'])
+        running[priority] += 1
+        peak[priority] = max(peak[priority], running[priority])
+        await asyncio.sleep(0.01)
+        running[priority] -= 1
+        return not email_data['subject'].endswith("2")
+
+    results = asyncio.run(run_prioritized(emails, worker, limits={"high": 2, "normal": 1, "low": 1}, max_concurrency=3))
+    assert peak == {"high": 2, "low": 1}
+    assert started[:3] == ["Arriving today 0", "Arriving today 1", "Deals 0"]
+    assert sum(success for _, success in results) == 4
+
+def test_poll_picks_urgent_mail_over_newer_newsletters(fake_imap, raw_email, monkeypatch):
+    monkeypatch.setenv('SCHEDULER_ENABLED', 'true')
+    fake_imap.add("INBOX", raw_email("Is breakfast included?"))
+    fake_imap.add("INBOX", raw_email("Arriving today, can I check in at midnight?"))
+    for i in range(3):
+        fake_imap.add("INBOX", raw_email(f"Deals {i}", List_Id="<deals.example.com>"))
+    client = EmailClient(settings=EmailSettings(
+        EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@hostellybeer.com", EMAIL_PASSWORD="x"
+    ))
+
+    async def connect():
+        return fake_imap
+
+    monkeypatch.setattr(client, "connect_imap", connect)
+    emails = asyncio.run(client.fetch_latest_emails(limit=2))
+    assert [e['subject'] for e in emails] == ["Arriving today, can I check in at midnight?", "Is breakfast included?"]
+
+def test_messages_of_one_thread_are_not_processed_together(fake_imap, raw_email, monkeypatch):
+    monkeypatch.setenv('SCHEDULER_ENABLED', 'true')
+    monkeypatch.setenv('SCHEDULER_CONCURRENCY', 'normal=3')
+    fake_imap.add("INBOX", raw_email("Parking?"))
+    fake_imap.add("INBOX", raw_email("Re: Parking?"))
+    fake_imap.add("INBOX", raw_email("Towels?", sender="other@example.com"))
+    client = EmailClient(settings=EmailSettings(
+        EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@hostellybeer.com", EMAIL_PASSWORD="x"
+    ))
+    running, seen_together = set(), []
+
+    async def connect():
+        return fake_imap
+
+    async def setup_folders():
+        return True
+
+    async def process(email_data):
+        running.add(email_data['subject'])
+        seen_together.append(set(running))
+        await asyncio.sleep(0.02)
+        running.discard(email_data['subject'])
+        return True
+
+    monkeypatch.setattr(client, "connect_imap", connect)
+    monkeypatch.setattr(client, "setup_folders", setup_folders)
+    monkeypatch.setattr(client, "process_single_email", process)
+    assert len(asyncio.run(client._process_latest_emails(limit=5))) == 3
+    # Other mail still runs alongside, but one thread's messages run one after the other
+    assert any(len(together) > 1 for together in seen_together)
+    assert not any({"Parking?", "Re: Parking?"} <= together for together in seen_together)
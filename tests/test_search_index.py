@@ -0,0 +1,86 @@
+import asyncio
+import os
+import stat
+
+from app.config.email_config import EmailSettings
+from app.services.email_client import EmailClient
+from app.services.lease_store import LeaseStore
+from app.services.search_index import SearchIndex, build_match_query, normalize_subject
+
+def make_email(subject, body, sender="Anna Berg <anna@example.com>", message_id=None, references=()):
+    return {
+        "subject": subject, "from": sender, "body": body, "date": "Mon, 19 Oct 2026 10:00:00 +0000",
+        "message_id": message_id or f"<{abs(hash(subject + body))}@example.com>",
+        "references": list(references), "in_reply_to": references[-1] if references else ""
+    }
+
+def test_search_by_guest_booking_number_and_keyword(tmp_path):
+    index = SearchIndex("info@example.com", str(tmp_path / "search.sqlite3"))
+    index.add(make_email("Booking BK-2041", "Can I check in late, around 23:00?"), "legitimate", "AI_Processed/Legitimate")
+    index.add(make_email("Refund request", "Please refund booking BK-3310", sender="tom@example.com"),
+              "requires_human", "AI_Processed/Requires_Human")
+    index.add(make_email("Weekly deals", "Cheap flights!"), "newsletter", "AI_Processed/Newsletter")
+
+    assert [r['subject'] for r in index.search("BK-2041")] == ["Booking BK-2041"]
+    assert {r["subject"] for r in index.search("anna")} == {"Booking BK-2041", "Weekly deals"}
+    assert [r['subject'] for r in index.search("refund", category="requires_human")] == ["Refund request"]
+    assert "[late]" in index.search("late")[0]['snippet']
+    assert index.search('") OR body:*') == []
+
+def test_replace_thread_keeps_one_entry_per_thread(tmp_path):
+    index = SearchIndex("info@example.com", str(tmp_path / "search.sqlite3"))
+    folder = "AI_Processed/Legitimate"
+    index.add(make_email("Parking", "Is there parking?", message_id="<p1@example.com>"), "legitimate", folder,
+              replace_thread=True)
+    index.add(make_email("Re: Parking", "Thanks! And bikes?", references=["<p1@example.com>"]), "legitimate", folder,
+              body="Thanks! And bikes?\n\nIs there parking?", replace_thread=True)
+
+    assert len(index.search("parking")) == 1
+    # Replies to the agent's own messages (not indexed) still find the thread by sender and subject
+    assert index.latest_in_thread(make_email("RE: Re: parking", "", references=["<agent@example.com>"]),
+                                  folder).startswith("Thanks!")
+
+def test_threads_and_search_are_scoped_to_account_and_correspondent(tmp_path):
+    path, folder = str(tmp_path / "search.sqlite3"), "AI_Processed/Legitimate"
+    hostel, cafe = SearchIndex("info@example.com", path), SearchIndex("cafe@example.com", path)
+    hostel.add(make_email("Booking", "Two beds please", message_id="<b1@example.com>"), "legitimate", folder)
+    cafe.add(make_email("Booking", "Table for four"), "legitimate", folder)
+    hostel.add(make_email("Booking", "Dorm bed please", sender="tom@example.com"), "legitimate", folder,
+               replace_thread=True)
+
+    assert [r['subject'] for r in hostel.search("table")] == []
+    assert [r['subject'] for r in cafe.search("table")] == ["Booking"]
+    # Same subject from another guest is another thread
+    assert len(hostel.search("booking")) == 2
+    reply = make_email("Re: Booking", "", sender="someone@else.example", references=["<b1@example.com>"])
+    assert hostel.latest_in_thread(reply, folder) == "Two beds please"
+    assert cafe.latest_in_thread(reply, folder) is None
+
+def test_filed_email_is_indexed_and_used_for_thread_history(tmp_path, monkeypatch):
+    monkeypatch.setenv('SEARCH_INDEX_PATH', str(tmp_path / "search.sqlite3"))
+    client = EmailClient(settings=EmailSettings(EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@example.com", EMAIL_PASSWORD="x"))
+    email_data = make_email("Breakfast", "Is breakfast included?")
+
+    assert not client.index_filed_email(False, email_data, "legitimate")
+    assert client.search_mail("breakfast") == []
+    assert client.index_filed_email(True, email_data, "legitimate", body="thread so far", replace_thread=True)
+
+    def fail_connect():
+        raise AssertionError("thread history should come from the index")
+
+    monkeypatch.setattr(client, "_open_imap", fail_connect)
+    reply = make_email("Re: Breakfast", "", references=[email_data['message_id']])
+    assert asyncio.run(client.get_thread_history(reply)) == "thread so far"
+
+def test_query_and_subject_normalization():
+    assert build_match_query("BK-2041 late") == '"BK" "2041" "late"*'
+    assert build_match_query("!!!") == ''
+    assert normalize_subject("Re: FWD: re:  Late Check-in ") == "late check-in"
+
+def test_index_and_lease_files_are_private(tmp_path):
+    SearchIndex("info@example.com").add(make_email("Parking", "Is there parking?"), "legitimate",
+                                        "AI_Processed/Legitimate")
+    assert LeaseStore().acquire("mailbox:a", "worker-1", ttl=60)
+    assert {"leases.sqlite3", "search.sqlite3"} <= set(os.listdir(tmp_path / "data"))
+    for name in os.listdir(tmp_path / "data"):
+        assert stat.S_IMODE(os.stat(tmp_path / "data" / name).st_mode) == 0o600, name
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import pytest
+
+from app.config.email_config import EmailSettings
+from app.services.ai_client import AIResponse
+from app.services.email_classifier import classify_batch
+from app.services.email_client import EmailClient
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv('SPECULATIVE_REPLIES', 'true')
+    monkeypatch.setenv('SEARCH_INDEX_PATH', str(tmp_path / "search.sqlite3"))
+    return EmailClient(settings=EmailSettings(
+        EMAIL_HOST="mail.example.com", EMAIL_ADDRESS="info@hostellybeer.com", EMAIL_PASSWORD="x"
+    ))
+
+def wire(client, monkeypatch, history=None, final_category=None):
+    """Fake the slow steps and record the order they run in."""
+    events = []
+
+    def search_thread(email_data):
+        time.sleep(0.05)
+        events.append("lookup done")
+        return history
+
+    async def generate(email_data, classification, is_reply):
+        events.append(f"generate (thread: {'thread_history' in email_data})")
+        await asyncio.sleep(0.05)
+        return AIResponse(content="See you tonight!", confidence=0.9, requires_review=False)
+
+    async def classify(emails):
+        await asyncio.sleep(0.05)
+        emails[0]['classification'] = {"category": final_category, "confidence": 0.9, "reason": "LLM"}
+
+    async def send(email_data, ai_response, is_reply):
+        events.append(f"send {ai_response.content}")
+        return True
+
+    async def move(email_id, folder, uid=None):
+        events.append(f"move {folder}")
+        return True
+
+    monkeypatch.setattr(client, "_search_thread_history", search_thread)
+    monkeypatch.setattr(client, "_generate_reply", generate)
+    monkeypatch.setattr(client, "send_and_store_reply", send)
+    monkeypatch.setattr(client, "move_email_to_folder", move)
+    if final_category:
+        monkeypatch.setattr(client, "classify_emails", classify)
+    return events
+
+def make_email(subject, classified=True):
+    email_data = {"id": "1", "uid": 1, "subject": subject, "body": "Can I check in at 23:00?",
+                  "from": "guest@example.com", "date": "Mon, 19 Oct 2026 10:00:00 +0000"}
+    if classified:
+        email_data['classification'] = {"category": "legitimate", "confidence": 0.6, "reason": "rules"}
+    return email_data
+
+def slow_rules_classifier(client, monkeypatch, events):
+    """A classification step that takes a while and agrees with the rules' guess."""
+    async def classify(emails):
+        await asyncio.sleep(0.05)
+        events.append("classified")
+        emails[0]['classification'] = classify_batch(emails)[0].model_dump()
+
+    monkeypatch.setattr(client, "classify_emails", classify)
+
+def test_generation_overlaps_classification(client, monkeypatch):
+    events = wire(client, monkeypatch)
+    slow_rules_classifier(client, monkeypatch, events)
+    assert asyncio.run(client.process_single_email(make_email("Late arrival", classified=False)))
+    assert events == ["generate (thread: False)", "classified", "send See you tonight!"]
+    assert client.speculation_stats['used'] == 1
+
+def test_reply_with_imap_history_is_generated_once(client, monkeypatch):
+    events = wire(client, monkeypatch, history="Earlier: we offered a late check-in")
+    slow_rules_classifier(client, monkeypatch, events)
+    assert asyncio.run(client.process_single_email(make_email("Re: Late arrival", classified=False)))
+    # The thread is looked up before generating, so the only generation has its context
+    assert events == ["lookup done", "generate (thread: True)", "classified", "send See you tonight!"]
+    assert client.speculation_stats == {"used": 1, "cancelled": 0, "reissued": 0}
+
+def test_classified_reply_is_not_speculated(client, monkeypatch):
+    events = wire(client, monkeypatch, history="Earlier: we offered a late check-in")
+    assert asyncio.run(client.process_single_email(make_email("Re: Late arrival")))
+    assert events == ["lookup done", "generate (thread: True)", "send See you tonight!"]
+    assert client.speculation_stats == {"used": 0, "cancelled": 0, "reissued": 0}
+
+def test_changed_classification_cancels_generation(client, monkeypatch):
+    events = wire(client, monkeypatch, final_category="spam")
+    assert asyncio.run(client.process_single_email(make_email("Great offer", classified=False)))
+    assert events == ["generate (thread: False)", "move spam"]
+    assert client.speculation_stats['cancelled'] == 1
+
+def test_changed_confidence_reissues_generation(client, monkeypatch):
+    events = wire(client, monkeypatch, final_category="legitimate")
+    assert asyncio.run(client.process_single_email(make_email("Late arrival", classified=False)))
+    # The rules' guess routed the first generation; the LLM verdict routes the reply that is sent
+    assert events == ["generate (thread: False)", "generate (thread: False)", "send See you tonight!"]
+    assert client.speculation_stats['reissued'] == 1
+
+def test_failed_classification_cancels_generation(client, monkeypatch):
+    finished = []
+
+    async def classify(emails):
+        await asyncio.sleep(0.01)
+        raise OSError("LLM connection reset")
+
+    async def generate(email_data, classification, is_reply):
+        await asyncio.sleep(0.05)
+        finished.append(email_data['subject'])
+
+    monkeypatch.setattr(client, "classify_emails", classify)
+    monkeypatch.setattr(client, "_generate_reply", generate)
+
+    async def run():
+        with pytest.raises(OSError):
+            await client.process_single_email(make_email("Late arrival", classified=False))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert finished == []
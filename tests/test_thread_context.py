@@ -0,0 +1,50 @@
+import asyncio
+from app.services.thread_context import (
+    build_thread_context, compact_thread, estimate_tokens, join_thread, split_thread
+)
+
+def test_split_and_join_roundtrip():
+    """Stored thread text survives a split/join roundtrip."""
+    stored = join_thread(["turn 3", "turn 2", "turn 1"], "guest booked 2 beds")
+    turns, summary = split_thread(stored)
+    assert turns == ["turn 3", "turn 2", "turn 1"]
+    assert summary == "guest booked 2 beds"
+
+def test_compact_thread_summarizes_only_dropped_turns():
+    """Turns beyond the window are folded into the cached summary once."""
+    calls = []
+
+    async def summarize(previous_summary, turns):
+        calls.append((previous_summary, turns))
+        return f"{previous_summary} + {len(turns)} turns".strip()
+
+    stored = None
+    for i in range(1, 6):
+        stored = asyncio.run(compact_thread(f"turn {i}", stored, summarize, max_turns=2))
+
+    turns, summary = split_thread(stored)
+    assert turns == ["turn 5", "turn 4"]
+    assert [c[1] for c in calls] == [["turn 1"], ["turn 2"], ["turn 3"]]
+    assert summary == "+ 1 turns + 1 turns + 1 turns"
+
+def test_build_thread_context_is_bounded():
+    """Prompt size stays bounded however long the stored thread grows."""
+    turns = [f"turn {i} " + "x" * 4000 for i in range(50)]
+    stored = join_thread(turns, "s" * 10000)
+    context = build_thread_context(stored, "new question", max_turns=3, token_budget=1000)
+    assert context.endswith("New message:\nnew question")
+    assert estimate_tokens(context) < 1100
+
+def test_build_thread_context_without_history():
+    assert build_thread_context(None, "hello") == "hello"
+
+def test_failed_summary_keeps_the_most_recent_dropped_text(monkeypatch):
+    monkeypatch.setenv("THREAD_SUMMARY_TOKEN_BUDGET", "20")
+
+    async def summarize(previous_summary, turns):
+        raise RuntimeError("LLM down")
+
+    stored = join_thread(["turn 2", "turn 1 " + "old " * 50])
+    stored = asyncio.run(compact_thread("turn 3", stored, summarize, max_turns=1))
+    _, summary = split_thread(stored)
+    assert summary.endswith("turn 2") and "turn 1" not in summary
@@ -0,0 +1,174 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services import traffic_recorder
+from app.services.ai_client import AIClient
+from app.services.imap_transport import PlainIMAPConnection
+from app.services.model_router import RoutingStats, get_model_tiers
+from app.services.traffic_recorder import RecordingSMTP, TrafficRecorder, scrub_message
+from app.services.traffic_replay import ReplayLLMClient, ReplayServer, load_recording
+
+MESSAGE = (
+    b"From: Jane Doe <jane@example.com>\r\n"
+    b"Subject: Booking for 4 people\r\n"
+    b"Message-ID: <abc123@example.com>\r\n"
+    b"Content-Type: multipart/alternative; boundary=\"b1\"\r\n"
+    b"\r\n"
+    b"--b1\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"\r\n"
+    b"Hi, my phone is 0612345678.\r\n"
+    b"--b1--\r\n"
+)
+
+def imap_events(conn=1):
+    """A recorded IMAP session: greeting, login, select, one UID FETCH, logout."""
+    header = MESSAGE.split(b"\r\n\r\n")[0] + b"\r\n\r\n"
+    lines = [
+        ("open", b"", False),
+        ("s", b"* OK [CAPABILITY IMAP4rev1 LITERAL+ COMPRESS=DEFLATE] ready\r\n", False),
+        ("c", b"ABCD1 CAPABILITY\r\n", False),
+        ("s", b"* CAPABILITY IMAP4rev1 LITERAL+ COMPRESS=DEFLATE\r\n", False),
+        ("s", b"ABCD1 OK done\r\n", False),
+        ("c", b"ABCD2 LOGIN ***\r\n", False),
+        ("s", b"ABCD2 OK logged in\r\n", False),
+        ("c", b"ABCD3 SELECT \"INBOX\"\r\n", False),
+        ("s", b"* 1 EXISTS\r\n", False),
+        ("s", b"ABCD3 OK [READ-WRITE] selected\r\n", False),
+        ("c", b"ABCD4 UID FETCH 7 (BODY.PEEK[HEADER])\r\n", False),
+        ("s", b"* 1 FETCH (UID 7 BODY[HEADER] {%d}\r\n" % len(header), False),
+        ("s", header, True),
+        ("s", b")\r\n", False),
+        ("s", b"ABCD4 OK fetched\r\n", False),
+        ("c", b"ABCD5 LOGOUT\r\n", False),
+        ("s", b"* BYE\r\n", False),
+        ("s", b"ABCD5 OK bye\r\n", False),
+    ]
+    events = []
+    for index, (direction, data, literal) in enumerate(lines):
+        event = {"t": index * 0.001, "conn": conn, "proto": "imap", "dir": direction, "data": data.decode('latin-1')}
+        if literal:
+            event["literal"] = True
+        events.append(event)
+    return events
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    """Record this process's traffic to a file; returns a function that closes and loads it."""
+    monkeypatch.setenv("TRAFFIC_RECORD_PATH", str(tmp_path / "traffic.jsonl.gz"))
+    path = traffic_recorder.get_traffic_record_path()
+    traffic_recorder.get_traffic_recorder.cache_clear()
+
+    def load():
+        traffic_recorder.get_traffic_recorder().close()
+        return load_recording(path)
+
+    yield load
+    traffic_recorder.get_traffic_recorder.cache_clear()
+
+def test_every_process_records_to_its_own_file(monkeypatch):
+    pid = os.getpid()
+    monkeypatch.setenv("TRAFFIC_RECORD_PATH", "/var/tmp/traffic.jsonl.gz")
+    assert traffic_recorder.get_traffic_record_path() == f"/var/tmp/traffic.{pid}.jsonl.gz"
+    monkeypatch.setenv("TRAFFIC_RECORD_PATH", "/var/tmp/run-{pid}/traffic")
+    assert traffic_recorder.get_traffic_record_path() == f"/var/tmp/run-{pid}/traffic"
+
+def test_scrubbing_keeps_mime_skeleton_but_not_content():
+    scrubbed = scrub_message(MESSAGE)
+    assert b"jane@example.com" not in scrubbed and b"Jane" not in scrubbed
+    assert b"0612345678" not in scrubbed and b"Booking" not in scrubbed
+    assert b"boundary=\"b1\"" in scrubbed and b"\r\n--b1--\r\n" in scrubbed
+    assert b"Content-Type: text/plain; charset=utf-8\r\n" in scrubbed
+    # Addresses map to stable placeholders, so threads and senders still line up
+    assert scrub_message(b"From: jane@example.com\r\n").split(b": ")[1].strip() in scrubbed
+    assert scrubbed.count(b"\r\n") == MESSAGE.count(b"\r\n")
+
+def test_imap_session_replays_and_is_recorded_scrubbed(recording):
+    replay = ReplayServer(imap_events(), speed=0).start()
+    try:
+        mail = PlainIMAPConnection("127.0.0.1", replay.port("imap"))
+        assert "COMPRESS=DEFLATE" not in mail.capabilities
+        mail.login("info@hostellybeer.com", "secret")
+        mail.select('"INBOX"')
+        typ, data = mail.uid('FETCH', '7', '(BODY.PEEK[HEADER])')
+        mail.logout()
+    finally:
+        replay.stop()
+
+    assert typ == "OK" and b"Content-Type: multipart/alternative" in data[0][1]
+    assert replay.stats.summary() == {"connections": 1, "commands": 5, "mismatches": 0, "skipped": 0}
+    events = recording()
+    sent = "".join(event['data'] for event in events if event.get('dir') == 'c')
+    assert "LOGIN ***\r\n" in sent and "secret" not in sent and "hostellybeer" not in sent
+    assert any(event.get('literal') for event in events)
+
+    # The new recording replays in turn
+    replay = ReplayServer(events, speed=0).start()
+    try:
+        mail = PlainIMAPConnection("127.0.0.1", replay.port("imap"))
+        mail.login("info@hostellybeer.com", "secret")
+        mail.select('"INBOX"')
+        assert mail.uid('FETCH', '7', '(BODY.PEEK[HEADER])')[0] == "OK"
+        mail.logout()
+    finally:
+        replay.stop()
+    assert replay.stats.mismatches == 0
+
+def test_smtp_session_is_recorded_and_replayed(recording):
+    events = [
+        {"t": 0.0, "conn": 1, "proto": "smtp", "dir": "open"},
+        {"t": 0.0, "conn": 1, "proto": "smtp", "dir": "s", "data": "220 mail.example.com ESMTP\r\n"},
+        {"t": 0.01, "conn": 1, "proto": "smtp", "dir": "c", "data": "ehlo agent\r\n"},
+        {"t": 0.02, "conn": 1, "proto": "smtp", "dir": "s",
+         "data": "250-mail.example.com\r\n250-STARTTLS\r\n250 AUTH PLAIN LOGIN\r\n"},
+        {"t": 0.03, "conn": 1, "proto": "smtp", "dir": "c", "data": "STARTTLS\r\n"},
+        {"t": 0.04, "conn": 1, "proto": "smtp", "dir": "s", "data": "220 go ahead\r\n"},
+        {"t": 0.05, "conn": 1, "proto": "smtp", "dir": "c", "data": "AUTH PLAIN ***\r\n"},
+        {"t": 0.06, "conn": 1, "proto": "smtp", "dir": "s", "data": "235 ok\r\n"},
+        {"t": 0.07, "conn": 1, "proto": "smtp", "dir": "c", "data": "mail FROM:<x@example.invalid>\r\n"},
+        {"t": 0.08, "conn": 1, "proto": "smtp", "dir": "s", "data": "250 ok\r\n"},
+        {"t": 0.09, "conn": 1, "proto": "smtp", "dir": "c", "data": "rcpt TO:<y@example.invalid>\r\n"},
+        {"t": 0.10, "conn": 1, "proto": "smtp", "dir": "s", "data": "250 ok\r\n"},
+        {"t": 0.11, "conn": 1, "proto": "smtp", "dir": "c", "data": "data\r\n"},
+        {"t": 0.12, "conn": 1, "proto": "smtp", "dir": "s", "data": "354 go\r\n"},
+        {"t": 0.13, "conn": 1, "proto": "smtp", "dir": "c", "data": "xxx\r\n.\r\n"},
+        {"t": 0.14, "conn": 1, "proto": "smtp", "dir": "s", "data": "250 queued\r\n"},
+        {"t": 0.15, "conn": 1, "proto": "smtp", "dir": "c", "data": "quit\r\n"},
+        {"t": 0.16, "conn": 1, "proto": "smtp", "dir": "s", "data": "221 bye\r\n"},
+    ]
+    replay = ReplayServer(events, speed=0).start()
+    try:
+        with RecordingSMTP("127.0.0.1", replay.port("smtp")) as server:
+            server.login("info@hostellybeer.com", "secret")
+            assert not server.has_extn("starttls")
+            server.sendmail("info@hostellybeer.com", ["jane@example.com"], MESSAGE)
+    finally:
+        replay.stop()
+
+    # STARTTLS was recorded but not sent live
+    assert replay.stats.summary() == {"connections": 1, "commands": 7, "mismatches": 0, "skipped": 1}
+    sent = "".join(event['data'] for event in recording() if event.get('dir') == 'c')
+    assert "AUTH PLAIN ***" in sent and "Booking" not in sent and "jane@example.com" not in sent
+    assert "--b1--" in sent
+
+def test_llm_replay_uses_recorded_metadata(tmp_path, monkeypatch):
+    path = str(tmp_path / "llm.jsonl.gz")
+    recorder = TrafficRecorder(path)
+    recorder.record_llm("classify", tier="classify", model="gpt-4o-mini", latency=0.2, prompt_tokens=200,
+                        completion_tokens=40, prompt_chars=900, response_chars=120,
+                        items=[{"category": "spam", "confidence": 0.9}, None])
+    recorder.close()
+
+    client = AIClient.__new__(AIClient)
+    client._client = ReplayLLMClient.from_recording(path, speed=0)
+    client.tiers = get_model_tiers()
+    client.routing_stats = RoutingStats()
+    client.rate_limiter = None
+    results = asyncio.run(client.classify_emails([{"subject": "Wallet"}, {"subject": "Lockers?"}]))
+
+    assert results[0].category.value == "spam" and results[1] is None
+    assert client.routing_stats.tiers["classify"].prompt_tokens == 200
+    with pytest.raises(RuntimeError):
+        asyncio.run(client._client.create(model="m", messages=[], stream=True))
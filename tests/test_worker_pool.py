@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+
+from app.services import worker_pool
+from app.services.rate_limiter import SharedRateLimiter
+from app.services.worker_pool import MailboxAccount, MailboxSupervisor, load_accounts, run_worker, shard_accounts
+
+def make_accounts(n):
+    return [
+        MailboxAccount(name=f"hostel-{i}", email_host="mail.example.com", email_address=f"info{i}@example.com")
+        for i in range(n)
+    ]
+
+def test_load_accounts_reads_password_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOSTEL_A_PASSWORD', 'secret')
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps({"accounts": [{
+        "name": "hostel-a", "email_host": "mail.example.com",
+        "email_address": "a@example.com", "password_env": "HOSTEL_A_PASSWORD"
+    }]}))
+    settings = load_accounts(str(path))[0].to_settings()
+    assert settings.EMAIL_ADDRESS == "a@example.com"
+    assert settings.EMAIL_PASSWORD == "secret"
+
+def test_shard_accounts_round_robin():
+    shards = shard_accounts(make_accounts(5), 2)
+    assert [[a.name for a in shard] for shard in shards] == [
+        ["hostel-0", "hostel-2", "hostel-4"], ["hostel-1", "hostel-3"]
+    ]
+    assert len(shard_accounts(make_accounts(2), 8)) == 2
+
+def test_rate_limiter_queues_beyond_burst():
+    limiter = SharedRateLimiter(requests_per_minute=60, burst=2)
+    waits = [limiter.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.9 < waits[2] < 1.1
+    assert 1.9 < waits[3] < 2.1
+
+def test_crash_looping_worker_is_rebalanced(monkeypatch):
+    supervisor = MailboxSupervisor(make_accounts(6), n_workers=3, max_restarts=1)
+    started = []
+    monkeypatch.setattr(supervisor, "_start_worker", lambda slot, accounts: started.append(slot))
+    monkeypatch.setattr(supervisor, "_stop_worker", lambda slot: None)
+
+    supervisor._handle_dead_worker(0)
+    assert started == [0]
+    assert len(supervisor.assignments) == 3
+
+    supervisor._handle_dead_worker(0)
+    assert 0 not in supervisor.assignments
+    assert sorted(len(accounts) for accounts in supervisor.assignments.values()) == [3, 3]
+    assert sorted(started[1:]) == [1, 2]
+
+def test_blocking_mailbox_does_not_stall_the_rest_of_its_shard(monkeypatch):
+    polls = []
+
+    async def run_mailbox(account, rate_limiter, stop_event):
+        # Stands in for a poll whose imaplib calls block the thread
+        time.sleep(0.2)
+        polls.append(account.name)
+
+    monkeypatch.setattr(worker_pool, "run_mailbox", run_mailbox)
+    start = time.perf_counter()
+    run_worker(0, make_accounts(3), SharedRateLimiter(None), threading.Event())
+    assert sorted(polls) == ["hostel-0", "hostel-1", "hostel-2"]
+    assert time.perf_counter() - start < 0.5